@@ -1,9 +1,12 @@
 from ThenWhatTree.lib.evaluate import evaluate
-from ThenWhatTree.lib.extract import extract
+from ThenWhatTree.lib.evaluate_async import evaluate_async
+from ThenWhatTree.lib.evaluate_many import evaluate_many
+from ThenWhatTree.lib.evaluate_incremental import evaluate_incremental
+from ThenWhatTree.lib.extract import extract, write_extract
 from ThenWhatTree.lib.twt_node.ThenWhatTreeNode import ThenWhatTreeNode
 from ThenWhatTree.lib.create_tree import _get_file_type, _write_file_to_directory
 from ThenWhatTree.lib.convert_to_xml.csv_to_xml import csv_to_xml
 from ThenWhatTree.lib.convert_to_xml.txt_to_xml import text_to_xml
 from ThenWhatTree.lib.create_tree import xml_to_tree
 
-__all__ = [evaluate, extract, ThenWhatTreeNode, _get_file_type, _write_file_to_directory, csv_to_xml, text_to_xml, xml_to_tree]
\ No newline at end of file
+__all__ = [evaluate, evaluate_async, evaluate_many, evaluate_incremental, extract, write_extract, ThenWhatTreeNode, _get_file_type, _write_file_to_directory, csv_to_xml, text_to_xml, xml_to_tree]
\ No newline at end of file
@@ -8,6 +8,7 @@
 
 # Import built in modules
 import argparse
+import asyncio
 import sys
 import os
 
@@ -16,7 +17,15 @@ import os
 # Import local modules
 from ThenWhatTree import _get_file_type
 from ThenWhatTree import evaluate
-from ThenWhatTree import extract
+from ThenWhatTree import evaluate_async
+from ThenWhatTree import evaluate_many
+from ThenWhatTree import evaluate_incremental
+from ThenWhatTree import write_extract
+from ThenWhatTree.lib.compiled_tree import write_evaluated_tree
+from ThenWhatTree.lib.node_records import NdjsonWriter, write_json, write_ndjson
+from ThenWhatTree.lib.outcome_cache import OutcomeCache
+from ThenWhatTree.lib.profiler import get_profile_report, write_collapsed_stacks
+from ThenWhatTree.lib.result_store import ResultStore
 
 # Module authorship metadata
 __author__ = "Erik W Berg"
@@ -30,6 +39,10 @@ __status__ = "Production"  # Prototype, Development, Production
 
 # Code starts here
 
+TEXT_FORMAT = 'text'
+NDJSON_FORMAT = 'ndjson'
+JSON_FORMAT = 'json'
+
 
 def parse_args():
     '''
@@ -39,6 +52,40 @@ def parse_args():
     '''
     parser = argparse.ArgumentParser()
     parser.add_argument('--xml', help='path to xml file defining the decision tree', nargs='?', type=str)
+    parser.add_argument('--workers', help='number of worker threads evaluating nodes (default: number of CPUs)',
+                        nargs='?', type=int)
+    parser.add_argument('--pipelined', help='evaluate the subnodes of a node as soon as it is true',
+                        action='store_true')
+    parser.add_argument('--async', help='evaluate the tree on an asyncio event loop', action='store_true',
+                        dest='use_async')
+    parser.add_argument('--backend', help='evaluate nodes in worker threads or worker processes (default: thread)',
+                        choices=['thread', 'process'], default='thread')
+    parser.add_argument('--inputs-dir', help='evaluate the tree once for every file in this directory; the path of '
+                                             'the file is passed to the root node as the branch element \'input\'',
+                        nargs='?', type=str, dest='inputs_dir')
+    parser.add_argument('--results-dir', help='with --inputs-dir, save the results of every input in a columnar '
+                                              'result store in this directory and print a summary per node',
+                        nargs='?', type=str, dest='results_dir')
+    parser.add_argument('--outcome-cache', help='sqlite file caching node outcomes across runs; nodes are not '
+                                                'evaluated again while their module, fields, branch elements and '
+                                                'input files are unchanged', nargs='?', type=str, dest='outcome_cache')
+    parser.add_argument('--incremental', help='evaluated xml file of a previous run; only the nodes affected by the '
+                                              'edited node modules are evaluated again and the file is updated',
+                        nargs='?', type=str)
+    parser.add_argument('--changed-modules', help='with --incremental, comma separated names of the edited node '
+                                                  'modules (default: detect them by hash)', nargs='?', type=str,
+                        dest='changed_modules')
+    parser.add_argument('--deadline', help='seconds the evaluation may take; nodes still running are recorded as '
+                                           '\'timeout\' and the partial results are printed', nargs='?', type=float)
+    parser.add_argument('--profile', help='profile every node, print the hot spots and write the call stacks in the '
+                                          'collapsed format of flame-graph tools to this file (default: '
+                                          'profile.folded)', nargs='?', type=str, const='profile.folded')
+    parser.add_argument('--metrics', help='print the wall time, CPU time, queue wait, import time and allocated '
+                                          'memory (when tracemalloc is tracing) of every node', action='store_true')
+    parser.add_argument('--format', help='text: the annotated tree and the node output (default); ndjson: one JSON '
+                                         'record per node, without the hint index, written as soon as the node is '
+                                         'evaluated; json: a JSON array of the records once the tree is evaluated',
+                        choices=[TEXT_FORMAT, NDJSON_FORMAT, JSON_FORMAT], default=TEXT_FORMAT)
     args = parser.parse_args()
     check_cmd_line_args(args)
     check_xml_file_type(args)
@@ -52,6 +99,35 @@ def check_cmd_line_args(args):
     '''
     if not args.xml:
         raise Exception('--xml switch must be populated')
+    if args.inputs_dir and not os.path.isdir(args.inputs_dir):
+        raise Exception(args.inputs_dir + ' is not a directory')
+    if args.results_dir and not args.inputs_dir:
+        raise Exception('--results-dir requires --inputs-dir')
+    if (args.deadline is not None or args.profile) and (args.inputs_dir or args.incremental):
+        raise Exception('--deadline and --profile cannot be combined with --inputs-dir or --incremental')
+    if args.format != TEXT_FORMAT and (args.inputs_dir or args.metrics or args.profile):
+        raise Exception('--format ' + args.format + ' cannot be combined with --inputs-dir, --metrics or --profile')
+    if args.changed_modules and not args.incremental:
+        raise Exception('--changed-modules requires --incremental')
+    if args.incremental and (args.inputs_dir or args.use_async or args.pipelined):
+        raise Exception('--incremental cannot be combined with --inputs-dir, --async or --pipelined')
+
+
+def write_tree_object(tree_object, args):
+    '''
+    Write the evaluated tree to stdout in the format requested on the cmd line
+
+    :param tree_object: ElementTree object
+    :param args:
+    :return: none
+    '''
+    if args.format == JSON_FORMAT:
+        write_json(tree_object.getroot(), sys.stdout)
+    elif args.format == NDJSON_FORMAT:
+        write_ndjson(tree_object.getroot(), sys.stdout)
+    else:
+        write_extract(tree_object.getroot(), sys.stdout, metrics=args.metrics)
+        print()
 
 
 def check_xml_file_type(args):
@@ -69,5 +145,42 @@ if __name__ == '__main__':
 
     args = parse_args()
     os.environ['PYTHONDONTWRITEBYTECODE'] = 'TRUE'
-    tree_object = evaluate(args.xml)
-    print(extract(tree_object.getroot()))
+    outcome_cache = OutcomeCache(args.outcome_cache) if args.outcome_cache else None
+    if args.inputs_dir:
+        input_files = [os.path.join(args.inputs_dir, file_name) for file_name in sorted(os.listdir(args.inputs_dir))]
+        if args.results_dir:
+            result_store = ResultStore()
+            for _ in evaluate_many(args.xml, input_files, num_workers=args.workers, backend=args.backend,
+                                   result_store=result_store, outcome_cache=outcome_cache):
+                pass
+            result_store.save(args.results_dir)
+            print(result_store.summary())
+        else:
+            for input_file, tree_object in evaluate_many(args.xml, input_files, num_workers=args.workers,
+                                                         backend=args.backend, outcome_cache=outcome_cache):
+                print(input_file + ':')
+                write_extract(tree_object.getroot(), sys.stdout, metrics=args.metrics)
+                print()
+    elif args.incremental:
+        changed_modules = args.changed_modules.split(',') if args.changed_modules else None
+        tree_object = evaluate_incremental(args.xml, args.incremental, changed_modules, num_workers=args.workers,
+                                           backend=args.backend, outcome_cache=outcome_cache)
+        write_evaluated_tree(tree_object, args.incremental)
+        write_tree_object(tree_object, args)
+    else:
+        # ndjson records are written while the tree is evaluated
+        on_node_evaluated = NdjsonWriter(sys.stdout) if args.format == NDJSON_FORMAT else None
+        if args.use_async:
+            tree_object = asyncio.run(evaluate_async(args.xml, num_workers=args.workers, backend=args.backend,
+                                                    outcome_cache=outcome_cache, deadline=args.deadline,
+                                                    profile=bool(args.profile),
+                                                    on_node_evaluated=on_node_evaluated))
+        else:
+            tree_object = evaluate(args.xml, num_workers=args.workers, pipelined=args.pipelined, backend=args.backend,
+                                   outcome_cache=outcome_cache, deadline=args.deadline, profile=bool(args.profile),
+                                   on_node_evaluated=on_node_evaluated)
+        if args.format != NDJSON_FORMAT:
+            write_tree_object(tree_object, args)
+        if args.profile:
+            print(get_profile_report(tree_object.getroot()))
+            write_collapsed_stacks(tree_object.getroot(), args.profile)
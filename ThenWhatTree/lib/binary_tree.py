@@ -0,0 +1,374 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Compact binary file format for evaluated trees.  Tags, names and the other field texts are
+interned in a string table, the status, hint index and times of the nodes are packed arrays,
+and the outputs, exceptions and tracebacks are length-prefixed blobs that are only read from
+the memory mapped file when they are asked for.
+"""
+
+# Import built in modules
+import itertools
+import math
+import mmap
+import struct
+import sys
+from array import array
+# noinspection PyPep8Naming
+from xml.etree import ElementTree as ET
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.evaluate import NODE_TIMEOUT
+from ThenWhatTree.lib.exceptions import BinaryTreeFormatError
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+MAGIC = b'TWTB'
+FORMAT_VERSION = 1
+# magic, format version, number of nodes, number of strings
+_HEADER = struct.Struct('<4sHII')
+# byte length of a section
+_SECTION_LENGTH = struct.Struct('<Q')
+
+STATUS_NOT_EVALUATED = 0
+STATUS_FALSE = 1
+STATUS_TRUE = 2
+STATUS_TIMEOUT = 3
+# any other 'node_is_true' text; it is kept with the fields of the node
+STATUS_OTHER = 4
+_STATUS_CODES = {'false': STATUS_FALSE, 'true': STATUS_TRUE, NODE_TIMEOUT: STATUS_TIMEOUT}
+_STATUS_TEXTS = {code: text for text, code in _STATUS_CODES.items()}
+
+# Fields stored as blobs, read when they are asked for
+BLOB_TAGS = ('output', 'exception', 'traceback')
+# NodeMetricsData attributes stored as packed single precision arrays; NaN stands for None
+TIME_ATTRIBUTES = ('wall_time', 'cpu_time', 'queue_wait_time', 'import_time')
+# Fields that are not stored as text: the packed columns above and the profiler data
+_PACKED_TAGS = frozenset(('node_is_true', 'index', 'metrics', 'profile') + BLOB_TAGS)
+_NO_INDEX = -1
+# blob length of a node without the field
+_NO_BLOB = 0xFFFFFFFF
+
+
+def write_binary_tree(tree_object, binary_file, branch_serializer=str):
+    """
+    Write an evaluated tree to a binary file.  As with write_evaluated_tree, branch element
+    values are converted with branch_serializer and other non-string text with str.  The
+    metrics of a node keep only their times and the profile of a node is not written.
+
+    :param tree_object: ElementTree object returned by evaluate
+    :param binary_file: path of the file to write
+    :param branch_serializer: callable converting a branch element value to a string
+    :return: None
+    """
+    strings = _StringTable()
+    parents = array('i')
+    statuses = array('b')
+    indexes = array('i')
+    times = {attribute: array('f') for attribute in TIME_ATTRIBUTES}
+    field_offsets, field_tags, field_values = array('I', [0]), array('I'), array('I')
+    branch_offsets, branch_keys, branch_values = array('I', [0]), array('I'), array('I')
+    blob_lengths = {tag: array('I') for tag in BLOB_TAGS}
+    blobs = {tag: [] for tag in BLOB_TAGS}
+
+    stack = [(tree_object.getroot(), -1)]
+    while stack:
+        tree_element, parent = stack.pop()
+        position = len(parents)
+        parents.append(parent)
+        fields, branch, subnodes = _get_node_contents(tree_element)
+        node_is_true = fields.get('node_is_true')
+        status = STATUS_NOT_EVALUATED if node_is_true is None else _STATUS_CODES.get(node_is_true, STATUS_OTHER)
+        statuses.append(status)
+        index = fields.get('index')
+        indexes.append(_NO_INDEX if index is None else int(index))
+        metrics = fields.get('metrics')
+        for attribute in TIME_ATTRIBUTES:
+            value = getattr(metrics, attribute) if isinstance(metrics, NodeMetricsData) else None
+            times[attribute].append(math.nan if value is None else value)
+        for tag, text in fields.items():
+            if tag not in _PACKED_TAGS or (tag == 'node_is_true' and status == STATUS_OTHER):
+                field_tags.append(strings.get_id(tag))
+                field_values.append(strings.get_id(None if text is None else str(text)))
+        field_offsets.append(len(field_tags))
+        for key, value in branch:
+            branch_keys.append(strings.get_id(key))
+            branch_values.append(strings.get_id(value if isinstance(value, str) else branch_serializer(value)))
+        branch_offsets.append(len(branch_keys))
+        for tag in BLOB_TAGS:
+            text = fields.get(tag)
+            if text is None:
+                blob_lengths[tag].append(_NO_BLOB)
+                continue
+            blob = str(text).encode('utf-8')
+            blob_lengths[tag].append(len(blob))
+            blobs[tag].append(blob)
+        stack.extend((subnode, position) for subnode in reversed(subnodes))
+
+    string_offsets, string_data = strings.encode()
+    sections = [string_offsets, string_data, parents, statuses, indexes]
+    sections += [times[attribute] for attribute in TIME_ATTRIBUTES]
+    sections += [field_offsets, field_tags, field_values, branch_offsets, branch_keys, branch_values]
+    sections += [blob_lengths[tag] for tag in BLOB_TAGS]
+    with open(binary_file, 'wb') as output_file:
+        output_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(parents), len(strings.strings)))
+        for section in sections:
+            section_bytes = _get_little_endian_bytes(section)
+            output_file.write(_SECTION_LENGTH.pack(len(section_bytes)))
+            output_file.write(section_bytes)
+        for tag in BLOB_TAGS:
+            output_file.write(_SECTION_LENGTH.pack(sum(len(blob) for blob in blobs[tag])))
+            output_file.writelines(blobs[tag])
+
+
+def _get_node_contents(tree_element):
+    """
+    :param tree_element: 'node' Element object from the ElementTree package
+    :return: dict of tag -> text of the first subelement with the tag, list of (key, value) of
+             the 'branch' subelements and list of the 'node' subelements
+    """
+    fields = dict(tree_element.attrib)
+    branch = []
+    subnodes = []
+    for subelement in tree_element:
+        if subelement.tag == 'node':
+            subnodes.append(subelement)
+        elif subelement.tag == 'branch':
+            branch.extend(subelement.items())
+        elif subelement.tag not in fields:
+            fields[subelement.tag] = subelement.text
+    return fields, branch, subnodes
+
+
+class _StringTable(object):
+    """
+    Interned strings of a binary tree; None is stored as the id 0
+    """
+
+    def __init__(self):
+        self.strings = [None]
+        self._ids = {None: 0}
+
+    def get_id(self, text):
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self._ids[text] = string_id
+            self.strings.append(text)
+        return string_id
+
+    def encode(self):
+        """
+        :return: array of the byte offsets of the strings followed by the end offset, utf-8 bytes
+        """
+        offsets = array('I', [0, 0])
+        encoded_strings = []
+        size = 0
+        for text in self.strings[1:]:
+            encoded = text.encode('utf-8')
+            encoded_strings.append(encoded)
+            size += len(encoded)
+            offsets.append(size)
+        return offsets, b''.join(encoded_strings)
+
+
+def _get_little_endian_bytes(section):
+    if isinstance(section, bytes):
+        return section
+    if sys.byteorder == 'big':
+        section = array(section.typecode, section)
+        section.byteswap()
+    return section.tobytes()
+
+
+def read_binary_tree(binary_file):
+    """
+    :param binary_file: path of a file written by write_binary_tree
+    :return: BinaryTree
+    """
+    return BinaryTree(binary_file)
+
+
+class BinaryTree(object):
+    """
+    Evaluated tree loaded from a binary file.  Nodes are identified by their position in
+    depth-first order; the root is at position 0.  The strings and packed arrays are read when
+    the file is opened, the outputs, exceptions and tracebacks when they are asked for.
+
+    parents:  array of the position of the parent of every node, -1 for the root
+    statuses: array of STATUS_* codes
+    indexes:  array of hint indexes, -1 for the nodes without one
+    times:    dict of NodeMetricsData attribute -> array of seconds, NaN if not measured
+    """
+
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+        with open(binary_file, 'rb') as input_file:
+            try:
+                self._mmap = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as inst:
+                raise BinaryTreeFormatError(binary_file, str(inst))
+        try:
+            self._load()
+        except (struct.error, ValueError, UnicodeDecodeError) as inst:
+            self.close()
+            raise BinaryTreeFormatError(binary_file, str(inst))
+
+    def _load(self):
+        magic, version, num_nodes, num_strings = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('unknown magic number or format version')
+        self._position = _HEADER.size
+        string_offsets = self._read_array('I')
+        string_data = self._read_section()
+        self.strings = [None] + [string_data[string_offsets[string_id]:string_offsets[string_id + 1]].decode('utf-8')
+                                 for string_id in range(1, num_strings)]
+        self.parents = self._read_array('i')
+        self.statuses = self._read_array('b')
+        self.indexes = self._read_array('i')
+        self.times = {attribute: self._read_array('f') for attribute in TIME_ATTRIBUTES}
+        self._field_offsets, self._field_tags, self._field_values = [self._read_array('I') for _ in range(3)]
+        self._branch_offsets, self._branch_keys, self._branch_values = [self._read_array('I') for _ in range(3)]
+        self._blob_lengths = {tag: self._read_array('I') for tag in BLOB_TAGS}
+        self._blob_positions = {tag: self._skip_section() for tag in BLOB_TAGS}
+        # tag -> array of the offsets of the blobs, computed when a blob is first asked for
+        self._blob_offsets = {}
+        if len(self.parents) != num_nodes:
+            raise ValueError('truncated file')
+
+    def _skip_section(self):
+        """
+        :return: file position of the data of the section at the current position
+        """
+        length = _SECTION_LENGTH.unpack_from(self._mmap, self._position)[0]
+        start = self._position + _SECTION_LENGTH.size
+        self._position = start + length
+        if self._position > len(self._mmap):
+            raise ValueError('truncated file')
+        return start
+
+    def _read_section(self):
+        start = self._skip_section()
+        return self._mmap[start:self._position]
+
+    def _read_array(self, typecode):
+        section = array(typecode)
+        section.frombytes(self._read_section())
+        if sys.byteorder == 'big':
+            section.byteswap()
+        return section
+
+    def __len__(self):
+        return len(self.parents)
+
+    def get_fields(self, position):
+        """
+        :param position: position of the node
+        :return: dict of tag -> text of the fields of the node, with 'node_is_true' and 'index'
+                 but without the blobs
+        """
+        fields = {self.strings[self._field_tags[field]]: self.strings[self._field_values[field]]
+                  for field in range(self._field_offsets[position], self._field_offsets[position + 1])}
+        status = self.statuses[position]
+        if status in _STATUS_TEXTS:
+            fields['node_is_true'] = _STATUS_TEXTS[status]
+        if self.indexes[position] != _NO_INDEX:
+            fields['index'] = self.indexes[position]
+        return fields
+
+    def get_name(self, position):
+        return self.get_fields(position).get('name')
+
+    def get_branch(self, position):
+        """
+        :param position: position of the node
+        :return: list of (key, value) of the branch elements set by the node
+        """
+        return [(self.strings[self._branch_keys[branch]], self.strings[self._branch_values[branch]])
+                for branch in range(self._branch_offsets[position], self._branch_offsets[position + 1])]
+
+    def get_blob(self, position, tag):
+        """
+        :param position: position of the node
+        :param tag: one of BLOB_TAGS
+        :return: text of the field or None if the node has none
+        """
+        length = self._blob_lengths[tag][position]
+        if length == _NO_BLOB:
+            return None
+        if tag not in self._blob_offsets:
+            blob_lengths = (0 if blob_length == _NO_BLOB else blob_length for blob_length in self._blob_lengths[tag])
+            self._blob_offsets[tag] = array('q', itertools.accumulate(
+                itertools.chain([self._blob_positions[tag]], blob_lengths)))
+        start = self._blob_offsets[tag][position]
+        return self._mmap[start:start + length].decode('utf-8')
+
+    def get_output(self, position):
+        return self.get_blob(position, 'output')
+
+    def get_exception(self, position):
+        return self.get_blob(position, 'exception')
+
+    def get_metrics(self, position):
+        """
+        :param position: position of the node
+        :return: NodeMetricsData with the times of the node or None if it was not evaluated
+        """
+        times = {attribute: self.times[attribute][position] for attribute in TIME_ATTRIBUTES}
+        if all(math.isnan(seconds) for seconds in times.values()):
+            return None
+        metrics = NodeMetricsData()
+        for attribute, seconds in times.items():
+            setattr(metrics, attribute, None if math.isnan(seconds) else seconds)
+        return metrics
+
+    def to_element_tree(self):
+        """
+        Materialise the tree as an ElementTree object that can be passed to extract.  The fields
+        of every node come first, then 'node_is_true', 'index', the blobs and the 'metrics', then
+        the 'branch' subelements and the subnodes.
+
+        :return: ElementTree object
+        """
+        elements = []
+        for position, parent in enumerate(self.parents):
+            if parent == -1:
+                element = ET.Element('node')
+            else:
+                element = ET.SubElement(elements[parent], 'node')
+            for tag, text in self.get_fields(position).items():
+                ET.SubElement(element, tag).text = text
+            for tag in BLOB_TAGS:
+                text = self.get_blob(position, tag)
+                if text is not None:
+                    ET.SubElement(element, tag).text = text
+            metrics = self.get_metrics(position)
+            if metrics is not None:
+                ET.SubElement(element, 'metrics').text = metrics
+            for key, value in self.get_branch(position):
+                ET.SubElement(element, 'branch').set(key, value)
+            elements.append(element)
+        return ET.ElementTree(elements[0])
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
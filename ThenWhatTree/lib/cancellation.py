@@ -0,0 +1,114 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Cooperative cancellation of nodes that run past their timeout or the deadline of the run"""
+
+# Import built in modules
+import threading
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+# Longest time a wait goes without checking a cancelled parent token
+POLL_INTERVAL = 0.1
+
+
+class CancellationToken(object):
+    """
+    Cancelled explicitly with cancel(), when its deadline passes or when its parent is
+    cancelled.  A node token is the child of the token of the run, so a node sees the
+    remaining budget of the run as well as its own.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        """
+        :param timeout: seconds from now until the token expires, None for no deadline
+        :param parent: CancellationToken or None
+        """
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.parent is not None and self.parent.cancelled
+
+    def get_remaining_time(self):
+        """
+        :return: seconds until the earliest deadline of the token and its parents, 0 once
+                 cancelled, None if there is no deadline
+        """
+        if self.cancelled:
+            return 0.0
+        remaining_times = []
+        token = self
+        while token is not None:
+            if token.deadline is not None:
+                remaining_times.append(max(token.deadline - time.monotonic(), 0.0))
+            token = token.parent
+        return min(remaining_times) if remaining_times else None
+
+    def wait(self, timeout=None):
+        """
+        Sleep until the token is cancelled or timeout seconds have passed
+
+        :param timeout: seconds, None to wait until the token is cancelled
+        :return: bool; True if the token was cancelled
+        """
+        end_time = None if timeout is None else time.monotonic() + timeout
+        while not self.cancelled:
+            wait_time = _get_wait_time(self.get_remaining_time(), end_time)
+            if wait_time <= 0:
+                break
+            self._event.wait(wait_time)
+        return self.cancelled
+
+
+def wait_for_event(event, token):
+    """
+    Wait until the event is set or the token is cancelled
+
+    :param event: threading.Event
+    :param token: CancellationToken
+    :return: bool; True if the event was set
+    """
+    while not event.is_set():
+        if token.cancelled:
+            return event.is_set()
+        event.wait(_get_wait_time(token.get_remaining_time(), None))
+    return True
+
+
+def _get_wait_time(remaining_time, end_time):
+    """
+    :param remaining_time: seconds until the token expires or None
+    :param end_time: time.monotonic() when the wait ends or None
+    :return: seconds to sleep before checking the token again
+    """
+    wait_time = POLL_INTERVAL
+    if remaining_time is not None:
+        wait_time = min(wait_time, remaining_time)
+    if end_time is not None:
+        wait_time = min(wait_time, end_time - time.monotonic())
+    return wait_time
@@ -0,0 +1,307 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Compact in-memory representation of a decision tree used during evaluation.  The XML is
+compiled once into a CompiledTree and only materialised back into an ElementTree object
+when the evaluation is done.
+"""
+
+# Import built in modules
+import copy
+import weakref
+from array import array
+# noinspection PyPep8Naming
+from xml.etree import ElementTree as ET
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.fact_cache import FactCache
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+_ELEMENT_BRANCH_CONTEXTS = weakref.WeakKeyDictionary()
+
+
+class BranchContext(object):
+    """
+    Copy-on-write store of the branch elements of a node.  A node only stores the branch
+    elements it sets itself; the branch elements of its ancestors are reached through the
+    parent pointer, which is set when the node is scheduled for evaluation.
+    """
+
+    __slots__ = ('parent', 'values')
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.values = {}
+
+    def __getitem__(self, key):
+        context = self
+        while context is not None:
+            if key in context.values:
+                return context.values[key]
+            context = context.parent
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def update(self, values):
+        self.values.update(values)
+
+    def items(self):
+        """
+        :return: list of (key, value) of the effective branch elements, own values overriding inherited ones
+        """
+        chain = []
+        context = self
+        while context is not None:
+            chain.append(context.values)
+            context = context.parent
+        effective_values = {}
+        for values in reversed(chain):
+            effective_values.update(values)
+        return list(effective_values.items())
+
+
+def get_element_branch_context(tree_element):
+    """
+    :param tree_element: Element object materialised by CompiledTree.to_element_tree
+    :return: BranchContext of the CompiledNode the element was materialised from, or None
+    """
+    return _ELEMENT_BRANCH_CONTEXTS.get(tree_element)
+
+
+class CompiledNode(object):
+    """
+    One node of a CompiledTree.
+
+    fields:   dict of the node's subelements and attributes, tag -> text
+    branch:   BranchContext of the node's branch elements, key -> value
+    children: array of the indexes of the subnodes in tree.nodes
+    parent:   index of the parent node in tree.nodes, -1 for the root
+    """
+
+    __slots__ = ('tree', 'index', 'parent', 'children', 'fields', 'branch')
+
+    def __init__(self, tree, index, parent, fields):
+        self.tree = tree
+        self.index = index
+        self.parent = parent
+        self.children = array('i')
+        self.fields = fields
+        self.branch = BranchContext()
+
+    @property
+    def name(self):
+        return self.fields.get('name')
+
+    def copy_detached(self):
+        """
+        Copy of the node for an evaluation that may be abandoned, e.g. when the node times out.
+        The copy shares the tree and the inherited branch elements; nothing it sets reaches the
+        node unless merge is called.
+
+        :return: CompiledNode
+        """
+        node_copy = CompiledNode(self.tree, self.index, self.parent,
+                                 {tag: copy.copy(text) for tag, text in self.fields.items()})
+        node_copy.children = self.children
+        node_copy.branch.parent = self.branch.parent
+        node_copy.branch.update(self.branch.values)
+        return node_copy
+
+    def merge(self, node_copy):
+        """
+        :param node_copy: evaluated CompiledNode from copy_detached
+        :return: None
+        """
+        self.fields.update(node_copy.fields)
+        self.branch.update(node_copy.branch.values)
+
+    @property
+    def subnodes(self):
+        nodes = self.tree.nodes
+        return [nodes[child] for child in self.children]
+
+
+class CompiledTree(object):
+    """
+    Flat list of CompiledNode objects; nodes[0] is the root of the tree.  node_classes is an
+    optional dict of node name -> node class, filled as the nodes are evaluated and shared by
+    copies of the tree.
+    fact_cache is the FactCache of the evaluation; every copy of the tree gets its own.
+    outcome_cache is an optional OutcomeCache, shared by copies of the tree.
+    cancellation_token is the CancellationToken of the run deadline, shared by copies of the tree.
+    profile is True if the nodes are evaluated with the profiler.
+    on_node_evaluated is an optional callable given the record of every node once it is evaluated,
+    shared by copies of the tree.
+    """
+
+    __slots__ = ('nodes', 'node_classes', 'fact_cache', 'outcome_cache', 'cancellation_token', 'profile',
+                 'on_node_evaluated')
+
+    def __init__(self):
+        self.nodes = []
+        self.node_classes = None
+        self.fact_cache = FactCache()
+        self.outcome_cache = None
+        self.cancellation_token = None
+        self.profile = False
+        self.on_node_evaluated = None
+
+    @property
+    def root(self):
+        return self.nodes[0]
+
+    def add_node(self, parent, fields):
+        """
+        Append a node to the tree
+
+        :param parent: parent CompiledNode or None for the root
+        :param fields: dict of tag -> text
+        :return: CompiledNode
+        """
+        index = len(self.nodes)
+        node = CompiledNode(self, index, -1 if parent is None else parent.index, fields)
+        self.nodes.append(node)
+        if parent is not None:
+            parent.children.append(index)
+        return node
+
+    def copy(self):
+        """
+        Copy of the tree for another evaluation.  The fields and branch elements are copied,
+        the children arrays are shared since they do not change after compilation.
+
+        :return: CompiledTree
+        """
+        compiled_tree = CompiledTree()
+        compiled_tree.node_classes = self.node_classes
+        compiled_tree.fact_cache = FactCache(self.fact_cache.max_size)
+        compiled_tree.outcome_cache = self.outcome_cache
+        compiled_tree.cancellation_token = self.cancellation_token
+        compiled_tree.profile = self.profile
+        compiled_tree.on_node_evaluated = self.on_node_evaluated
+        for node in self.nodes:
+            node_copy = CompiledNode(compiled_tree, node.index, node.parent, dict(node.fields))
+            node_copy.children = node.children
+            node_copy.branch.update(node.branch.values)
+            compiled_tree.nodes.append(node_copy)
+        return compiled_tree
+
+    def to_element_tree(self):
+        """
+        Materialise the tree as an ElementTree object.  Every field becomes a subelement with
+        text, every branch element set by the node itself a 'branch' subelement with one
+        attribute, followed by the subnodes.  Inherited branch elements are not duplicated into
+        the XML; the accessors in node_element reach them through the BranchContext of the node.
+
+        :return: ElementTree object
+        """
+        elements = [None] * len(self.nodes)
+        for node in self.nodes:
+            if node.parent == -1:
+                element = ET.Element('node')
+            else:
+                element = ET.SubElement(elements[node.parent], 'node')
+            for tag, text in node.fields.items():
+                ET.SubElement(element, tag).text = text
+            for key, value in node.branch.values.items():
+                ET.SubElement(element, 'branch').set(key, value)
+            _ELEMENT_BRANCH_CONTEXTS[element] = node.branch
+            elements[node.index] = element
+        return ET.ElementTree(elements[0])
+
+
+def write_evaluated_tree(tree_object, xml_file, branch_serializer=str):
+    """
+    Write an evaluated tree to a file.  Branch elements are stored by reference, so their values
+    can be any Python object; they are only converted to strings here, with branch_serializer,
+    on a copy of the tree.  Non-string text, e.g. the 'traceback' list, is converted with str.
+
+    :param tree_object: ElementTree object returned by evaluate
+    :param xml_file: path of the xml file to write
+    :param branch_serializer: callable converting a branch element value to a string
+    :return: None
+    """
+    serialized_root = _serialize_element(tree_object.getroot(), branch_serializer)
+    ET.ElementTree(serialized_root).write(xml_file)
+
+
+def _serialize_element(tree_root_element, branch_serializer):
+    """
+    :param tree_root_element: root Element object from the ElementTree package
+    :param branch_serializer: callable converting a branch element value to a string
+    :return: copy of tree_root_element with string text and attributes only
+    """
+    serialized_root = ET.Element(tree_root_element.tag)
+    stack = [(tree_root_element, serialized_root)]
+    while stack:
+        tree_element, serialized_element = stack.pop()
+        for key, value in tree_element.items():
+            if not isinstance(value, str):
+                value = branch_serializer(value) if tree_element.tag == 'branch' else str(value)
+            serialized_element.set(key, value)
+        if tree_element.text is not None:
+            serialized_element.text = str(tree_element.text)
+        serialized_element.tail = tree_element.tail
+        for subelement in tree_element:
+            stack.append((subelement, ET.SubElement(serialized_element, subelement.tag)))
+    return serialized_root
+
+
+def compile_tree(tree_root_element):
+    """
+    Compile an ElementTree into a CompiledTree.  The attributes and the text of the non-node
+    subelements of each 'node' element become its fields and 'branch' subelements become its
+    branch elements.  Subnodes are numbered depth-first so a node always follows its parent.
+
+    :param tree_root_element: root Element object from the ElementTree package
+    :return: CompiledTree
+    """
+    compiled_tree = CompiledTree()
+    stack = [(tree_root_element, None)]
+    while stack:
+        tree_element, parent = stack.pop()
+        fields = dict(tree_element.attrib)
+        branch = {}
+        subnodes = []
+        for subelement in tree_element:
+            if subelement.tag == 'node':
+                subnodes.append(subelement)
+            elif subelement.tag == 'branch':
+                branch.update(subelement.attrib)
+            else:
+                fields[subelement.tag] = subelement.text
+        node = compiled_tree.add_node(parent, fields)
+        node.branch.update(branch)
+        stack.extend((subnode, node) for subnode in reversed(subnodes))
+    return compiled_tree
+
+
+def compile_xml(xml_file):
+    """
+    :param xml_file: xml file consisting of elements with 'node' tag
+    :return: CompiledTree
+    """
+    return compile_tree(ET.parse(xml_file).getroot())
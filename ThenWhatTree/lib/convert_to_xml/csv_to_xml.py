@@ -6,14 +6,17 @@
 """Module description here"""
 
 # Import built in modules
+import bisect
+import collections
 import csv
+import io
 import re
 
 # Import 3rd party modules
 
 # Import local modules
 from ThenWhatTree.lib.convert_to_xml.common_functions import create_root_element, get_xml_from_rootnode, \
-    create_subelement, add_subelements_to_node, _convert_text_file_to_list
+    create_subelement, add_subelements_to_node
 from ThenWhatTree.lib.exceptions import ParentNotFoundError, NoParentGiven, MissingDataEntries, NonAlphaNumericCharacters
 
 # Module authorship metadata
@@ -32,30 +35,113 @@ FIELDS_WITHOUT_SPACES = ['name', 'parent']
 
 def csv_to_xml(csv_file):
     """
-
-    :param csv_file:
-    :return:
+    Convert a CSV file to a pretty printed XML decision tree.  The first record holds the field
+    names and the second record the root node.  Every other record is a subnode of the node
+    named in its 'parent' field or, if it has none, of the node of the previous record.  The
+    file is read with a single csv.reader, so quoted fields may span several lines, and the
+    parents are looked up in an index of the node names.
+
+    :param csv_file: path of the CSV file
+    :return: XML string
     """
-    text_list = _convert_text_file_to_list(csv_file)
     rootnode = create_root_element()
-    attributes = _get_fields_with_values(text_list[0], text_list[1])
-    add_subelements_to_node(attributes, rootnode)
-    last_element = rootnode
-    for line in text_list[2:]:
-        last_element = _add_subnode(rootnode, last_element, text_list[0], line)
+    with open(csv_file, 'r', newline='') as text_file:
+        records = _iter_csv_records(text_file)
+        field_values = next(records, [])
+        fields_list = [field.replace(' ', '_') for field in field_values]
+        values_list = next(records, [])
+        if not values_list:
+            raise MissingDataEntries(_get_record_text(field_values), '')
+        add_subelements_to_node(_get_record_fields_with_values(fields_list, field_values, values_list), rootnode)
+        name_index = _NameIndex()
+        name_index.add(rootnode)
+        last_element = rootnode
+        for values_list in records:
+            attributes = _get_record_fields_with_values(fields_list, field_values, values_list)
+            parent_element = find_parent_element(attributes, last_element, rootnode, name_index)
+            last_element = create_subelement(parent_element, attributes)
+            name_index.add(last_element, parent_element)
     return get_xml_from_rootnode(rootnode)
 
 
-def _add_subnode(rootnode, last_element, field_line, flow_line):
-    attributes = _get_fields_with_values(field_line, flow_line)
-    parent_element = find_parent_element(attributes, last_element, rootnode)
-    subelement = create_subelement(parent_element, attributes)
-    return subelement
+def _iter_csv_records(text_file):
+    """
+    :param text_file: file object opened with newline=''
+    :return: generator of the lists of values of the records; the trailing whitespace of a
+             record is dropped and blank records are skipped
+    """
+    for values_list in csv.reader(text_file):
+        if values_list:
+            values_list[-1] = values_list[-1].rstrip()
+        if values_list and values_list != ['']:
+            yield values_list
+
+
+def _get_record_text(values_list):
+    """
+    :param values_list: values of one CSV record
+    :return: the record as CSV text, for the error messages
+    """
+    record_text = io.StringIO()
+    csv.writer(record_text, lineterminator='').writerow(values_list)
+    return record_text.getvalue()
+
 
+class _NameIndex(object):
+    """
+    Index of the 'node' elements by the text of their 'name' subelement.  The position of
+    every element in document order is kept as the tuple of the child positions from the root,
+    so duplicate names resolve to the same element as a search of rootnode.iter('node').  A
+    subnode added to an earlier node comes before later nodes in document order, so the
+    elements of every name are inserted at their position rather than appended.
+    """
 
-def find_parent_element(attributes, last_element, rootnode):
+    def __init__(self, rootnode=None):
+        self._elements = {}
+        self._paths = {}
+        if rootnode is not None:
+            stack = [(rootnode, None, None)]
+            while stack:
+                element, parent, position = stack.pop()
+                self._add(element, () if parent is None else self._paths[parent] + (position,))
+                stack.extend((subnode, element, position) for position, subnode in reversed(list(enumerate(element)))
+                             if subnode.tag == 'node')
+
+    def add(self, element, parent=None):
+        """
+        :param element: 'node' Element object, the last subelement of parent
+        :param parent: parent Element object, already in the index, or None for the root
+        :return: None
+        """
+        self._add(element, () if parent is None else self._paths[parent] + (len(parent) - 1,))
+
+    def _add(self, element, path):
+        self._paths[element] = path
+        name_element = element.find('name')
+        if name_element is not None:
+            bisect.insort(self._elements.setdefault(name_element.text, []), (path, element))
+
+    def find(self, all_parents):
+        """
+        :param all_parents: list of node names, a name listed n times needs n elements
+        :return: first element in document order by which all the names have been seen
+        """
+        remaining_parents = list(all_parents)
+        found_entries = []
+        for name, count in collections.Counter(all_parents).items():
+            entries = self._elements.get(name, [])
+            for _ in entries[:count]:
+                remaining_parents.remove(name)
+            if len(entries) >= count:
+                found_entries.append(entries[count - 1])
+        if remaining_parents:
+            raise ParentNotFoundError(','.join(remaining_parents))
+        return max(found_entries, key=lambda entry: entry[0])[1]
+
+
+def find_parent_element(attributes, last_element, rootnode, name_index=None):
     try:
-        parent_element = _find_parent(rootnode, attributes['parent'])
+        parent_element = _find_parent(rootnode, attributes['parent'], name_index)
     except KeyError:
         parent_element = last_element
     except NoParentGiven:
@@ -63,18 +149,13 @@ def find_parent_element(attributes, last_element, rootnode):
     return parent_element
 
 
-def _find_parent(rootnode, parent_name):
+def _find_parent(rootnode, parent_name, name_index=None):
     all_parents = convert_parent_name_to_list(parent_name)
     if len(all_parents) == 0:
         raise NoParentGiven
-    for element in rootnode.iter('node'):
-        element_has_name = element.find('name')
-        if element_has_name is not None:
-            if element_has_name.text in all_parents:
-                all_parents.remove(element_has_name.text)
-        if len(all_parents) == 0:
-            return element
-    raise ParentNotFoundError(','.join(all_parents))
+    if name_index is None:
+        name_index = _NameIndex(rootnode)
+    return name_index.find(all_parents)
 
 
 def convert_parent_name_to_list(parent_name):
@@ -91,6 +172,27 @@ def _get_fields_with_values(fields, line):
     values_list = get_fields_from_csv_string(line)
     if len(fields_list) > len(values_list):
         raise MissingDataEntries(fields, line)
+    return _get_row_fields_with_values(fields_list, values_list)
+
+
+def _get_record_fields_with_values(fields_list, field_values, values_list):
+    """
+    :param fields_list: field names, spaces replaced with '_'
+    :param field_values: field names as read, for the error message
+    :param values_list: values of one CSV record
+    :return: dict of field name -> value
+    """
+    if len(fields_list) > len(values_list):
+        raise MissingDataEntries(_get_record_text(field_values), _get_record_text(values_list))
+    return _get_row_fields_with_values(fields_list, values_list)
+
+
+def _get_row_fields_with_values(fields_list, values_list):
+    """
+    :param fields_list: field names, spaces replaced with '_'
+    :param values_list: values of one CSV record, at least one per field
+    :return: dict of field name -> value
+    """
     fields_dict = dict(zip(fields_list, values_list))
     fields_dict = remove_spaces_from_values(fields_dict)
     check_keys_for_bad_characters(fields_dict)
@@ -109,6 +109,32 @@ def create_tree_object_from_xml(xml_file):
     return ElementTree.parse(xml_file)
 
 
+def create_tree_object_from_binary(binary_file):
+    """
+    Load an evaluated tree written by write_tree_object_to_binary.  Use
+    binary_tree.read_binary_tree instead to read the outputs only when they are needed.
+
+    :param binary_file: path of the binary file
+    :return: ElementTree object
+    """
+    # Imported here since binary_tree imports evaluate, which imports this module
+    from ThenWhatTree.lib.binary_tree import read_binary_tree
+    with read_binary_tree(binary_file) as binary_tree:
+        return binary_tree.to_element_tree()
+
+
+def write_tree_object_to_binary(tree_object, binary_file):
+    """
+    Write an evaluated tree to a compact binary file; see binary_tree.write_binary_tree
+
+    :param tree_object: ElementTree object returned by evaluate
+    :param binary_file: path of the binary file to write
+    :return: None
+    """
+    from ThenWhatTree.lib.binary_tree import write_binary_tree
+    write_binary_tree(tree_object, binary_file)
+
+
 def _get_file_type(tree_file):
     """
 
@@ -5,18 +5,23 @@
 
 # Import built in modules
 import inspect
+import itertools
 import os
 import sys
 import threading
+import time
 import importlib
 
-# noinspection PyPep8Naming
-from xml.etree import ElementTree as ET
-
 # Import local modules
-from ThenWhatTree.lib.create_tree import get_tree_root_element, create_tree_object_from_xml
-from ThenWhatTree.lib.exceptions import NoClassesFoundInModule, ThenWhatTreeNodeSubclassNotFound, NoAttributeType, \
-    NoAttributeTypeName, BranchElementError, CouldNotDiscoverCpus
+from ThenWhatTree.lib.cancellation import CancellationToken, wait_for_event
+from ThenWhatTree.lib.compiled_tree import CompiledNode, compile_xml
+from ThenWhatTree.lib.executor import get_default_executor
+from ThenWhatTree.lib.node_records import get_node_record
+from ThenWhatTree.lib.profiler import profile_call
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+from ThenWhatTree.lib.exceptions import NoClassesFoundInModule, ThenWhatTreeNodeSubclassNotFound
+from ThenWhatTree.lib.node_element import get_node_element, set_node_element, has_node_element, \
+    set_branch_elements_in_children, _get_node_name
 
 # Import 3rd party modules
 
@@ -32,11 +37,17 @@ __status__ = "Production"  # Prototype, Development, Production
 
 # Code starts here
 
-NUM_TRUE = -1
 NUM_CPUS = 1
+THREAD_BACKEND = 'thread'
+PROCESS_BACKEND = 'process'
+# 'node_is_true' of a node that ran past its timeout or the deadline of the run
+NODE_TIMEOUT = 'timeout'
+_NODE_CLASS_CACHE = {}
+_NODE_CLASS_CACHE_LOCK = threading.Lock()
 
 
-def evaluate(xml_file):
+def evaluate(xml_file, executor=None, num_workers=None, pipelined=False, backend=THREAD_BACKEND,
+             outcome_cache=None, deadline=None, profile=False, on_node_evaluated=None):
     """
     Function for evaluating an xml file.  Assumption is that the ThenWhatTreeNode modules
     have been created already.  Function will walk the tree and go deeper when a node
@@ -45,18 +56,69 @@ def evaluate(xml_file):
     Simple mantra to remember: "If true, go deeper"
 
     :param xml_file: xml file consisting of elements with 'node' tag
-    :return: ElementTree object
+    :param executor: TreeExecutor the nodes are submitted to; defaults to the shared work stealing pool
+    :param num_workers: size of the shared pool when no executor is given; defaults to the number of CPUs
+    :param pipelined: schedule the subnodes of a node as soon as it is true instead of level by level
+    :param backend: THREAD_BACKEND or PROCESS_BACKEND; nodes can override it with 'execution_backend'
+    :param outcome_cache: OutcomeCache reused across evaluations
+    :param deadline: seconds the whole evaluation may take; nodes still running are recorded as
+                     'timeout' and nodes not started yet are not evaluated
+    :param profile: record the call stacks of every node in its 'profile' element; see profiler
+    :param on_node_evaluated: callable given the record of every node as soon as it is evaluated,
+                              from the thread that evaluated it; see node_records.get_node_record.
+                              The records have no hint index, it is assigned once the tree is evaluated
+    :return: ElementTree object.  The text of some elements is a Python object, e.g. the hint
+             index, the exception and the metrics, and branch values are kept by reference, so
+             write it with compiled_tree.write_evaluated_tree rather than ElementTree.write
+    """
+    if executor is None:
+        executor = get_default_executor(_get_num_workers(num_workers))
+    compiled_tree = _compile_tree_for_evaluation(xml_file, outcome_cache, deadline)
+    compiled_tree.profile = profile
+    compiled_tree.on_node_evaluated = on_node_evaluated
+    _evaluate_tree_element(compiled_tree.root, backend)
+    if pipelined:
+        _evaluate_tree_pipelined(compiled_tree.root, executor, backend)
+    else:
+        _evaluate_tree(compiled_tree.root, executor, backend, itertools.count())
+    return compiled_tree.to_element_tree()
+
+
+def _compile_tree_for_evaluation(xml_file, outcome_cache=None, deadline=None):
+    """
+    Make the node library next to the xml file importable and compile the xml file into a
+    CompiledTree.  The class of a node is only resolved when the node is evaluated, so the
+    modules of nodes that are never reached are never imported, and kept with the tree for
+    its copies.  The nodes are evaluated on the CompiledTree; the ElementTree object is only
+    materialised once the evaluation is done.
+
+    :param xml_file: xml file consisting of elements with 'node' tag
+    :param outcome_cache: OutcomeCache or None
+    :param deadline: seconds the evaluation may take or None
+    :return: CompiledTree
     """
     os.environ['PYTHONDONTWRITEBYTECODE'] = 'TRUE'
     lib_path = xml_file.rsplit('/', 1)[0]
     _add_node_library_to_path(lib_path)
+    compiled_tree = compile_xml(xml_file)
+    compiled_tree.outcome_cache = outcome_cache
+    if deadline is not None:
+        compiled_tree.cancellation_token = CancellationToken(deadline)
+    compiled_tree.node_classes = {}
+    return compiled_tree
+
+
+def _get_num_workers(num_workers):
+    """
+    Number of workers requested by the caller or, by default, one per CPU
+
+    :param num_workers: int or None
+    :return: int
+    """
+    if num_workers is not None:
+        return num_workers
     _set_NUM_CPUS()
-    tree_object = create_tree_object_from_xml(xml_file)
-    tree_root_element = get_tree_root_element(tree_object)
-    _move_attributes_to_node_elements(tree_root_element)
-    _evaluate_tree_element(tree_root_element)
-    _evaluate_tree(tree_root_element)
-    return tree_object
+    return NUM_CPUS
 
 
 def _set_NUM_CPUS():
@@ -74,253 +136,426 @@ def _add_node_library_to_path(lib_path):
     :param lib_path: directory path
     :return: None
     """
-    sys.path.append(lib_path)
-
+    if lib_path not in sys.path:
+        sys.path.append(lib_path)
 
-class EvaluateTreeThread(threading.Thread):
-    def __init__(self, subnode):
-        threading.Thread.__init__(self)
-        self.name = subnode.find('name').text
-        self.subnode = subnode
 
-    def run(self):
-        _evaluate_tree_element(self.subnode)
-
-    def get_name(self):
-        return self.name
-
-
-def _evaluate_tree(tree_element):
+def _evaluate_tree(tree_element, executor, backend, hint_indexes):
     """
     Function used for walking the tree.
     1) Evaluate the node element
     2) If the 'node_is_true' subelement is 'true':
-        i)  add an element with the global hint index
-        ii) for each of the subnodes of the element:
-            a) set the branch elements of the node element in the subnodes
-            b) recursively call the function on each subnode
+        i)   add an element with the next hint index of the evaluation
+        ii)  set the branch elements of the node element in the subnodes
+        iii) submit every subnode to the executor and wait for all of them
+        iv)  recursively call the function on each subnode
     3) If the 'node_is_true' subelement is 'false', take no action
 
     :param tree_element: Element object from the ElementTree package
+    :param executor: TreeExecutor the subnodes are submitted to
+    :param backend: default backend of the nodes
+    :param hint_indexes: itertools.count() of the evaluation, so that concurrent evaluations
+                         number their nodes independently
     :return: None
     """
-    
+
     if get_node_element(tree_element, 'node_is_true') == 'true':
-        _add_hint_index_to_tree_element(tree_element)
-        subnode_thread_list = []
-        for subnode in _get_element_subnodes(tree_element):
+        set_node_element(tree_element, 'index', next(hint_indexes))
+        subnodes = _get_element_subnodes(tree_element)
+        for subnode in subnodes:
             set_branch_elements_in_children(tree_element, subnode)
-            subnode_thread_list.append(EvaluateTreeThread(subnode))
-        for index in range(0, len(subnode_thread_list) + 1, NUM_CPUS):
-            for subnode_thread in subnode_thread_list[index:index + NUM_CPUS]:
-                subnode_thread.start()
-            for subnode_thread in subnode_thread_list[index:index + NUM_CPUS]:
-                subnode_thread.join()
-        for subnode in _get_element_subnodes(tree_element):
-            _evaluate_tree(subnode)
+        futures = [executor.submit(_evaluate_tree_element, subnode, backend, time.perf_counter())
+                   for subnode in subnodes]
+        for future in futures:
+            future.result()
+        for subnode in subnodes:
+            _evaluate_tree(subnode, executor, backend, hint_indexes)
 
 
-def _get_element_subnodes(tree_element):
+def _evaluate_tree_pipelined(tree_element, executor, backend=THREAD_BACKEND):
     """
-    Get all of the sublements of the tree_element with a 'node' tag
+    Dataflow version of _evaluate_tree.  Every node submits its own subnodes to the executor
+    the moment it evaluates to 'true', so independent branches of the tree progress
+    concurrently instead of waiting on the slowest sibling of each level.  The hint indexes
+    are assigned once the whole tree has been evaluated so they come out in the same
+    depth-first order as _evaluate_tree.
 
-    :param tree_element: Element object from the ElementTree package
-    :return: From ElementTree documentation:  "Returns a list of all matching
-    elements in document order."
+    :param tree_element: evaluated root Element object from the ElementTree package
+    :param executor: TreeExecutor the subnodes are submitted to
+    :param backend: default backend of the nodes
+    :return: None
     """
-    return tree_element.findall('node')
+    tracker = _PipelineTracker(executor, backend)
+    _submit_subnodes_if_true(tree_element, tracker)
+    tracker.wait()
+    if tracker.errors:
+        raise tracker.errors[0]
+    _add_hint_indexes(tree_element)
 
 
-def _add_hint_index_to_tree_element(tree_element):
+class _PipelineTracker(object):
+    """
+    Counts the subnodes submitted by _evaluate_tree_pipelined that have not finished yet
+    and collects any exception raised while evaluating them.
     """
-    A global counter is used to keep track of the hint indexes.
 
-    :param tree_element: Element object from the ElementTree package
+    def __init__(self, executor, backend):
+        self.executor = executor
+        self.backend = backend
+        self.errors = []
+        self._pending = 0
+        self._condition = threading.Condition()
+
+    def add(self, count):
+        with self._condition:
+            self._pending += count
+
+    def finish(self):
+        with self._condition:
+            self._pending -= 1
+            if self._pending == 0:
+                self._condition.notify_all()
+
+    def wait(self):
+        with self._condition:
+            while self._pending:
+                self._condition.wait()
+
+
+def _submit_subnodes_if_true(tree_element, tracker):
+    """
+    If the tree_element is true, pass its branch elements to its subnodes and submit them.
+
+    :param tree_element: evaluated Element object from the ElementTree package
+    :param tracker: _PipelineTracker of the evaluation
     :return: None
     """
-    global NUM_TRUE
-    NUM_TRUE += 1
-    set_node_element(tree_element, 'index', NUM_TRUE)
+    if get_node_element(tree_element, 'node_is_true') != 'true':
+        return
+    subnodes = _get_element_subnodes(tree_element)
+    tracker.add(len(subnodes))
+    for subnode in subnodes:
+        set_branch_elements_in_children(tree_element, subnode)
+        tracker.executor.submit(_evaluate_pipelined_subnode, subnode, tracker, time.perf_counter())
 
 
-def _evaluate_tree_element(tree_element):
+def _evaluate_pipelined_subnode(tree_element, tracker, submit_time):
     """
-    Find the correct instance of the node for this tree_element.  Raise exception if none
-    was found.  Evaluate the instance of the node.
+    Task run by the executor for every subnode in a pipelined evaluation
 
     :param tree_element: Element object from the ElementTree package
+    :param tracker: _PipelineTracker of the evaluation
+    :param submit_time: time.perf_counter() when the subnode was submitted
     :return: None
     """
     try:
-        node_instance = _get_node_instance(tree_element)
-    except ModuleNotFoundError as inst:
-        set_node_element(tree_element, 'exception', inst)
-        set_node_element(tree_element, 'node_is_true', 'false')
-    else:
-        node_instance.evaluate_node()
+        _evaluate_tree_element(tree_element, tracker.backend, submit_time)
+        _submit_subnodes_if_true(tree_element, tracker)
+    except Exception as inst:
+        tracker.errors.append(inst)
+    finally:
+        tracker.finish()
 
 
-def _move_attributes_to_node_elements(tree_element):
+def _add_hint_indexes(tree_element):
     """
-    All attributes are converted to elements.  This is to facilitate easier output formatting
-    of the fully evaluated xml file.
+    Add a hint index, counting from 0, to every true node of the tree in depth-first order
 
-    :param tree_element: Element object from the ElementTree package
+    :param tree_element: root CompiledNode or Element object from the ElementTree package
     :return: None
     """
-    _create_node_elements_from_xml_attrib(tree_element)
-    for subnode in tree_element:
-        _move_attributes_to_node_elements(subnode)
+    hint_index = 0
+    stack = [tree_element]
+    while stack:
+        node = stack.pop()
+        if get_node_element(node, 'node_is_true') == 'true':
+            set_node_element(node, 'index', hint_index)
+            hint_index += 1
+            stack.extend(reversed(_get_element_subnodes(node)))
+
 
+def _get_element_subnodes(tree_element):
+    """
+    Get all of the sublements of the tree_element with a 'node' tag
 
-def _create_node_elements_from_xml_attrib(tree_element):
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :return: From ElementTree documentation:  "Returns a list of all matching
+    elements in document order."
     """
-    FIXME:  Looks like there might be a bug here...why is there a return if
-    the tree_element doesn't have any attributes?  Seems like it not return since
-    this function is called by a recursive function that expects to walk the entire tree.
+    if isinstance(tree_element, CompiledNode):
+        return tree_element.subnodes
+    return tree_element.findall('node')
+
 
-    Every attribute of the tree_element is converted to subelement.
+def _evaluate_tree_element(tree_element, backend=THREAD_BACKEND, submit_time=None):
+    """
+    Evaluate the tree_element and pass its record to the on_node_evaluated callback of the
+    tree, if any
 
     :param tree_element: Element object from the ElementTree package
+    :param backend: default backend of the nodes
+    :param submit_time: time.perf_counter() when the node was submitted to the executor
     :return: None
     """
-    if not tree_element.attrib:
-        return
-    xml_attributes = tree_element.attrib
-    if 'name' not in xml_attributes.keys():
-        # FIXME - needs a better exception
-        raise Exception
-    tree_element.attrib = {}
-    for xml_attrib in xml_attributes.keys():
-        new_element = _create_element_with_text(xml_attrib, xml_attributes[xml_attrib])
-        tree_element.append(new_element)
+    _set_tree_element_outcome(tree_element, backend, submit_time)
+    _notify_node_evaluated(tree_element)
 
 
-def _create_element_with_text(element_tag, element_text):
+def _notify_node_evaluated(tree_element):
     """
-    Function to create a new ElementTree Element with a text field
-
-    :param element_tag: tag field in the Element
-    :param element_text: text for the specified tag field
-    :return: ElementTree Element
+    :param tree_element: evaluated Element object from the ElementTree package or CompiledNode
+    :return: None
     """
-    new_element = ET.Element(element_tag)
-    new_element.text = element_text
-    return new_element
+    if isinstance(tree_element, CompiledNode) and tree_element.tree.on_node_evaluated is not None:
+        tree_element.tree.on_node_evaluated(get_node_record(tree_element, with_index=False))
 
 
-def _create_element_with_attribute(element_tag, key, value):
+def _set_tree_element_outcome(tree_element, backend=THREAD_BACKEND, submit_time=None):
     """
-    Function to create a new ElementTree Element with an attribute
+    Find the correct class of the node for this tree_element.  Raise exception if none
+    was found.  Evaluate an instance of the node with the backend requested by the class,
+    or with the default backend if the class does not request one.  With an OutcomeCache,
+    a stored outcome is restored instead of evaluating the node.  A node with a timeout, or
+    evaluated under a run deadline, is evaluated on a copy in its own thread; the copy is
+    merged back only if the node finished in time.
 
-    :param element_tag: tag field in the Element
-    :param key: attribute key
-    :param value: attribute value
-    :return: ElementTree Element
+    :param tree_element: Element object from the ElementTree package
+    :param backend: default backend of the nodes
+    :param submit_time: time.perf_counter() when the node was submitted to the executor
+    :return: None
     """
-    new_element = ET.Element(element_tag)
-    new_element.set(key, value)
-    return new_element
+    node_class = _get_node_class_with_metrics(tree_element, submit_time)
+    if node_class is None:
+        return
+    outcome_cache = tree_element.tree.outcome_cache if isinstance(tree_element, CompiledNode) else None
+    outcome_key = None
+    if outcome_cache is not None:
+        outcome_key = outcome_cache.get_key(tree_element, node_class)
+        if outcome_key is not None and outcome_cache.restore(outcome_key, tree_element):
+            return
+    cancellation_token = _get_node_cancellation_token(tree_element, node_class)
+    if cancellation_token is None:
+        _evaluate_node(tree_element, node_class, backend)
+    elif not _evaluate_node_with_timeout(tree_element, node_class, backend, cancellation_token):
+        return
+    if outcome_key is not None:
+        outcome_cache.store(outcome_key, tree_element)
 
 
-def set_node_element(tree_element, tag, text, value=None):
+def _evaluate_node(tree_element, node_class, backend, cancellation_token=None):
     """
-    FIXME:  This is an ugly function that should be refactored.  It wqs written to create the same
-    function for setting either an attribute or a subelement for an element.
-
     :param tree_element: Element object from the ElementTree package
-    :param tag: attribute name to be set in the 'branch' element or element name to be set in tree_element
-    :param text: value for subelement
-    :param value: value for attribute
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :param backend: default backend of the nodes
+    :param cancellation_token: CancellationToken passed to the node or None
     :return: None
     """
-    if value is not None:
-        branch_elements = tree_element.findall(tag)
-        for each_element in branch_elements:
-            if text in each_element.attrib.keys():
-                each_element.attrib[text] = value
-                return
-        new_element = _create_element_with_attribute(tag, text, value)
-        tree_element.append(new_element)
-
-    existing_element = tree_element.find(tag)
-    if existing_element is not None:
-        existing_element.text = text
+    if (node_class.execution_backend or backend) == PROCESS_BACKEND:
+        # Imported here since the process backend evaluates nodes with this module
+        from ThenWhatTree.lib.process_backend import evaluate_tree_element_in_process
+        evaluate_tree_element_in_process(tree_element, node_class, cancellation_token=cancellation_token)
     else:
-        new_element = _create_element_with_text(tag, text)
-        tree_element.append(new_element)
+        node_instance = node_class(tree_element, cancellation_token=cancellation_token)
+        if isinstance(tree_element, CompiledNode) and tree_element.tree.profile:
+            profile_call(tree_element, node_instance.evaluate_node)
+        else:
+            node_instance.evaluate_node()
 
 
-def has_node_element(tree_element, tag):
+def _evaluate_node_with_timeout(tree_element, node_class, backend, cancellation_token):
     """
-    Function to test if a tree_element has a subelement with the specified tag
+    Evaluate the node on a copy of the tree_element in a daemon thread and wait until it
+    finishes or the cancellation_token expires.  A node that does not finish in time is
+    cancelled and recorded as 'timeout'; anything it writes afterwards only reaches the copy.
 
-    :param tree_element: Element object from the ElementTree package
-    :param tag: subelement being searched for
-    :return: bool
+    :param tree_element: CompiledNode
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :param backend: default backend of the nodes
+    :param cancellation_token: CancellationToken of the node
+    :return: bool; False if the node timed out
     """
-    try:
-        get_node_element(tree_element, tag)
-    except (NoAttributeType, NoAttributeTypeName):
+    if cancellation_token.cancelled:
+        _set_node_timeout(tree_element, 0.0)
+        return False
+    node_copy = tree_element.copy_detached()
+    finished = threading.Event()
+    errors = []
+
+    def evaluate_node_copy():
+        try:
+            _evaluate_node(node_copy, node_class, backend, cancellation_token)
+        except BaseException as inst:
+            errors.append(inst)
+        finally:
+            finished.set()
+
+    start_time = time.perf_counter()
+    threading.Thread(target=evaluate_node_copy, name='ThenWhatTree-' + str(tree_element.name), daemon=True).start()
+    if not wait_for_event(finished, cancellation_token):
+        cancellation_token.cancel()
+        _set_node_timeout(tree_element, time.perf_counter() - start_time)
         return False
-    return True
+    if errors:
+        raise errors[0]
+    tree_element.merge(node_copy)
+    # the process backend records a node it terminated when the token was cancelled as 'timeout'
+    return tree_element.fields.get('node_is_true') != NODE_TIMEOUT
+
+
+def _get_node_cancellation_token(tree_element, node_class):
+    """
+    :param tree_element: Element object from the ElementTree package
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :return: CancellationToken expiring at the timeout of the node or the run deadline,
+             or None if the node has neither
+    """
+    if not isinstance(tree_element, CompiledNode):
+        return None
+    timeout = _get_node_timeout(tree_element, node_class)
+    run_token = tree_element.tree.cancellation_token
+    if timeout is None and run_token is None:
+        return None
+    return CancellationToken(timeout, run_token)
+
+
+def _get_node_timeout(tree_element, node_class):
+    """
+    :param tree_element: CompiledNode
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :return: seconds from the 'timeout' field of the node or the 'timeout' of its class, or None
+    """
+    timeout = tree_element.fields.get('timeout')
+    if timeout is None or not str(timeout).strip():
+        return node_class.timeout
+    return float(timeout)
+
 
+def _set_node_timeout(tree_element, wall_time):
+    """
+    Record a node that ran past its timeout or the deadline of the run.  Its subnodes are not
+    evaluated.
 
-def get_node_element(tree_element, tag, key=None):
+    :param tree_element: CompiledNode
+    :param wall_time: seconds the node ran before it was abandoned
+    :return: None
     """
-    FIXME:  This is an ugly function that should be refactored.  It wqs written to create the same
-    function for getting either an attribute or a subelement for an element.
+    set_node_element(tree_element, 'node_is_true', NODE_TIMEOUT)
+    metrics = tree_element.fields.get('metrics')
+    if isinstance(metrics, NodeMetricsData):
+        metrics.wall_time = wall_time
+
+
+def _get_node_class_with_metrics(tree_element, submit_time=None):
+    """
+    Resolve the class of the node and start the NodeMetricsData of the tree_element with the
+    time it waited in the executor queue and the time it took to import the node class.
 
     :param tree_element: Element object from the ElementTree package
-    :param tag: subelement of the tree_element
-    :param key: key for value to be returned from the 'branch' subelements
-    :return: either text from the element or value from the attribute
-    """
-    if key:
-        branch_elements = tree_element.findall('branch')
-        for each_element in branch_elements:
-            if key in each_element.attrib.keys():
-                return each_element.attrib[key]
-        raise BranchElementError(tree_element.find('name').text, key)
-    if tree_element.find(tag) is not None:
-        text = tree_element.find(tag).text
-        return text
-    else:
-        raise NoAttributeTypeName(tree_element.find('name').text, tag)
+    :param submit_time: time.perf_counter() when the node was submitted to the executor
+    :return: subclass of ThenWhatTreeNode for tree_element or None
+    """
+    start_time = time.perf_counter()
+    node_class = _get_node_class_or_set_exception(tree_element)
+    queue_wait_time = 0.0 if submit_time is None else start_time - submit_time
+    set_node_element(tree_element, 'metrics', NodeMetricsData(queue_wait_time, time.perf_counter() - start_time))
+    return node_class
 
 
-def set_branch_elements_in_children(tree_element, subnode):
+def _get_node_class_or_set_exception(tree_element):
     """
-    Function to identify and pass all the 'branch' elements of the tree_element to
-    its children.
+    Return the class of the node for this tree_element.  If the module of the node
+    cannot be imported, the node is marked as 'false' with the exception and None is returned.
 
     :param tree_element: Element object from the ElementTree package
-    :param subnode: Element object from the ElementTree package
-    :return: None
+    :return: subclass of ThenWhatTreeNode for tree_element or None
     """
-    branch_elements = tree_element.findall('branch')
-    for each_element in branch_elements:
-        key = each_element.keys()[0]
-        value = each_element.get(key)
-        set_node_element(subnode, 'branch', key, value)
+    try:
+        return _get_node_class(tree_element)
+    except ModuleNotFoundError as inst:
+        set_node_element(tree_element, 'exception', inst)
+        set_node_element(tree_element, 'node_is_true', 'false')
+        return None
 
 
 # noinspection PyPep8Naming
 def _get_node_instance(tree_element):
     """
-    For a given tree_element:
-    1) import the module for this element
-    2) find all of the classes in the module
-    3) filter to find the class that is a subnode of ThenWhatTreeNode class
-    4) return the instance of the class
+    Return the instance of the node class for this tree_element
 
     :param tree_element: Element object from the ElementTree package
     :return: instance of ThenWhatTreeNode for tree_element
     """
-    _import_module_for_tree_element(tree_element)
-    classes_in_module = _get_node_classes(tree_element)
-    ThenWhatTreeNode_subclass = _get_ThenWhatTreeNode_subclass(classes_in_module)
-    return ThenWhatTreeNode_subclass(tree_element)
+    return _get_node_class(tree_element)(tree_element)
+
+
+# noinspection PyPep8Naming
+def _get_node_class(tree_element):
+    """
+    For a given tree_element return the class already resolved for its CompiledTree, if any,
+    or the class from the resolution cache.  The cache entry is
+    only trusted while the module file has the same modification time and size; otherwise:
+    1) import (or reload, if the file changed) the module for this element
+    2) use the class with the same name as the module if it is a subclass of ThenWhatTreeNode
+    3) otherwise find all of the classes in the module and filter to find the class that is a
+       subclass of ThenWhatTreeNode
+    4) cache and return the class, and keep it with the CompiledTree of the tree_element
+
+    :param tree_element: Element object from the ElementTree package
+    :return: subclass of ThenWhatTreeNode for tree_element
+    """
+    node_name = _get_node_name(tree_element)
+    node_classes = tree_element.tree.node_classes if isinstance(tree_element, CompiledNode) else None
+    if node_classes is not None and node_name in node_classes:
+        return node_classes[node_name]
+    node_class = _get_cached_node_class(tree_element, node_name)
+    if node_classes is not None:
+        node_classes[node_name] = node_class
+    return node_class
+
+
+def _get_cached_node_class(tree_element, node_name):
+    """
+    :param tree_element: Element object from the ElementTree package
+    :param node_name: name of the node module
+    :return: subclass of ThenWhatTreeNode for tree_element, from the resolution cache
+    """
+    cache_entry = _NODE_CLASS_CACHE.get(node_name)
+    if cache_entry is not None and cache_entry[1] == _get_module_file_stamp(sys.modules.get(node_name)):
+        return cache_entry[0]
+    with _NODE_CLASS_CACHE_LOCK:
+        module = _import_module_for_tree_element(tree_element)
+        if cache_entry is not None and cache_entry[1] != _get_module_file_stamp(module):
+            module = importlib.reload(module)
+        node_class = getattr(module, node_name, None)
+        if not (inspect.isclass(node_class) and _is_ThenWhatTreeNode_subclass(node_class)):
+            classes_in_module = _get_node_classes(tree_element)
+            node_class = _get_ThenWhatTreeNode_subclass(classes_in_module)
+        _NODE_CLASS_CACHE[node_name] = (node_class, _get_module_file_stamp(module))
+    return node_class
+
+
+def _get_module_file_stamp(module):
+    """
+    Modification time and size of the file a module was loaded from
+
+    :param module: module object or None
+    :return: tuple or None if the module has no file
+    """
+    try:
+        file_stat = os.stat(module.__file__)
+    except (AttributeError, TypeError, OSError):
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def clear_node_class_cache():
+    """
+    Forget every resolved node class so the next evaluation imports the node modules again
+
+    :return: None
+    """
+    with _NODE_CLASS_CACHE_LOCK:
+        _NODE_CLASS_CACHE.clear()
 
 
 # noinspection PyPep8Naming
@@ -337,12 +572,21 @@ def _get_ThenWhatTreeNode_subclass(classes_in_module):
     :return: class type object
     """
     for each_class in classes_in_module:
-        class_inheritance_tuple = inspect.getmro(each_class[1])
-        if class_inheritance_tuple[1].__name__ == 'ThenWhatTreeNode':
+        if _is_ThenWhatTreeNode_subclass(each_class[1]):
             return each_class[1]
     raise ThenWhatTreeNodeSubclassNotFound(classes_in_module)
 
 
+# noinspection PyPep8Naming
+def _is_ThenWhatTreeNode_subclass(node_class):
+    """
+    :param node_class: class type object
+    :return: bool; True if the parent class of node_class is ThenWhatTreeNode
+    """
+    class_inheritance_tuple = inspect.getmro(node_class)
+    return len(class_inheritance_tuple) > 1 and class_inheritance_tuple[1].__name__ == 'ThenWhatTreeNode'
+
+
 def _get_node_classes(tree_element):
     """
     Use inspect to find all the classes in the module with the same name as the tree_element
@@ -350,9 +594,9 @@ def _get_node_classes(tree_element):
     :param tree_element: Element object from the ElementTree package
     :return: list of class type objects
     """
-    classes_in_module = inspect.getmembers(sys.modules[tree_element.find('name').text], inspect.isclass)
+    classes_in_module = inspect.getmembers(sys.modules[_get_node_name(tree_element)], inspect.isclass)
     if not classes_in_module:
-        raise NoClassesFoundInModule(tree_element.find('name').text)
+        raise NoClassesFoundInModule(_get_node_name(tree_element))
     return classes_in_module
 
 
@@ -361,7 +605,7 @@ def _import_module_for_tree_element(tree_element):
     Imports the module in the current directory with the same name as the tree_element
 
     :param tree_element: Element object from the ElementTree package
-    :return: None
+    :return: module object
     """
     # FIXME get unit test around this for the case when we try to import something that doesn't exist
-    importlib.import_module(tree_element.find('name').text)
+    return importlib.import_module(_get_node_name(tree_element))
@@ -0,0 +1,139 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""asyncio version of evaluate() for trees of mostly I/O bound nodes"""
+
+# Import built in modules
+import asyncio
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.evaluate import get_node_element, set_node_element, set_branch_elements_in_children, \
+    _get_element_subnodes, _get_node_class, _compile_tree_for_evaluation, _add_hint_indexes, _get_num_workers, \
+    _evaluate_tree_element, _get_node_cancellation_token, _set_node_timeout, _notify_node_evaluated, THREAD_BACKEND
+from ThenWhatTree.lib.executor import get_default_executor
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+MAX_CONCURRENCY = 256
+
+
+async def evaluate_async(xml_file, max_concurrency=MAX_CONCURRENCY, executor=None, num_workers=None,
+                         backend=THREAD_BACKEND, outcome_cache=None, deadline=None, profile=False,
+                         on_node_evaluated=None):
+    """
+    Coroutine for evaluating an xml file on an event loop.  Nodes whose 'is_true' is an
+    'async def' are awaited directly, all other nodes are run on a thread executor.  The
+    subnodes of a node are scheduled as soon as it evaluates to 'true', the same way as
+    evaluate(xml_file, pipelined=True).
+
+    Simple mantra to remember: "If true, go deeper"
+
+    :param xml_file: xml file consisting of elements with 'node' tag
+    :param max_concurrency: maximum number of nodes being evaluated at the same time
+    :param executor: TreeExecutor for synchronous nodes; defaults to the shared work stealing pool
+    :param num_workers: size of the shared pool when no executor is given; defaults to the number of CPUs
+    :param backend: THREAD_BACKEND or PROCESS_BACKEND for synchronous nodes
+    :param outcome_cache: OutcomeCache for synchronous nodes, reused across evaluations
+    :param deadline: seconds the whole evaluation may take, as for evaluate
+    :param profile: profile the synchronous nodes, as for evaluate
+    :param on_node_evaluated: callable given the record of every node as soon as it is evaluated,
+                              as for evaluate; called on the event loop for async nodes
+    :return: ElementTree object
+    """
+    if executor is None:
+        executor = get_default_executor(_get_num_workers(num_workers))
+    compiled_tree = _compile_tree_for_evaluation(xml_file, outcome_cache, deadline)
+    compiled_tree.profile = profile
+    compiled_tree.on_node_evaluated = on_node_evaluated
+    semaphore = asyncio.Semaphore(max_concurrency)
+    await _evaluate_subtree_async(compiled_tree.root, semaphore, executor, backend)
+    _add_hint_indexes(compiled_tree.root)
+    return compiled_tree.to_element_tree()
+
+
+async def _evaluate_subtree_async(tree_element, semaphore, executor, backend):
+    """
+    Evaluate the tree_element and, if it is true, all of its subnodes concurrently.
+
+    :param tree_element: CompiledNode
+    :param semaphore: asyncio.Semaphore bounding the number of nodes in flight
+    :param executor: TreeExecutor for synchronous nodes
+    :param backend: backend of the synchronous nodes
+    :return: None
+    """
+    async with semaphore:
+        await _evaluate_tree_element_async(tree_element, executor, backend)
+    if get_node_element(tree_element, 'node_is_true') == 'true':
+        subnodes = _get_element_subnodes(tree_element)
+        for subnode in subnodes:
+            set_branch_elements_in_children(tree_element, subnode)
+        await asyncio.gather(*[_evaluate_subtree_async(subnode, semaphore, executor, backend) for subnode in subnodes])
+
+
+async def _evaluate_tree_element_async(tree_element, executor, backend):
+    """
+    Await the node of the tree_element if it is a coroutine, otherwise run it on the executor.
+    The node instance and its metrics are only created here for async nodes; the executor
+    creates them for the other nodes.
+
+    :param tree_element: CompiledNode
+    :param executor: TreeExecutor for synchronous nodes
+    :param backend: backend of the synchronous nodes
+    :return: None
+    """
+    start_time = time.perf_counter()
+    try:
+        node_class = _get_node_class(tree_element)
+    except ModuleNotFoundError:
+        node_class = None
+    if node_class is None or not node_class.is_async():
+        # a missing module is recorded by the executor, like for evaluate()
+        await asyncio.wrap_future(executor.submit(_evaluate_tree_element, tree_element, backend,
+                                                  time.perf_counter()))
+        return
+    set_node_element(tree_element, 'metrics', NodeMetricsData(0.0, time.perf_counter() - start_time))
+    cancellation_token = _get_node_cancellation_token(tree_element, node_class)
+    if cancellation_token is None:
+        await node_class(tree_element).evaluate_node_async()
+    else:
+        await _evaluate_node_async_with_timeout(tree_element, node_class, cancellation_token)
+    _notify_node_evaluated(tree_element)
+
+
+async def _evaluate_node_async_with_timeout(tree_element, node_class, cancellation_token):
+    """
+    Await the node on a copy of the tree_element and cancel it when the cancellation_token
+    expires.  The copy is merged back only if the node finished in time.
+
+    :param tree_element: CompiledNode
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :param cancellation_token: CancellationToken of the node
+    :return: None
+    """
+    if cancellation_token.cancelled:
+        _set_node_timeout(tree_element, 0.0)
+        return
+    node_copy = tree_element.copy_detached()
+    node_instance = node_class(node_copy, cancellation_token=cancellation_token)
+    start_time = time.perf_counter()
+    try:
+        await asyncio.wait_for(node_instance.evaluate_node_async(), cancellation_token.get_remaining_time())
+    except asyncio.TimeoutError:
+        cancellation_token.cancel()
+        _set_node_timeout(tree_element, time.perf_counter() - start_time)
+        return
+    tree_element.merge(node_copy)
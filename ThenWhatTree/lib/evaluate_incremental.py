@@ -0,0 +1,239 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Evaluate a decision tree again after some of its node modules were edited, reusing the
+results of a previous evaluation for the nodes the edit cannot affect
+"""
+
+# Import built in modules
+import os
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.compiled_tree import compile_xml
+from ThenWhatTree.lib.evaluate import get_node_element, set_branch_elements_in_children, _get_element_subnodes, \
+    _compile_tree_for_evaluation, _evaluate_tree_element, _add_hint_indexes, _get_num_workers, THREAD_BACKEND
+from ThenWhatTree.lib.executor import get_default_executor
+from ThenWhatTree.lib.log_scanner import find_module_file
+from ThenWhatTree.lib.outcome_cache import RESULT_TAGS, OUTCOME_TAGS, _get_file_fingerprint
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+MODULE_HASH_TAG = 'module_hash'
+
+
+def evaluate_incremental(xml_file, previous_xml_file=None, changed_modules=None, executor=None, num_workers=None,
+                         backend=THREAD_BACKEND, outcome_cache=None):
+    """
+    Evaluate the tree in xml_file, reusing the results of previous_xml_file, a tree evaluated
+    earlier and written with write_evaluated_tree.  A node is changed if its module is in
+    changed_modules or, without changed_modules, if the hash of its module differs from the
+    'module_hash' recorded by the previous incremental evaluation.  New nodes and nodes whose
+    fields were edited in the xml file are changed too.
+
+    The changed nodes and their ancestors are evaluated again; the ancestors are needed to
+    pass the branch elements down by reference.  The subnodes of an evaluated node are
+    evaluated again only if its status or the branch elements it set differ from the previous
+    evaluation, compared as strings; all the other subtrees are copied from previous_xml_file.
+    Branch elements set by copied nodes are the strings written in previous_xml_file.
+
+    :param xml_file: xml file consisting of elements with 'node' tag
+    :param previous_xml_file: evaluated xml file; None evaluates every node
+    :param changed_modules: iterable of node module names or paths of the edited modules
+    :param executor: TreeExecutor the nodes are submitted to; defaults to the shared work stealing pool
+    :param num_workers: size of the shared pool when no executor is given; defaults to the number of CPUs
+    :param backend: THREAD_BACKEND or PROCESS_BACKEND; nodes can override it with 'execution_backend'
+    :param outcome_cache: OutcomeCache reused across evaluations
+    :return: ElementTree object with the 'module_hash' of every node
+    """
+    if executor is None:
+        executor = get_default_executor(_get_num_workers(num_workers))
+    compiled_tree = _compile_tree_for_evaluation(xml_file, outcome_cache)
+    module_hashes = _get_module_hashes(compiled_tree)
+    previous_nodes = {}
+    if previous_xml_file is not None and os.path.isfile(previous_xml_file):
+        previous_nodes = _match_previous_nodes(compiled_tree, compile_xml(previous_xml_file))
+    if changed_modules is not None:
+        changed_modules = set(os.path.splitext(os.path.basename(module))[0] for module in changed_modules)
+    stale_nodes = _get_stale_nodes(compiled_tree, previous_nodes, module_hashes, changed_modules)
+
+    root = compiled_tree.root
+    if root.index in stale_nodes:
+        _evaluate_tree_element(root, backend)
+        _evaluate_tree_incrementally(root, previous_nodes, stale_nodes, executor, backend)
+    else:
+        _copy_previous_subtree(root, previous_nodes)
+    for node in compiled_tree.nodes:
+        if node.name in module_hashes:
+            node.fields[MODULE_HASH_TAG] = module_hashes[node.name]
+    _add_hint_indexes(root)
+    return compiled_tree.to_element_tree()
+
+
+def _get_module_hashes(compiled_tree):
+    """
+    The modules are found on sys.path and hashed without importing them
+
+    :param compiled_tree: CompiledTree
+    :return: dict of node name -> hash of its module, for the nodes with a module
+    """
+    module_hashes = {}
+    for node_name in set(node.name for node in compiled_tree.nodes):
+        module_file = find_module_file(node_name)
+        if module_file is None:
+            continue
+        try:
+            module_hashes[node_name] = _get_file_fingerprint(module_file)[2]
+        except OSError:
+            pass
+    return module_hashes
+
+
+def _get_node_paths(compiled_tree):
+    """
+    Identify every node by the names of its ancestors and its own name, numbering the
+    siblings that have the same name
+
+    :param compiled_tree: CompiledTree
+    :return: list of node paths, indexed by node index
+    """
+    paths = [None] * len(compiled_tree.nodes)
+    for node in compiled_tree.nodes:
+        if node.parent == -1:
+            paths[node.index] = ((node.name, 0),)
+        sibling_counts = {}
+        for subnode in node.subnodes:
+            count = sibling_counts.get(subnode.name, 0)
+            sibling_counts[subnode.name] = count + 1
+            paths[subnode.index] = paths[node.index] + ((subnode.name, count),)
+    return paths
+
+
+def _match_previous_nodes(compiled_tree, previous_tree):
+    """
+    :param compiled_tree: CompiledTree to evaluate
+    :param previous_tree: evaluated CompiledTree
+    :return: dict of node index in compiled_tree -> CompiledNode at the same path in previous_tree
+    """
+    previous_by_path = dict(zip(_get_node_paths(previous_tree), previous_tree.nodes))
+    previous_nodes = {}
+    for index, path in enumerate(_get_node_paths(compiled_tree)):
+        if path in previous_by_path:
+            previous_nodes[index] = previous_by_path[path]
+    return previous_nodes
+
+
+def _get_stale_nodes(compiled_tree, previous_nodes, module_hashes, changed_modules):
+    """
+    :param compiled_tree: CompiledTree to evaluate
+    :param previous_nodes: dict from _match_previous_nodes
+    :param module_hashes: dict from _get_module_hashes
+    :param changed_modules: set of node module names or None to compare the module hashes
+    :return: set of the indexes of the changed nodes and of their ancestors
+    """
+    stale_nodes = set()
+    for node in compiled_tree.nodes:
+        if not _is_changed(node, previous_nodes.get(node.index), module_hashes, changed_modules):
+            continue
+        index = node.index
+        while index != -1 and index not in stale_nodes:
+            stale_nodes.add(index)
+            index = compiled_tree.nodes[index].parent
+    return stale_nodes
+
+
+def _is_changed(node, previous_node, module_hashes, changed_modules):
+    """
+    :param node: CompiledNode to evaluate
+    :param previous_node: CompiledNode at the same path in the previous tree or None
+    :param module_hashes: dict from _get_module_hashes
+    :param changed_modules: set of node module names or None to compare the module hashes
+    :return: bool
+    """
+    if previous_node is None or node.name not in module_hashes:
+        return True
+    if _get_definition_fields(node) != _get_definition_fields(previous_node):
+        return True
+    if changed_modules is not None:
+        return node.name in changed_modules
+    return previous_node.fields.get(MODULE_HASH_TAG) != module_hashes[node.name]
+
+
+def _get_definition_fields(node):
+    return {tag: text for tag, text in node.fields.items() if tag not in RESULT_TAGS and tag != MODULE_HASH_TAG}
+
+
+def _evaluate_tree_incrementally(tree_element, previous_nodes, stale_nodes, executor, backend):
+    """
+    Version of evaluate._evaluate_tree for an evaluated tree_element: its subnodes are
+    evaluated again if the outcome of tree_element changed or if they are stale, otherwise
+    their subtrees are copied from the previous evaluation.
+
+    :param tree_element: evaluated CompiledNode
+    :param previous_nodes: dict from _match_previous_nodes
+    :param stale_nodes: set from _get_stale_nodes
+    :param executor: TreeExecutor the subnodes are submitted to
+    :param backend: default backend of the nodes
+    :return: None
+    """
+    if get_node_element(tree_element, 'node_is_true') != 'true':
+        return
+    outcome_changed = _is_outcome_changed(tree_element, previous_nodes.get(tree_element.index))
+    evaluated_subnodes = []
+    for subnode in _get_element_subnodes(tree_element):
+        set_branch_elements_in_children(tree_element, subnode)
+        if outcome_changed or subnode.index in stale_nodes:
+            evaluated_subnodes.append(subnode)
+        else:
+            _copy_previous_subtree(subnode, previous_nodes)
+    futures = [executor.submit(_evaluate_tree_element, subnode, backend, time.perf_counter())
+               for subnode in evaluated_subnodes]
+    for future in futures:
+        future.result()
+    for subnode in evaluated_subnodes:
+        _evaluate_tree_incrementally(subnode, previous_nodes, stale_nodes, executor, backend)
+
+
+def _is_outcome_changed(tree_element, previous_node):
+    """
+    :param tree_element: evaluated CompiledNode
+    :param previous_node: CompiledNode at the same path in the previous tree or None
+    :return: True if the status or the branch elements set by the node differ from the previous evaluation
+    """
+    if previous_node is None or previous_node.fields.get('node_is_true') != 'true':
+        return True
+    branch_elements = {key: str(value) for key, value in tree_element.branch.values.items()}
+    return branch_elements != previous_node.branch.values
+
+
+def _copy_previous_subtree(tree_element, previous_nodes):
+    """
+    Copy the outcome and the branch elements of every node of the subtree from the
+    previous evaluation
+
+    :param tree_element: CompiledNode
+    :param previous_nodes: dict from _match_previous_nodes
+    :return: None
+    """
+    stack = [tree_element]
+    while stack:
+        node = stack.pop()
+        previous_node = previous_nodes[node.index]
+        node.fields.update((tag, text) for tag, text in previous_node.fields.items() if tag in OUTCOME_TAGS)
+        node.branch.update(previous_node.branch.values)
+        for subnode in _get_element_subnodes(node):
+            set_branch_elements_in_children(node, subnode)
+            stack.append(subnode)
@@ -0,0 +1,244 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Evaluate one decision tree for many inputs, e.g. every failing test of a regression"""
+
+# Import built in modules
+import collections
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.evaluate import get_node_element, set_branch_elements_in_children, \
+    _get_element_subnodes, _compile_tree_for_evaluation, _evaluate_tree_element, _add_hint_indexes, \
+    _get_node_class, _get_node_class_with_metrics, _get_node_cancellation_token, _get_num_workers, \
+    _notify_node_evaluated, PROCESS_BACKEND, THREAD_BACKEND
+from ThenWhatTree.lib.executor import get_default_executor
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+INPUT_BRANCH_ELEMENT = 'input'
+
+
+def evaluate_many(xml_file, inputs, executor=None, num_workers=None, backend=THREAD_BACKEND, max_pending=None,
+                  batch_size=None, result_store=None, outcome_cache=None):
+    """
+    Generator evaluating the tree in xml_file once for every input.  The xml file is parsed
+    and the node modules are imported once; every input is then evaluated on its own copy of
+    the tree.  The inputs are spread across the workers of the executor, each of them
+    evaluating one copy of the tree at a time.
+
+    With a batch_size, the inputs are evaluated in batches of that size instead.  A batch is
+    evaluated level by level and the nodes that define 'is_true_batch' are called once per
+    batch with the instances of the node of every input that reached it.  Nodes with a
+    timeout or evaluated with the process backend are still evaluated once per input.
+
+    An input that is a dict becomes the branch elements of the root node, any other input
+    becomes the branch element 'input'.  The hint indexes of every tree start at 0.
+
+    With a result_store, the results are written into the ResultStore instead of being
+    materialised as ElementTree objects, and the run id of every input is returned.
+
+    :param xml_file: xml file consisting of elements with 'node' tag
+    :param inputs: iterable of inputs
+    :param executor: TreeExecutor the inputs are submitted to; defaults to the shared work stealing pool
+    :param num_workers: size of the shared pool when no executor is given; defaults to the number of CPUs
+    :param backend: THREAD_BACKEND or PROCESS_BACKEND; nodes can override it with 'execution_backend'
+    :param max_pending: maximum number of inputs, or batches, submitted but not yet returned; defaults to 4 per worker
+    :param batch_size: number of inputs evaluated together by nodes with 'is_true_batch'
+    :param result_store: ResultStore the results are added to
+    :param outcome_cache: OutcomeCache reused across inputs and evaluations
+    :return: generator of (input, ElementTree object), or (input, run id), in the order of the inputs
+    """
+    if executor is None:
+        executor = get_default_executor(_get_num_workers(num_workers))
+    if max_pending is None:
+        max_pending = 4 * executor.num_workers
+    compiled_tree = _compile_tree_for_evaluation(xml_file, outcome_cache)
+    pending = collections.deque()
+    materialise = result_store is None
+    for input_batch in _get_input_batches(inputs, batch_size or 1):
+        pending.append((input_batch, executor.submit(_evaluate_input_batch, compiled_tree, input_batch, backend,
+                                                     materialise)))
+        if len(pending) >= max_pending:
+            yield from _get_batch_results(*pending.popleft(), result_store)
+    while pending:
+        yield from _get_batch_results(*pending.popleft(), result_store)
+
+
+def _get_batch_results(input_batch, future, result_store):
+    """
+    :param input_batch: list of inputs
+    :param future: Future of _evaluate_input_batch for the input_batch
+    :param result_store: ResultStore or None
+    :return: list of (input, ElementTree object) or, with a result_store, (input, run id)
+    """
+    results = future.result()
+    if result_store is not None:
+        results = [result_store.add_run(input_tree, each_input) for each_input, input_tree in zip(input_batch, results)]
+    return list(zip(input_batch, results))
+
+
+def _get_input_batches(inputs, batch_size):
+    """
+    :param inputs: iterable of inputs
+    :param batch_size: number of inputs per batch
+    :return: generator of lists of inputs
+    """
+    input_batch = []
+    for each_input in inputs:
+        input_batch.append(each_input)
+        if len(input_batch) == batch_size:
+            yield input_batch
+            input_batch = []
+    if input_batch:
+        yield input_batch
+
+
+def _evaluate_input_batch(compiled_tree, input_batch, backend, materialise=True):
+    """
+    Evaluate a copy of the compiled_tree for every input of the batch
+
+    :param compiled_tree: CompiledTree shared by all inputs
+    :param input_batch: list of inputs
+    :param backend: default backend of the nodes
+    :param materialise: return ElementTree objects instead of the evaluated CompiledTrees
+    :return: list of ElementTree objects or CompiledTrees
+    """
+    input_trees = [_copy_tree_for_input(compiled_tree, each_input) for each_input in input_batch]
+    if len(input_trees) == 1:
+        _evaluate_tree_serially(input_trees[0].root, backend)
+    else:
+        _evaluate_trees_level_by_level([input_tree.root for input_tree in input_trees], backend)
+    if not materialise:
+        return input_trees
+    return [input_tree.to_element_tree() for input_tree in input_trees]
+
+
+def _copy_tree_for_input(compiled_tree, each_input):
+    """
+    :param compiled_tree: CompiledTree shared by all inputs
+    :param each_input: dict of branch elements for the root node or value of the branch element 'input'
+    :return: CompiledTree
+    """
+    input_tree = compiled_tree.copy()
+    if isinstance(each_input, dict):
+        input_tree.root.branch.update(each_input)
+    else:
+        input_tree.root.branch[INPUT_BRANCH_ELEMENT] = each_input
+    return input_tree
+
+
+def _evaluate_tree_serially(tree_element, backend):
+    """
+    Evaluate the tree in the calling thread.  The subnodes of a true node are evaluated
+    together, as in evaluate(), and the hint indexes are assigned in depth-first order.
+
+    :param tree_element: root CompiledNode
+    :param backend: default backend of the nodes
+    :return: None
+    """
+    _evaluate_tree_element(tree_element, backend)
+    stack = [tree_element]
+    while stack:
+        node = stack.pop()
+        if get_node_element(node, 'node_is_true') != 'true':
+            continue
+        subnodes = _get_element_subnodes(node)
+        for subnode in subnodes:
+            set_branch_elements_in_children(node, subnode)
+            _evaluate_tree_element(subnode, backend)
+        stack.extend(reversed(subnodes))
+    _add_hint_indexes(tree_element)
+
+
+def _evaluate_trees_level_by_level(tree_elements, backend):
+    """
+    Evaluate copies of the same tree together.  The nodes of one level of all the trees are
+    grouped by their position in the tree, so every group holds instances of one node class.
+
+    :param tree_elements: list of root CompiledNodes
+    :param backend: default backend of the nodes
+    :return: None
+    """
+    pending = tree_elements
+    while pending:
+        node_groups = collections.OrderedDict()
+        for tree_element in pending:
+            node_groups.setdefault(tree_element.index, []).append(tree_element)
+        pending = []
+        for node_group in node_groups.values():
+            _evaluate_node_group(node_group, backend)
+            for tree_element in node_group:
+                if get_node_element(tree_element, 'node_is_true') == 'true':
+                    for subnode in _get_element_subnodes(tree_element):
+                        set_branch_elements_in_children(tree_element, subnode)
+                        pending.append(subnode)
+    for tree_element in tree_elements:
+        _add_hint_indexes(tree_element)
+
+
+def _evaluate_node_group(node_group, backend):
+    """
+    Evaluate the node_group with 'is_true_batch' if the node class defines it, otherwise
+    evaluate every tree_element on its own.  Nodes with a timeout, evaluated under a run
+    deadline, profiled or evaluated with the process backend are evaluated on their own too.
+    Outcomes are restored from and stored in the OutcomeCache of the tree as for the other
+    nodes, and every evaluated node is passed to the on_node_evaluated callback.
+
+    :param node_group: list of CompiledNodes at the same position of copies of a tree
+    :param backend: default backend of the nodes
+    :return: None
+    """
+    node_class = _get_batch_node_class(node_group[0], backend)
+    if node_class is None:
+        for tree_element in node_group:
+            _evaluate_tree_element(tree_element, backend)
+        return
+    outcome_cache = node_group[0].tree.outcome_cache
+    batch = []
+    for tree_element in node_group:
+        _get_node_class_with_metrics(tree_element)
+        outcome_key = None
+        if outcome_cache is not None:
+            outcome_key = outcome_cache.get_key(tree_element, node_class)
+            if outcome_key is not None and outcome_cache.restore(outcome_key, tree_element):
+                _notify_node_evaluated(tree_element)
+                continue
+        batch.append((tree_element, outcome_key))
+    if not batch:
+        return
+    node_class.evaluate_node_batch([node_class(tree_element) for tree_element, _ in batch])
+    for tree_element, outcome_key in batch:
+        if outcome_key is not None:
+            outcome_cache.store(outcome_key, tree_element)
+        _notify_node_evaluated(tree_element)
+
+
+def _get_batch_node_class(tree_element, backend):
+    """
+    :param tree_element: first CompiledNode of a node group
+    :param backend: default backend of the nodes
+    :return: class of the node if the group can be evaluated with 'is_true_batch', otherwise None
+    """
+    try:
+        node_class = _get_node_class(tree_element)
+    except ModuleNotFoundError:
+        return None
+    if node_class is None or not node_class.has_is_true_batch():
+        return None
+    if (node_class.execution_backend or backend) == PROCESS_BACKEND or tree_element.tree.profile:
+        return None
+    if _get_node_cancellation_token(tree_element, node_class) is not None:
+        return None
+    return node_class
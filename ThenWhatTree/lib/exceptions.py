@@ -122,3 +122,24 @@ class NonAlphaNumericCharacters(ThenWhatTreeException):
 
     def __init__(self, field, my_string):
         self.message = "Field '" + field + "' should only contain alphanumeric characters or ' ' or '_':" + my_string + "\n"
+
+
+class ReadOnlyResultStore(ThenWhatTreeException):
+    """ Run added to a result store loaded from disk. """
+
+    def __init__(self, directory):
+        self.message = "Result store loaded from \'" + directory + "\' is read only"
+
+
+class NodeCancelled(ThenWhatTreeException):
+    """ Node evaluation cancelled because its timeout or the deadline of the run expired. """
+
+    def __init__(self, node):
+        self.message = node + " was cancelled"
+
+
+class BinaryTreeFormatError(ThenWhatTreeException):
+    """ File is not a binary tree written by write_binary_tree or is truncated. """
+
+    def __init__(self, binary_file, reason):
+        self.message = "\'" + binary_file + "\' is not a valid binary tree file: " + reason
@@ -0,0 +1,175 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Executors that evaluate() submits node evaluations to"""
+
+# Import built in modules
+import abc
+import collections
+import itertools
+import threading
+from concurrent.futures import Future
+
+# Import 3rd party modules
+
+# Import local modules
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+# num_workers -> WorkStealingExecutor shared by all evaluate() calls asking for that many workers
+_DEFAULT_EXECUTORS = {}
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+
+
+class TreeExecutor(abc.ABC):
+    """
+    Interface for the executors used to evaluate tree nodes.  An executor accepts callables
+    with submit() and returns a concurrent.futures.Future for each of them.
+    """
+
+    num_workers = 1
+
+    @abc.abstractmethod
+    def submit(self, fn, *args, **kwargs):
+        """
+        :param fn: callable to run
+        :return: concurrent.futures.Future of the result of fn(*args, **kwargs)
+        """
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class SerialExecutor(TreeExecutor):
+    """
+    Executor that runs every submitted callable immediately in the calling thread.  Useful
+    for debugging node libraries since exceptions and breakpoints stay in the main thread.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as inst:
+            future.set_exception(inst)
+        else:
+            future.set_result(result)
+        return future
+
+
+class WorkStealingExecutor(TreeExecutor):
+    """
+    Long lived pool of worker threads.  Every worker owns a deque of tasks.  Work submitted
+    from outside the pool is distributed round robin across the deques, work submitted by a
+    worker is pushed onto its own deque.  A worker pops from the tail of its own deque and,
+    when that is empty, steals from the head of the other workers' deques so that no worker
+    sits idle while another one has a backlog.
+    """
+
+    def __init__(self, num_workers):
+        if num_workers < 1:
+            raise ValueError('num_workers must be at least 1')
+        self.num_workers = num_workers
+        self._queues = [collections.deque() for _ in range(num_workers)]
+        self._tasks_available = threading.Semaphore(0)
+        self._next_queue = itertools.count()
+        self._local = threading.local()
+        self._shutdown = False
+        self._workers = []
+        for worker_index in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, args=(worker_index,),
+                                      name='ThenWhatTreeWorker-' + str(worker_index))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError('cannot submit to an executor after shutdown')
+        future = Future()
+        queue_index = getattr(self._local, 'worker_index', None)
+        if queue_index is None:
+            queue_index = next(self._next_queue) % self.num_workers
+        self._queues[queue_index].append((future, fn, args, kwargs))
+        self._tasks_available.release()
+        return future
+
+    def shutdown(self, wait=True):
+        self._shutdown = True
+        for _ in self._workers:
+            self._tasks_available.release()
+        if wait:
+            for worker in self._workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+
+    def _worker_loop(self, worker_index):
+        self._local.worker_index = worker_index
+        while True:
+            self._tasks_available.acquire()
+            task = self._get_task(worker_index)
+            if task is None:
+                return
+            _run_task(*task)
+
+    def _get_task(self, worker_index):
+        """
+        Every acquire of the semaphore is matched by exactly one queued task, so keep looking
+        until that task is found.  After shutdown the semaphore is released without a task and
+        an empty scan ends the worker.
+        """
+        while True:
+            try:
+                return self._queues[worker_index].pop()
+            except IndexError:
+                pass
+            for offset in range(1, self.num_workers):
+                try:
+                    return self._queues[(worker_index + offset) % self.num_workers].popleft()
+                except IndexError:
+                    pass
+            if self._shutdown:
+                return None
+
+
+def _run_task(future, fn, args, kwargs):
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException as inst:
+        future.set_exception(inst)
+    else:
+        future.set_result(result)
+
+
+def get_default_executor(num_workers):
+    """
+    Return the executor shared by all evaluate() calls in this process that ask for the same
+    number of workers.  One pool is kept per size and never shut down, so asking for another
+    size cannot break an evaluation still running on an existing pool.
+
+    :param num_workers: number of worker threads
+    :return: WorkStealingExecutor
+    """
+    with _DEFAULT_EXECUTOR_LOCK:
+        if num_workers not in _DEFAULT_EXECUTORS:
+            _DEFAULT_EXECUTORS[num_workers] = WorkStealingExecutor(num_workers)
+        return _DEFAULT_EXECUTORS[num_workers]
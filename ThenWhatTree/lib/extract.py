@@ -11,8 +11,8 @@ import os
 # Import 3rd party modules
 
 # Import local modules
-from ThenWhatTree.lib.evaluate import get_node_element, has_node_element, _create_element_with_text
-from ThenWhatTree.lib.exceptions import NoAttributeType, NoAttributeTypeName
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+from ThenWhatTree.lib.exceptions import NoAttributeTypeName
 
 # Module authorship metadata
 __author__ = "Erik W Berg"
@@ -27,37 +27,121 @@ __status__ = "Production"  # Prototype, Development, Production
 
 # Code starts here
 
-def extract(tree_element):
+# Sections of the extracted text, in order
+ANNOTATION = 'annotation'
+OUTPUT = 'output'
+EXCEPTIONS = 'exceptions'
+TRACEBACK = 'traceback'
+METRICS = 'metrics'
+_SECTION_HEADERS = [(OUTPUT, 'Node output:'), (EXCEPTIONS, 'Exceptions:'), (TRACEBACK, 'Exception traceback:')]
+
+
+def extract(tree_element, metrics=False):
     """
     Extract tree data and return a string
 
     :param tree_element: Root node instance of the tree_object
+    :param metrics: append the metrics of the evaluated nodes, slowest node first
     :return: string containing annotated tree, node output, exceptions
     """
+    return ''.join(iter_extract(tree_element, metrics))
+
+
+def write_extract(tree_element, output_file, metrics=False):
+    """
+    Write the text returned by extract to a file object as it is produced
+
+    :param tree_element: Root node instance of the tree_object
+    :param output_file: file object opened for writing text, e.g. sys.stdout
+    :param metrics: append the metrics of the evaluated nodes, slowest node first
+    :return: None
+    """
+    output_file.writelines(iter_extract(tree_element, metrics))
+
+
+def iter_extract(tree_element, metrics=False):
+    """
+    Generate the text returned by extract in pieces, visiting every node once.  The annotated
+    tree is generated during the visit; the lines of the other sections are kept until the
+    visit ends.
+
+    :param tree_element: Root node instance of the tree_object
+    :param metrics: append the metrics of the evaluated nodes, slowest node first
+    :return: generator of strings
+    """
     os.environ['PYTHONDONTWRITEBYTECODE'] = 'TRUE'
-    output = ""
-    tree_annotation = _get_tree_annotation(tree_element)
-    if len(tree_annotation) > 0:
-        output += tree_annotation
-    tree_output = _get_tree_output(tree_element)
-    if len(tree_output) > 0:
-        output += '\n'
-        output += 'Node output:\n'
-        output += '------------\n'
-        output += tree_output
-    tree_exceptions = _get_tree_exceptions(tree_element)
-    if len(tree_exceptions) > 0:
-        output += '\n'
-        output += 'Exceptions:\n'
-        output += '-----------\n'
-        output += tree_exceptions
-    tree_exception_tb = _get_tree_exception_tb(tree_element)
-    if len(tree_exception_tb) > 0:
-        output += '\n'
-        output += 'Exception traceback:\n'
-        output += '--------------------\n'
-        output += tree_exception_tb
-    return output
+    section_lines = {OUTPUT: [], EXCEPTIONS: [], TRACEBACK: [], METRICS: []}
+    for section, line in _iter_tree_lines(tree_element, metrics):
+        if section == ANNOTATION:
+            yield line
+        else:
+            section_lines[section].append(line)
+    for section, header in _SECTION_HEADERS:
+        if section_lines[section]:
+            yield '\n' + header + '\n' + '-' * len(header) + '\n'
+            yield from section_lines[section]
+    if section_lines[METRICS]:
+        yield '\nNode metrics:\n-------------\n'
+        yield _format_tree_metrics(section_lines[METRICS])
+
+
+def _iter_tree_lines(tree_element, metrics=False):
+    """
+    Visit the nodes depth first, in document order, and generate the lines of every section.
+    A node without a name is skipped with its subnodes.  The depth of every node is kept on the
+    stack of the visit and the tree is only read, so the same tree can be extracted any number
+    of times, also from several threads at once.
+
+    :param tree_element: Root node instance of the tree_object
+    :param metrics: also generate (METRICS, (name, NodeMetricsData)) for the evaluated nodes
+    :return: generator of (section, line)
+    """
+    # (element, depth, True if the element and all its ancestors are true)
+    stack = [(tree_element, 0, True)]
+    while stack:
+        elem, depth, ancestors_true = stack.pop()
+        fields, subnodes = _get_fields_and_subnodes(elem)
+        if 'name' not in fields:
+            continue
+        name = fields['name']
+        if 'exception' in fields:
+            yield ANNOTATION, ' ' * 4 * depth + name + ' : ' + str(fields['exception']) + '\n'
+        elif 'node_is_true' in fields:
+            index = '[' + str(_get_field(fields, 'index')) + '] ' if fields['node_is_true'] == 'true' else ''
+            yield ANNOTATION, ' ' * 4 * depth + index + name + ' : ' + str(fields['node_is_true']) + '\n'
+        is_output = ancestors_true and _get_field(fields, 'node_is_true') == 'true'
+        if is_output:
+            yield OUTPUT, '[' + str(_get_field(fields, 'index')) + '] ' + _get_field(fields, 'output') + '\n'
+        if 'exception' in fields:
+            yield EXCEPTIONS, name + ': ' + str(fields['exception']) + '\n'
+        if 'traceback' in fields:
+            yield TRACEBACK, name + ': ' + str(fields['traceback']) + '\n'
+        if metrics and isinstance(fields.get('metrics'), NodeMetricsData):
+            yield METRICS, (name, fields['metrics'])
+        for subnode in reversed(subnodes):
+            stack.append((subnode, depth + 1, is_output))
+
+
+def _get_fields_and_subnodes(tree_element):
+    """
+    :param tree_element: Element object from the ElementTree package
+    :return: dict of tag -> text of the first subelement with the tag, list of 'node' subelements
+    """
+    fields = {}
+    subnodes = []
+    for subelement in tree_element:
+        if subelement.tag == 'node':
+            subnodes.append(subelement)
+        elif subelement.tag not in fields:
+            fields[subelement.tag] = subelement.text
+    return fields, subnodes
+
+
+def _get_field(fields, tag):
+    try:
+        return fields[tag]
+    except KeyError:
+        raise NoAttributeTypeName(fields['name'], tag)
 
 
 def _get_tree_annotation(tree_element):
@@ -70,98 +154,91 @@ def _get_tree_annotation(tree_element):
 
     Returns:
         Text version of the decision tree"""
-
-    text_tree = ""
-    my_tree = _add_depth_attribute_to_xml(tree_element)
-    for elem in my_tree.iter('node'):
-        result, index = get_result_for_node(elem)
-        if result is not None:
-            text_tree += ' ' * 4 * int(elem.find('depth').text) + index + elem.find('name').text + ' : ' + str(
-                result) + '\n'
-    return text_tree
+    return _get_section(tree_element, ANNOTATION)
 
 
 def get_result_for_node(tree_element):
-    if tree_element.find('name') is None:
+    fields, subnodes = _get_fields_and_subnodes(tree_element)
+    if 'name' not in fields:
         return ''
     index = ''
-    if has_node_element(tree_element, 'exception'):
-        result = get_node_element(tree_element, 'exception')
-    elif has_node_element(tree_element, 'node_is_true'):
-        result = get_node_element(tree_element, 'node_is_true')
+    if 'exception' in fields:
+        result = fields['exception']
+    elif 'node_is_true' in fields:
+        result = fields['node_is_true']
         if result == 'true':
-            index = '[' + str(get_node_element(tree_element, 'index')) + '] '
+            index = '[' + str(_get_field(fields, 'index')) + '] '
     else:
         result = None
     return result, index
 
 
 def _get_tree_output(tree_element):
-    if tree_element.find('name') is None:
-        return ''
-    if get_node_element(tree_element, 'node_is_true') == 'true':
-        element_entry = '[' + str(get_node_element(tree_element, 'index')) + '] ' + get_node_element(tree_element, 'output') + '\n'
-        return element_entry + ''.join([_get_tree_output(subnode) for subnode in tree_element])
-    return ''
+    return _get_section(tree_element, OUTPUT)
 
 
 def _get_tree_exceptions(tree_element):
-    if tree_element.find('name') is None:
-        return ''
-    element_entry = ''
-    if has_node_element(tree_element, 'exception'):
-        node_exception = get_node_element(tree_element, 'exception')
-        element_entry = tree_element.find('name').text + ': ' + str(node_exception) + '\n'
-    return element_entry + ''.join([_get_tree_exceptions(subnode) for subnode in tree_element])
+    return _get_section(tree_element, EXCEPTIONS)
 
 
 def _get_tree_exception_tb(tree_element):
-    if tree_element.find('name') is None:
-        return ''
-    element_entry = ''
-    if has_node_element(tree_element, 'traceback'):
-        node_exception = get_node_element(tree_element, 'traceback')
-        element_entry = tree_element.find('name').text + ': ' + str(node_exception) + '\n'
-    return element_entry + ''.join([_get_tree_exception_tb(subnode) for subnode in tree_element])
+    return _get_section(tree_element, TRACEBACK)
 
 
-def _make_annotated_tree(tree_element, depth=0):
-    if get_node_element(tree_element, 'node_is_true') == 'true':
-        element_entry = ' ' * 4 * depth + '[' + str(
-            get_node_element(tree_element, 'index')) + '] ' + tree_element.find('name').text + ': True\n'
-        return element_entry + ''.join(
-            [_make_annotated_tree(subnode, depth + 1) for subnode in tree_element.findall('node')])
-    else:
-        entry_indent = ' ' * (4 * depth + len('[ ] '))
-        try:
-            get_node_element(tree_element, 'exception')
-        except (NoAttributeType, NoAttributeTypeName):
-            return entry_indent + tree_element.find('name').text + ': False\n'
-        return entry_indent + tree_element.find('name').text + ': Exception raised\n'
-
-
-def _add_depth_attribute_to_xml(tree_element):
+def _get_section(tree_element, section):
     """
+    :param tree_element: Root node instance of the tree_object
+    :param section: ANNOTATION, OUTPUT, EXCEPTIONS or TRACEBACK
+    :return: text of the section without its header
+    """
+    return ''.join(line for line_section, line in _iter_tree_lines(tree_element) if line_section == section)
 
-    Args:
-        tree_element:
-
-    Returns:
 
+def _get_tree_metrics(tree_element):
     """
-    depth = 0
-    _add_depth_attribute_to_element(tree_element, depth)
-    for child in tree_element:
-        _add_depth_to_sub_elements(child, depth + 1)
-    return tree_element
+    :param tree_element: Root node instance of the tree_object
+    :return: one line per evaluated node sorted by wall time, followed by the totals
+    """
+    return _format_tree_metrics([line for section, line in _iter_tree_lines(tree_element, metrics=True)
+                                 if section == METRICS])
 
 
-def _add_depth_to_sub_elements(element, depth):
-    _add_depth_attribute_to_element(element, depth)
-    for child in element.findall('node'):
-        _add_depth_to_sub_elements(child, depth + 1)
+def _format_tree_metrics(node_metrics):
+    """
+    :param node_metrics: list of (node name, NodeMetricsData)
+    :return: one line per node sorted by wall time, followed by the totals
+    """
+    if not node_metrics:
+        return ''
+    node_metrics = sorted(node_metrics, key=lambda entry: entry[1].wall_time or 0.0, reverse=True)
+    text_metrics = ''
+    for name, metrics in node_metrics:
+        text_metrics += name + ': wall ' + _format_seconds(metrics.wall_time) + ', cpu ' + \
+            _format_seconds(metrics.cpu_time) + ', queue ' + _format_seconds(metrics.queue_wait_time) + \
+            ', import ' + _format_seconds(metrics.import_time) + ', allocated ' + \
+            ('-' if metrics.allocated_memory is None else str(metrics.allocated_memory) + ' bytes') + \
+            ', thread ' + str(metrics.thread_id) + ', process ' + str(metrics.process_id) + '\n'
+    text_metrics += 'Total: ' + str(len(node_metrics)) + ' nodes'
+    for label, attribute in [('wall', 'wall_time'), ('cpu', 'cpu_time'), ('queue', 'queue_wait_time'),
+                             ('import', 'import_time')]:
+        text_metrics += ', ' + label + ' ' + _format_seconds(
+            sum(getattr(metrics, attribute) or 0.0 for name, metrics in node_metrics))
+    return text_metrics + '\n'
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    return '{:.6f}s'.format(seconds)
 
 
-def _add_depth_attribute_to_element(element, depth):
-    depth_element = _create_element_with_text('depth', depth)
-    element.append(depth_element)
+def _make_annotated_tree(tree_element, depth=0):
+    fields, subnodes = _get_fields_and_subnodes(tree_element)
+    if _get_field(fields, 'node_is_true') == 'true':
+        element_entry = ' ' * 4 * depth + '[' + str(_get_field(fields, 'index')) + '] ' + fields['name'] + ': True\n'
+        return element_entry + ''.join([_make_annotated_tree(subnode, depth + 1) for subnode in subnodes])
+    else:
+        entry_indent = ' ' * (4 * depth + len('[ ] '))
+        if 'exception' not in fields:
+            return entry_indent + fields['name'] + ': False\n'
+        return entry_indent + fields['name'] + ': Exception raised\n'
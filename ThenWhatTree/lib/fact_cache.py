@@ -0,0 +1,100 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Cache of the facts computed by the nodes during one evaluation of a tree"""
+
+# Import built in modules
+import collections
+import threading
+
+# Import 3rd party modules
+
+# Import local modules
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+MAX_FACTS = 1024
+
+
+class _KeyLock(object):
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class FactCache(object):
+    """
+    Memoised results of keyed calls, shared by all the nodes of one evaluation.  Concurrent
+    requests for the same key wait for the first one instead of computing the fact again.
+    The least recently used facts are evicted once more than max_size facts are cached.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = MAX_FACTS if max_size is None else max_size
+        self.hits = 0
+        self.misses = 0
+        self._facts = collections.OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute, *args, **kwargs):
+        """
+        Return the fact for key, calling compute(*args, **kwargs) if it is not cached yet.
+        Exceptions raised by compute are not cached.
+
+        :param key: hashable key of the fact
+        :param compute: callable computing the fact
+        :return: fact
+        """
+        with self._lock:
+            if key in self._facts:
+                return self._get_cached(key)
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = _KeyLock()
+            key_lock.users += 1
+        try:
+            with key_lock.lock:
+                with self._lock:
+                    if key in self._facts:
+                        return self._get_cached(key)
+                fact = compute(*args, **kwargs)
+                with self._lock:
+                    self.misses += 1
+                    self._facts[key] = fact
+                    while len(self._facts) > self.max_size:
+                        self._facts.popitem(last=False)
+                return fact
+        finally:
+            with self._lock:
+                key_lock.users -= 1
+                if key_lock.users == 0:
+                    del self._key_locks[key]
+
+    def _get_cached(self, key):
+        self.hits += 1
+        self._facts.move_to_end(key)
+        return self._facts[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._facts
+
+    def __len__(self):
+        return len(self._facts)
+
+    def clear(self):
+        with self._lock:
+            self._facts.clear()
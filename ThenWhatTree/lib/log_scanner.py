@@ -0,0 +1,235 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Scan a log once for the regular expressions of all the nodes of a tree.  The log is memory
+mapped and a single combined expression finds the lines that match any pattern; only those
+lines are matched against the individual patterns.
+"""
+
+# Import built in modules
+import ast
+import collections
+import heapq
+import importlib.util
+import mmap
+import os
+import re
+import threading
+
+# Import 3rd party modules
+
+# Import local modules
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+LogMatch = collections.namedtuple('LogMatch', ['line_number', 'line', 'groups'])
+
+_REGISTERED_PATTERNS = set()
+_REGISTERED_PATTERNS_LOCK = threading.Lock()
+# module name -> ((file path, modification time, size), frozenset of declared patterns)
+_MODULE_PATTERNS = {}
+_DEFAULT_FLAGS = re.compile(b'').flags
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def register_log_patterns(*patterns):
+    """
+    Register patterns to be scanned for in every log, in addition to the 'log_patterns'
+    declared by the nodes of the tree being evaluated
+
+    :param patterns: regular expression strings
+    :return: None
+    """
+    with _REGISTERED_PATTERNS_LOCK:
+        _REGISTERED_PATTERNS.update(patterns)
+
+
+def get_log_patterns(node_classes, module_names=()):
+    """
+    :param node_classes: iterable of ThenWhatTreeNode subclasses
+    :param module_names: iterable of node module names, read with get_module_log_patterns
+    :return: frozenset of the registered patterns, the 'log_patterns' of the node_classes and
+             the patterns declared in the modules.  Patterns that do not compile are left out,
+             so they only fail the node that scans for them on its own.
+    """
+    with _REGISTERED_PATTERNS_LOCK:
+        patterns = set(_REGISTERED_PATTERNS)
+    for node_class in node_classes:
+        patterns.update(node_class.log_patterns)
+    for module_name in module_names:
+        patterns.update(get_module_log_patterns(module_name))
+    return frozenset(pattern for pattern in patterns if _is_valid_pattern(pattern))
+
+
+def _is_valid_pattern(pattern):
+    try:
+        re.compile(pattern.encode())
+    except (re.error, AttributeError):
+        return False
+    return True
+
+
+def get_module_log_patterns(module_name):
+    """
+    Patterns assigned as a literal to 'log_patterns' in the classes of a node module, read from
+    its source without importing it, so nodes that are never evaluated are never imported.
+    Patterns computed at run time or inherited from another module are not found; they are
+    scanned for on their own when asked for.
+
+    :param module_name: name of a top level module on sys.path
+    :return: frozenset of patterns
+    """
+    module_file = find_module_file(module_name)
+    if module_file is None:
+        return frozenset()
+    try:
+        file_stat = os.stat(module_file)
+    except OSError:
+        return frozenset()
+    stamp = (module_file, file_stat.st_mtime_ns, file_stat.st_size)
+    cache_entry = _MODULE_PATTERNS.get(module_name)
+    if cache_entry is not None and cache_entry[0] == stamp:
+        return cache_entry[1]
+    patterns = _read_log_patterns(module_file)
+    _MODULE_PATTERNS[module_name] = (stamp, patterns)
+    return patterns
+
+
+def find_module_file(module_name):
+    """
+    :param module_name: name of a top level module on sys.path
+    :return: path of the source file of the module, found without importing it, or None
+    """
+    if not module_name or '.' in module_name:
+        return None
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    module_file = getattr(spec, 'origin', None)
+    if module_file is None or not module_file.endswith('.py'):
+        return None
+    return module_file
+
+
+def _read_log_patterns(module_file):
+    """
+    :param module_file: path of a python source file
+    :return: frozenset of the strings in the literal 'log_patterns' assignments of its classes
+    """
+    try:
+        with open(module_file, 'rb') as source_file:
+            module_tree = ast.parse(source_file.read(), module_file)
+    except (OSError, SyntaxError, ValueError):
+        return frozenset()
+    patterns = set()
+    for class_def in ast.walk(module_tree):
+        if not isinstance(class_def, ast.ClassDef):
+            continue
+        for statement in class_def.body:
+            if not (isinstance(statement, ast.Assign) and
+                    any(isinstance(target, ast.Name) and target.id == 'log_patterns' for target in statement.targets)):
+                continue
+            try:
+                value = ast.literal_eval(statement.value)
+            except (ValueError, TypeError):
+                continue
+            if isinstance(value, (tuple, list, set, frozenset)):
+                patterns.update(pattern for pattern in value if isinstance(pattern, str))
+    return frozenset(patterns)
+
+
+def scan_log(log_file, patterns):
+    """
+    Find every line of log_file matching each of the patterns in one pass over the file.
+    Patterns are matched within a single line.  The plain patterns are combined into one
+    expression to find the candidate lines; patterns with named groups, global inline flags
+    such as '(?i)' or backreferences cannot be combined and look for their lines on their own.
+
+    :param log_file: path of the log
+    :param patterns: iterable of regular expression strings
+    :return: dict of pattern -> list of LogMatch, in the order of the lines
+    """
+    patterns = list(patterns)
+    matches = {pattern: [] for pattern in patterns}
+    if not patterns:
+        return matches
+    compiled_patterns = [(pattern, re.compile(pattern.encode())) for pattern in patterns]
+    with open(log_file, 'rb') as log:
+        try:
+            log_map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return matches
+    with log_map:
+        line_number = 1
+        counted_to = 0
+        previous_line_start = -1
+        matching_lines = [_iter_matching_lines(log_map, line_pattern)
+                          for line_pattern in _get_line_patterns(compiled_patterns)]
+        for line_start, line_end in heapq.merge(*matching_lines):
+            if line_start == previous_line_start:
+                continue
+            previous_line_start = line_start
+            line_number += log_map[counted_to:line_start].count(b'\n')
+            counted_to = line_start
+            line = log_map[line_start:line_end]
+            for pattern, compiled_pattern in compiled_patterns:
+                for match in compiled_pattern.finditer(line):
+                    matches[pattern].append(LogMatch(line_number, line.decode(errors='replace'),
+                                                     tuple(_decode(group) for group in match.groups())))
+    return matches
+
+
+def _get_line_patterns(compiled_patterns):
+    """
+    :param compiled_patterns: list of (pattern, compiled pattern)
+    :return: list of compiled expressions that together match every line matched by a pattern:
+             one combining the plain patterns and one per pattern that cannot be combined
+    """
+    plain_patterns = []
+    line_patterns = []
+    for pattern, compiled_pattern in compiled_patterns:
+        if compiled_pattern.groupindex or compiled_pattern.flags != _DEFAULT_FLAGS or \
+                _BACKREFERENCE.search(pattern):
+            line_patterns.append(re.compile(pattern.encode(), re.MULTILINE))
+        else:
+            plain_patterns.append(pattern)
+    if plain_patterns:
+        line_patterns.append(re.compile(b'|'.join(b'(?:' + pattern.encode() + b')' for pattern in plain_patterns),
+                                        re.MULTILINE))
+    return line_patterns
+
+
+def _iter_matching_lines(log_map, line_pattern):
+    """
+    :param log_map: mmap of the log
+    :param line_pattern: compiled expression from _get_line_patterns
+    :return: generator of (start, end) of the lines with a match, in the order of the lines
+    """
+    position = 0
+    while True:
+        line_match = line_pattern.search(log_map, position)
+        if line_match is None:
+            return
+        line_start = log_map.rfind(b'\n', 0, line_match.start()) + 1
+        line_end = log_map.find(b'\n', line_match.start())
+        if line_end == -1:
+            line_end = len(log_map)
+        yield line_start, line_end
+        position = line_end + 1
+
+
+def _decode(group):
+    return None if group is None else group.decode(errors='replace')
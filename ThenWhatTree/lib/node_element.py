@@ -0,0 +1,276 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Accessors for the fields and branch elements of a node.  A node is either a CompiledNode or
+an Element object from the ElementTree package.  Element objects get an ElementIndex so that
+every lookup is a dictionary access instead of a scan of the subelements.
+"""
+
+# Import built in modules
+import weakref
+# noinspection PyPep8Naming
+from xml.etree import ElementTree as ET
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.compiled_tree import CompiledNode, get_element_branch_context
+from ThenWhatTree.lib.exceptions import NoAttributeTypeName, BranchElementError
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+_ELEMENT_INDEXES = weakref.WeakKeyDictionary()
+
+
+class ElementIndex(object):
+    """
+    Index of the subelements of an Element object.
+
+    fields: tag -> first subelement with that tag
+    branch: key -> first 'branch' subelement with that attribute
+    size:   number of subelements when the index was built
+    last:   last subelement when the index was built, or None
+    """
+
+    __slots__ = ('fields', 'branch', 'size', 'last')
+
+    def __init__(self, tree_element):
+        self.fields = {}
+        self.branch = {}
+        self.size = len(tree_element)
+        self.last = tree_element[-1] if self.size else None
+        for subelement in tree_element:
+            self._add(subelement)
+
+    def is_stale(self, tree_element):
+        """
+        :param tree_element: Element object the index was built for
+        :return: bool; True if the number of subelements or the last subelement changed
+        """
+        size = len(tree_element)
+        return size != self.size or (size > 0 and tree_element[-1] is not self.last)
+
+    def _add(self, subelement):
+        self.fields.setdefault(subelement.tag, subelement)
+        if subelement.tag == 'branch':
+            for key in subelement.keys():
+                self.branch.setdefault(key, subelement)
+
+
+def get_element_index(tree_element):
+    """
+    Return the ElementIndex of the tree_element.  The index is kept in sync by the functions
+    of this module.  It is rebuilt when other code changes the number of subelements or the
+    last subelement, e.g. by appending, removing, or replacing the last subelement.
+
+    :param tree_element: Element object from the ElementTree package
+    :return: ElementIndex
+    """
+    element_index = _ELEMENT_INDEXES.get(tree_element)
+    if element_index is None or element_index.is_stale(tree_element):
+        element_index = ElementIndex(tree_element)
+        _ELEMENT_INDEXES[tree_element] = element_index
+    return element_index
+
+
+def _append_subelement(tree_element, subelement):
+    """
+    Append the subelement to the tree_element and add it to the index
+
+    :param tree_element: Element object from the ElementTree package
+    :param subelement: Element object from the ElementTree package
+    :return: None
+    """
+    element_index = get_element_index(tree_element)
+    tree_element.append(subelement)
+    element_index._add(subelement)
+    element_index.size += 1
+    element_index.last = subelement
+
+
+def _get_node_name(tree_element):
+    """
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :return: text of the 'name' subelement
+    """
+    if isinstance(tree_element, CompiledNode):
+        return tree_element.name
+    return tree_element.find('name').text
+
+
+def _create_element_with_text(element_tag, element_text):
+    """
+    Function to create a new ElementTree Element with a text field
+
+    :param element_tag: tag field in the Element
+    :param element_text: text for the specified tag field
+    :return: ElementTree Element
+    """
+    new_element = ET.Element(element_tag)
+    new_element.text = element_text
+    return new_element
+
+
+def _create_element_with_attribute(element_tag, key, value):
+    """
+    Function to create a new ElementTree Element with an attribute
+
+    :param element_tag: tag field in the Element
+    :param key: attribute key
+    :param value: attribute value
+    :return: ElementTree Element
+    """
+    new_element = ET.Element(element_tag)
+    new_element.set(key, value)
+    return new_element
+
+
+def set_node_element(tree_element, tag, text, value=None):
+    """
+    Set the text of the subelement with the specified tag, creating it if needed.  For
+    backwards compatibility, passing a value sets the branch element 'text' to 'value'
+    (see set_branch_element).
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param tag: element name to be set in tree_element
+    :param text: value for subelement
+    :param value: value for the branch element
+    :return: None
+    """
+    if value is not None:
+        set_branch_element(tree_element, text, value)
+        return
+    if isinstance(tree_element, CompiledNode):
+        tree_element.fields[tag] = text
+        return
+    existing_element = get_element_index(tree_element).fields.get(tag)
+    if existing_element is not None:
+        existing_element.text = text
+    else:
+        _append_subelement(tree_element, _create_element_with_text(tag, text))
+
+
+def has_node_element(tree_element, tag):
+    """
+    Function to test if a tree_element has a subelement with the specified tag
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param tag: subelement being searched for
+    :return: bool
+    """
+    if isinstance(tree_element, CompiledNode):
+        return tag in tree_element.fields
+    return tag in get_element_index(tree_element).fields
+
+
+def get_node_element(tree_element, tag, key=None):
+    """
+    Return the text of the subelement with the specified tag.  For backwards compatibility,
+    passing a key returns the branch element 'key' (see get_branch_element).
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param tag: subelement of the tree_element
+    :param key: key for value to be returned from the 'branch' subelements
+    :return: either text from the element or value from the attribute
+    """
+    if key:
+        return get_branch_element(tree_element, key)
+    if isinstance(tree_element, CompiledNode):
+        try:
+            return tree_element.fields[tag]
+        except KeyError:
+            raise NoAttributeTypeName(tree_element.name, tag)
+    existing_element = get_element_index(tree_element).fields.get(tag)
+    if existing_element is None:
+        raise NoAttributeTypeName(_get_node_name(tree_element), tag)
+    return existing_element.text
+
+
+def set_branch_element(tree_element, key, value):
+    """
+    Set a branch element, the key-value pairs passed from a node to its subnodes
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param key: branch element key
+    :param value: branch element value
+    :return: None
+    """
+    if isinstance(tree_element, CompiledNode):
+        tree_element.branch[key] = value
+        return
+    existing_element = get_element_index(tree_element).branch.get(key)
+    if existing_element is not None:
+        existing_element.set(key, value)
+    else:
+        _append_subelement(tree_element, _create_element_with_attribute('branch', key, value))
+
+
+def get_branch_element(tree_element, key):
+    """
+    Return a branch element set by the node or passed down by one of its ancestors.  For
+    Element objects materialised from a CompiledTree, branch elements that are not in the
+    element itself are looked up in the BranchContext of its parent.
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param key: branch element key
+    :return: branch element value
+    """
+    if isinstance(tree_element, CompiledNode):
+        try:
+            return tree_element.branch[key]
+        except KeyError:
+            raise BranchElementError(tree_element.name, key)
+    existing_element = get_element_index(tree_element).branch.get(key)
+    if existing_element is not None:
+        return existing_element.get(key)
+    branch_context = get_element_branch_context(tree_element)
+    if branch_context is not None and branch_context.parent is not None:
+        try:
+            return branch_context.parent[key]
+        except KeyError:
+            pass
+    raise BranchElementError(_get_node_name(tree_element), key)
+
+
+def get_branch_elements(tree_element):
+    """
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :return: dict of all branch elements of the tree_element, including the inherited ones
+    """
+    if isinstance(tree_element, CompiledNode):
+        return dict(tree_element.branch.items())
+    branch_elements = {}
+    branch_context = get_element_branch_context(tree_element)
+    if branch_context is not None and branch_context.parent is not None:
+        branch_elements.update(branch_context.parent.items())
+    for key, branch_element in get_element_index(tree_element).branch.items():
+        branch_elements[key] = branch_element.get(key)
+    return branch_elements
+
+
+def set_branch_elements_in_children(tree_element, subnode):
+    """
+    Function to identify and pass all the 'branch' elements of the tree_element to
+    its children.  A CompiledNode is not copied into; the BranchContext of the subnode
+    is chained to the BranchContext of the tree_element instead.
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param subnode: Element object from the ElementTree package or CompiledNode
+    :return: None
+    """
+    if isinstance(subnode, CompiledNode):
+        subnode.branch.parent = tree_element.branch
+        return
+    for key, value in get_branch_elements(tree_element).items():
+        set_branch_element(subnode, key, value)
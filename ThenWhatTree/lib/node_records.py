@@ -0,0 +1,156 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Results of the evaluated nodes as flat records, written as NDJSON while the tree is evaluated
+or as a JSON array once it is evaluated
+"""
+
+# Import built in modules
+import json
+import threading
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.compiled_tree import CompiledNode
+from ThenWhatTree.lib.extract import _get_fields_and_subnodes
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+PATH_SEPARATOR = '/'
+# record key -> NodeMetricsData attribute
+TIMING_KEYS = [('wall_time', 'wall_time'), ('cpu_time', 'cpu_time'), ('queue_wait_time', 'queue_wait_time'),
+               ('import_time', 'import_time')]
+_SEPARATORS = (',', ':')
+
+
+def get_node_record(tree_element, path=None, with_index=True):
+    """
+    Record of an evaluated node: its name, the names from the root to the node joined by '/',
+    'node_is_true' ('true', 'false' or 'timeout'), the hint index or None if the node has none,
+    the output and exception as strings or None, and the times in seconds from its metrics.
+
+    :param tree_element: CompiledNode or Element object from the ElementTree package
+    :param path: path of an Element object; the path of a CompiledNode is found from the tree
+    :param with_index: include the hint index; hint indexes are assigned once the tree is
+                       evaluated, so the records passed to on_node_evaluated leave it out
+    :return: dict
+    """
+    if isinstance(tree_element, CompiledNode):
+        fields = tree_element.fields
+        path = _get_compiled_node_path(tree_element)
+    else:
+        fields = _get_fields_and_subnodes(tree_element)[0]
+    record = {'name': fields.get('name'), 'path': path or fields.get('name'),
+              'node_is_true': _get_text(fields.get('node_is_true'))}
+    if with_index:
+        index = fields.get('index')
+        record['index'] = None if index is None else int(index)
+    record['output'] = _get_text(fields.get('output'))
+    record['exception'] = _get_text(fields.get('exception'))
+    metrics = fields.get('metrics')
+    for key, attribute in TIMING_KEYS:
+        record[key] = getattr(metrics, attribute) if isinstance(metrics, NodeMetricsData) else None
+    return record
+
+
+def _get_compiled_node_path(tree_element):
+    names = []
+    nodes = tree_element.tree.nodes
+    node = tree_element
+    while True:
+        names.append(node.name)
+        if node.parent == -1:
+            break
+        node = nodes[node.parent]
+    return PATH_SEPARATOR.join(reversed(names))
+
+
+def _get_text(value):
+    return None if value is None else str(value)
+
+
+def iter_node_records(tree_element):
+    """
+    :param tree_element: Root node instance of the tree_object
+    :return: generator of the records of the evaluated nodes, depth first in document order
+    """
+    stack = [(tree_element, None)]
+    while stack:
+        elem, parent_path = stack.pop()
+        fields, subnodes = _get_fields_and_subnodes(elem)
+        if 'name' not in fields:
+            continue
+        path = fields['name'] if parent_path is None else parent_path + PATH_SEPARATOR + fields['name']
+        if 'node_is_true' in fields or 'exception' in fields:
+            yield get_node_record(elem, path)
+        stack.extend((subnode, path) for subnode in reversed(subnodes))
+
+
+def dump_node_record(record):
+    """
+    :param record: dict from get_node_record
+    :return: compact JSON string of the record
+    """
+    return json.dumps(record, separators=_SEPARATORS, default=str)
+
+
+class NdjsonWriter(object):
+    """
+    Callback for on_node_evaluated writing every record to a file object as one line of JSON,
+    flushed at once so readers can consume the records while the tree is evaluated.  Nodes are
+    evaluated by several threads, so the lines are written under a lock.
+    """
+
+    def __init__(self, output_file):
+        """
+        :param output_file: file object opened for writing text, e.g. sys.stdout
+        """
+        self.output_file = output_file
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = dump_node_record(record) + '\n'
+        with self._lock:
+            self.output_file.write(line)
+            self.output_file.flush()
+            self.count += 1
+
+
+def write_ndjson(tree_element, output_file):
+    """
+    Write the records of an evaluated tree as NDJSON, one line per node
+
+    :param tree_element: Root node instance of the tree_object
+    :param output_file: file object opened for writing text
+    :return: None
+    """
+    output_file.writelines(dump_node_record(record) + '\n' for record in iter_node_records(tree_element))
+
+
+def write_json(tree_element, output_file):
+    """
+    Write the records of an evaluated tree as a JSON array, one record per line
+
+    :param tree_element: Root node instance of the tree_object
+    :param output_file: file object opened for writing text
+    :return: None
+    """
+    separator = '[\n'
+    for record in iter_node_records(tree_element):
+        output_file.write(separator + dump_node_record(record))
+        separator = ',\n'
+    output_file.write('[]\n' if separator == '[\n' else '\n]\n')
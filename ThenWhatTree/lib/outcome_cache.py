@@ -0,0 +1,229 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+On-disk cache of node outcomes shared by evaluations.  A node is not evaluated again while
+its module, its fields, the branch elements passed to it and the input files it declares are
+unchanged.
+"""
+
+# Import built in modules
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Fields written by the evaluation; they are not part of the key
+RESULT_TAGS = frozenset(['node_is_true', 'output', 'exception', 'traceback', 'index', 'metrics', 'profile'])
+# Fields stored with the outcome
+OUTCOME_TAGS = frozenset(['node_is_true', 'output', 'exception', 'traceback'])
+_PLAIN_TYPES = (str, int, float, bool, bytes, type(None))
+_FILE_HASHES = {}
+_FILE_HASHES_LOCK = threading.Lock()
+
+
+class OutcomeCache(object):
+    """
+    sqlite database of node outcomes.  The least recently used outcomes are deleted once the
+    outcomes take more than max_bytes.  Outcomes of nodes that raised an exception are not
+    stored unless cache_exceptions is set.
+
+    The outcomes are pickled, and unpickling can run arbitrary code: only open cache files
+    that are written by trusted evaluations and that nobody else can write to.
+    """
+
+    def __init__(self, path, max_bytes=MAX_CACHE_BYTES, cache_exceptions=False):
+        """
+        :param path: sqlite database file, created if needed; ':memory:' for a cache that is not persisted
+        :param max_bytes: maximum total size of the stored outcomes
+        :param cache_exceptions: also store the outcomes of nodes that raised an exception
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.cache_exceptions = cache_exceptions
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS outcomes '
+                                     '(key TEXT PRIMARY KEY, outcome BLOB, size INTEGER, last_used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS outcomes_last_used ON outcomes (last_used)')
+            # Running total of the size column, kept by triggers in the transaction that changes
+            # the outcomes, so it stays right when several processes share the file and storing
+            # an outcome does not sum the whole table
+            self._connection.execute('CREATE TABLE IF NOT EXISTS totals (total_bytes INTEGER)')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS outcomes_insert AFTER INSERT ON outcomes '
+                                     'BEGIN UPDATE totals SET total_bytes = total_bytes + NEW.size; END')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS outcomes_delete AFTER DELETE ON outcomes '
+                                     'BEGIN UPDATE totals SET total_bytes = total_bytes - OLD.size; END')
+            self._connection.execute('INSERT INTO totals SELECT COALESCE(SUM(size), 0) FROM outcomes '
+                                     'WHERE NOT EXISTS (SELECT * FROM totals)')
+
+    def get_key(self, tree_element, node_class):
+        """
+        :param tree_element: CompiledNode about to be evaluated
+        :param node_class: subclass of ThenWhatTreeNode for tree_element
+        :return: key of the outcome or None if the node cannot be cached
+        """
+        if not node_class.cache_outcome:
+            return None
+        fields = sorted((tag, text) for tag, text in tree_element.fields.items() if tag not in RESULT_TAGS)
+        branch_elements = sorted(tree_element.branch.items())
+        try:
+            input_files = [_get_file_fingerprint(input_file)
+                           for input_file in node_class(tree_element).get_input_files()]
+            module_hash = _get_module_hash(node_class)
+        except OSError:
+            return None
+        key_parts = _get_plain_repr((module_hash, fields, branch_elements, input_files))
+        if key_parts is None:
+            return None
+        return hashlib.sha256(key_parts.encode()).hexdigest()
+
+    def restore(self, key, tree_element):
+        """
+        Copy a stored outcome into the tree_element
+
+        :param key: key from get_key
+        :param tree_element: CompiledNode
+        :return: bool; False if there is no outcome for the key
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT outcome FROM outcomes WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+            with self._connection:
+                self._connection.execute('UPDATE outcomes SET last_used = ? WHERE key = ?', (time.time(), key))
+        fields, branch_elements = pickle.loads(row[0])
+        tree_element.fields.update(fields)
+        tree_element.branch.update(branch_elements)
+        return True
+
+    def store(self, key, tree_element):
+        """
+        Store the outcome of an evaluated tree_element: the fields written by the evaluation
+        and the branch elements set by the node.  Outcomes that cannot be pickled, and outcomes
+        with an exception unless cache_exceptions is set, are not stored.
+
+        :param key: key from get_key
+        :param tree_element: evaluated CompiledNode
+        :return: None
+        """
+        fields = {tag: text for tag, text in tree_element.fields.items() if tag in OUTCOME_TAGS}
+        if 'exception' in fields and not self.cache_exceptions:
+            return
+        try:
+            outcome = pickle.dumps((fields, dict(tree_element.branch.values)))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        with self._lock, self._connection:
+            # the DELETE starts the write transaction; a replaced outcome goes through the
+            # delete trigger, which INSERT OR REPLACE would skip
+            self._connection.execute('DELETE FROM outcomes WHERE key = ?', (key,))
+            self._connection.execute('INSERT INTO outcomes VALUES (?, ?, ?, ?)',
+                                     (key, outcome, len(outcome), time.time()))
+            total_bytes = self._get_total_bytes()
+            if total_bytes > self.max_bytes:
+                self._evict(total_bytes)
+
+    def _get_total_bytes(self):
+        """
+        :return: total size of the stored outcomes, including those stored by other processes
+        """
+        return self._connection.execute('SELECT total_bytes FROM totals').fetchone()[0]
+
+    def _evict(self, total_bytes):
+        """
+        Delete the least recently used outcomes until the outcomes fit in max_bytes.  Called in
+        the write transaction of store, so no other process changes the outcomes meanwhile.
+
+        :param total_bytes: current total size of the stored outcomes
+        """
+        rows = self._connection.execute('SELECT key, size FROM outcomes ORDER BY last_used')
+        evicted_keys = []
+        for key, size in rows:
+            if total_bytes <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total_bytes -= size
+        self._connection.executemany('DELETE FROM outcomes WHERE key = ?', evicted_keys)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM outcomes').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def _get_plain_repr(value):
+    """
+    Deterministic repr of strings, numbers and containers of them
+
+    :param value: object
+    :return: string or None if value contains any other type
+    """
+    if isinstance(value, _PLAIN_TYPES):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        items = [_get_plain_repr(item) for item in value]
+        if None in items:
+            return None
+        return '(' + ', '.join(items) + ')'
+    if isinstance(value, dict):
+        return _get_plain_repr(sorted(value.items(), key=repr))
+    return None
+
+
+def _get_file_fingerprint(file_path):
+    """
+    :param file_path: path of an input file
+    :return: (absolute path, size, sha256 of the content); the hash is reused while the size
+             and modification time do not change
+    """
+    file_path = os.path.abspath(file_path)
+    file_stat = os.stat(file_path)
+    stamp = (file_path, file_stat.st_size, file_stat.st_mtime_ns)
+    with _FILE_HASHES_LOCK:
+        file_hash = _FILE_HASHES.get(stamp)
+    if file_hash is None:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as input_file:
+            for block in iter(lambda: input_file.read(1024 * 1024), b''):
+                sha256.update(block)
+        file_hash = sha256.hexdigest()
+        with _FILE_HASHES_LOCK:
+            _FILE_HASHES[stamp] = file_hash
+    return file_path, file_stat.st_size, file_hash
+
+
+def _get_module_hash(node_class):
+    """
+    :param node_class: subclass of ThenWhatTreeNode
+    :return: sha256 of the source file of the node module
+    """
+    return _get_file_fingerprint(inspect.getfile(node_class))[2]
@@ -0,0 +1,199 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Evaluate CPU bound nodes in worker processes so they are not serialised by the GIL"""
+
+# Import built in modules
+import inspect
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.cancellation import _get_wait_time
+from ThenWhatTree.lib.compiled_tree import CompiledTree
+from ThenWhatTree.lib.evaluate import _get_node_instance, _get_num_workers, _set_node_timeout
+from ThenWhatTree.lib.node_element import set_node_element, set_branch_element
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+_DEFAULT_PROCESS_POOL = None
+_DEFAULT_PROCESS_POOL_LOCK = threading.Lock()
+_PICKLING_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+
+
+def get_default_process_pool():
+    """
+    Return the process pool shared by all evaluations in this process.  Workers are started
+    with 'spawn' since the parent process already runs the evaluation threads.
+
+    :return: ProcessPoolExecutor
+    """
+    global _DEFAULT_PROCESS_POOL
+    with _DEFAULT_PROCESS_POOL_LOCK:
+        if _DEFAULT_PROCESS_POOL is None:
+            _DEFAULT_PROCESS_POOL = ProcessPoolExecutor(max_workers=_get_num_workers(None),
+                                                        mp_context=multiprocessing.get_context('spawn'))
+        return _DEFAULT_PROCESS_POOL
+
+
+def evaluate_tree_element_in_process(tree_element, node_class, process_pool=None, cancellation_token=None):
+    """
+    Ship the name, fields and branch elements of the tree_element to a worker process, evaluate
+    the node there and merge 'node_is_true', 'output', 'exception', 'traceback', any other
+    field set by the node and the new branch elements back into the tree_element.  Branch
+    elements cross the process boundary by pickling, so the worker sees a copy instead of the
+    object the ancestor set.  A node whose branch elements, or whose results, cannot be pickled
+    is recorded with the pickling error as its exception.
+
+    A node with a cancellation_token runs in a process of its own instead of the pool, and the
+    process is terminated if the token is cancelled before the node finishes, so a hung node
+    does not hold a worker of the pool for the rest of the run, and the node is recorded as
+    'timeout'.
+
+    :param tree_element: CompiledNode
+    :param node_class: subclass of ThenWhatTreeNode for tree_element, already imported
+    :param process_pool: ProcessPoolExecutor; defaults to the shared pool
+    :param cancellation_token: CancellationToken of a node with a timeout or run deadline, or None
+    :return: None
+    """
+    lib_path = os.path.dirname(os.path.abspath(inspect.getfile(node_class)))
+    fields, branch_elements = _get_element_fields(tree_element)
+    try:
+        payload = pickle.dumps((fields, branch_elements))
+    except _PICKLING_ERRORS as inst:
+        _set_node_exception(tree_element, node_class, inst)
+        return
+    if cancellation_token is None:
+        if process_pool is None:
+            process_pool = get_default_process_pool()
+        result = process_pool.submit(_evaluate_in_worker, lib_path, payload).result()
+    else:
+        start_time = time.perf_counter()
+        result = _evaluate_in_own_process(lib_path, payload, cancellation_token)
+        if result is None:
+            _set_node_timeout(tree_element, time.perf_counter() - start_time)
+            return
+    new_fields, new_branch_elements = pickle.loads(result)
+    fields = dict(fields)
+    branch_elements = dict(branch_elements)
+    for tag, text in new_fields:
+        if tag not in fields or not _is_equal(fields[tag], text):
+            set_node_element(tree_element, tag, text)
+    for key, value in new_branch_elements:
+        if key not in branch_elements or not _is_equal(branch_elements[key], value):
+            set_branch_element(tree_element, key, value)
+
+
+def _evaluate_in_own_process(lib_path, payload, cancellation_token):
+    """
+    :param lib_path: directory of the node library
+    :param payload: pickled fields and branch elements
+    :param cancellation_token: CancellationToken of the node
+    :return: pickled result of _evaluate_in_worker or None if the token was cancelled first
+    """
+    context = multiprocessing.get_context('spawn')
+    reader, writer = context.Pipe(duplex=False)
+    process = context.Process(target=_evaluate_in_worker_process, args=(writer, lib_path, payload), daemon=True)
+    process.start()
+    writer.close()
+    try:
+        while not reader.poll(_get_wait_time(cancellation_token.get_remaining_time(), None)):
+            if cancellation_token.cancelled:
+                process.terminate()
+                return None
+        return reader.recv_bytes()
+    finally:
+        reader.close()
+        process.join()
+
+
+def _set_node_exception(tree_element, node_class, inst):
+    """
+    Record inst as the exception of the node.  Must be called from the 'except' clause.
+
+    :param tree_element: CompiledNode
+    :param node_class: subclass of ThenWhatTreeNode for tree_element
+    :param inst: exception
+    :return: None
+    """
+    node_instance = node_class(tree_element)
+    node_instance.set_element('node_is_true', node_instance.set_is_true_exception(inst))
+
+
+def _is_equal(old_value, new_value):
+    """
+    Compare two branch element values.  Values that do not compare to a single bool, e.g.
+    NumPy arrays, are treated as changed.
+
+    :param old_value: value sent to the worker process
+    :param new_value: value returned by the worker process
+    :return: bool
+    """
+    try:
+        return bool(old_value == new_value)
+    except Exception:
+        return False
+
+
+def _get_element_fields(tree_element):
+    """
+    Copy the fields and branch elements of a tree_element into picklable lists
+
+    :param tree_element: CompiledNode
+    :return: list of (tag, text) and list of (branch key, branch value)
+    """
+    return list(tree_element.fields.items()), tree_element.branch.items()
+
+
+def _evaluate_in_worker(lib_path, payload):
+    """
+    Runs in the worker process.  Rebuild the tree_element, evaluate its node and return its
+    fields.  If the branch elements set by the node cannot be pickled, they are dropped and
+    the pickling error is recorded as the exception of the node.
+
+    :param lib_path: directory of the node library
+    :param payload: pickled list of (tag, text) and list of (branch key, branch value)
+    :return: pickled list of (tag, text) and list of (branch key, branch value) after evaluation
+    """
+    if lib_path not in sys.path:
+        sys.path.append(lib_path)
+    fields, branch_elements = pickle.loads(payload)
+    tree_element = CompiledTree().add_node(None, dict(fields))
+    tree_element.branch.update(branch_elements)
+    node_instance = _get_node_instance(tree_element)
+    node_instance.evaluate_node()
+    try:
+        return pickle.dumps(_get_element_fields(tree_element))
+    except _PICKLING_ERRORS as inst:
+        node_instance.set_element('node_is_true', node_instance.set_is_true_exception(inst))
+        return pickle.dumps((list(tree_element.fields.items()), []))
+
+
+def _evaluate_in_worker_process(connection, lib_path, payload):
+    """
+    Target of the process of a node with a cancellation token
+
+    :param connection: writable Connection the result is sent to
+    :param lib_path: directory of the node library
+    :param payload: pickled fields and branch elements
+    :return: None
+    """
+    connection.send_bytes(_evaluate_in_worker(lib_path, payload))
+    connection.close()
@@ -0,0 +1,180 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Profile the evaluation of every node without editing the node modules.  The call stacks of
+the evaluating thread are recorded with sys.setprofile; the profiles of all the nodes are
+aggregated into a hot-spot report and a collapsed-stack file for flame-graph tools.
+"""
+
+# Import built in modules
+import collections
+import os
+import sys
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.node_element import get_node_element, has_node_element, set_node_element
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+# Number of functions listed in the hot-spot report
+REPORT_LIMIT = 25
+
+
+class NodeProfileData(object):
+    """
+    Profile of one node evaluation.  All times are in seconds.
+
+    stacks: dict of call stack (tuple of frame labels, the node name first) -> time spent in
+            the innermost frame of the stack
+    calls:  dict of frame label -> number of calls
+    """
+
+    def __init__(self):
+        self.stacks = collections.defaultdict(float)
+        self.calls = collections.Counter()
+
+    @property
+    def total_time(self):
+        return sum(self.stacks.values())
+
+    def __str__(self):
+        return 'total=' + str(self.total_time) + ' functions=' + str(len(self.calls))
+
+
+class _StackRecorder(object):
+    """
+    sys.setprofile callback charging the time between two events to the current call stack
+    """
+
+    def __init__(self, profile_data, node_name):
+        self.profile_data = profile_data
+        self._stack = [(node_name,)]
+        self._last_time = time.perf_counter()
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        self.profile_data.stacks[self._stack[-1]] += now - self._last_time
+        if event == 'call' or event == 'c_call':
+            label = _get_frame_label(frame) if event == 'call' else _get_c_function_label(arg)
+            self._stack.append(self._stack[-1] + (label,))
+            self.profile_data.calls[label] += 1
+        elif len(self._stack) > 1:
+            self._stack.pop()
+        self._last_time = time.perf_counter()
+
+
+def profile_call(tree_element, function):
+    """
+    Call function, e.g. the evaluate_node method of a node instance, with the profiler of the
+    calling thread recording its call stacks, and store the NodeProfileData in the 'profile'
+    element of the tree_element.  Threads started by the function are not profiled.
+
+    :param tree_element: Element object from the ElementTree package or CompiledNode
+    :param function: callable without arguments
+    :return: return value of function
+    """
+    profile_data = NodeProfileData()
+    previous_profiler = sys.getprofile()
+    sys.setprofile(_StackRecorder(profile_data, str(get_node_element(tree_element, 'name'))))
+    try:
+        return function()
+    finally:
+        sys.setprofile(previous_profiler)
+        set_node_element(tree_element, 'profile', profile_data)
+
+
+def _get_frame_label(frame):
+    code = frame.f_code
+    return _get_safe_label(code.co_name + ' (' + os.path.basename(code.co_filename) + ':' +
+                           str(code.co_firstlineno) + ')')
+
+
+def _get_c_function_label(c_function):
+    module = getattr(c_function, '__module__', None)
+    name = getattr(c_function, '__qualname__', None) or repr(c_function)
+    return _get_safe_label('<' + (module + '.' if module else '') + name + '>')
+
+
+def _get_safe_label(label):
+    # ';' separates the frames of a collapsed stack
+    return label.replace(';', ':')
+
+
+def _get_tree_profiles(tree_element):
+    """
+    :param tree_element: Root node instance of the tree_object
+    :return: list of (node name, NodeProfileData) of the profiled nodes
+    """
+    profiles = []
+    for elem in tree_element.iter('node'):
+        if has_node_element(elem, 'profile') and isinstance(get_node_element(elem, 'profile'), NodeProfileData):
+            profiles.append((elem.find('name').text, get_node_element(elem, 'profile')))
+    return profiles
+
+
+def get_profile_report(tree_element, limit=REPORT_LIMIT):
+    """
+    :param tree_element: Root node instance of a tree_object evaluated with profile=True
+    :param limit: number of functions listed
+    :return: string with the profiled time of every node, slowest first, and the functions
+             with the most self time across the run
+    """
+    profiles = _get_tree_profiles(tree_element)
+    if not profiles:
+        return ''
+    self_times = collections.defaultdict(float)
+    cumulative_times = collections.defaultdict(float)
+    calls = collections.Counter()
+    for name, profile_data in profiles:
+        calls.update(profile_data.calls)
+        for stack, seconds in profile_data.stacks.items():
+            if len(stack) > 1:
+                self_times[stack[-1]] += seconds
+            for label in set(stack[1:]):
+                cumulative_times[label] += seconds
+    report = 'Node profile:\n'
+    report += '-------------\n'
+    for name, profile_data in sorted(profiles, key=lambda entry: entry[1].total_time, reverse=True):
+        report += name + ': ' + '{:.6f}s'.format(profile_data.total_time) + '\n'
+    report += '\n'
+    report += 'Hot spots:\n'
+    report += '----------\n'
+    for label in sorted(self_times, key=self_times.get, reverse=True)[:limit]:
+        report += label + ': self ' + '{:.6f}s'.format(self_times[label]) + ', cumulative ' + \
+            '{:.6f}s'.format(cumulative_times[label]) + ', calls ' + str(calls[label]) + '\n'
+    return report
+
+
+def write_collapsed_stacks(tree_element, collapsed_file):
+    """
+    Write the call stacks of all the profiled nodes in the collapsed format read by
+    flame-graph tools: one line per stack, frames separated by ';', followed by the time
+    spent in the stack in microseconds.  Nodes with the same name are merged.
+
+    :param tree_element: Root node instance of a tree_object evaluated with profile=True
+    :param collapsed_file: path of the file to write
+    :return: None
+    """
+    stacks = collections.defaultdict(float)
+    for name, profile_data in _get_tree_profiles(tree_element):
+        for stack, seconds in profile_data.stacks.items():
+            stacks[stack] += seconds
+    with open(collapsed_file, 'w') as collapsed:
+        for stack, seconds in sorted(stacks.items()):
+            microseconds = int(round(seconds * 1000000))
+            if microseconds > 0:
+                collapsed.write(';'.join(stack) + ' ' + str(microseconds) + '\n')
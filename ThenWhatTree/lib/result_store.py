@@ -0,0 +1,286 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Columnar store for the results of many evaluations of one decision tree.  Every node of the
+tree has one array per column, indexed by run id, and outputs and exceptions are kept once
+in a string table.  A saved store is memory mapped when it is loaded.
+"""
+
+# Import built in modules
+import json
+import math
+import mmap
+import os
+from array import array
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree.lib.evaluate import NODE_TIMEOUT
+from ThenWhatTree.lib.exceptions import ReadOnlyResultStore
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+STATUS_NOT_EVALUATED = 0
+STATUS_FALSE = 1
+STATUS_TRUE = 2
+STATUS_EXCEPTION = 3
+STATUS_TIMEOUT = 4
+STATUS_NAMES = {STATUS_NOT_EVALUATED: 'not evaluated', STATUS_FALSE: 'false', STATUS_TRUE: 'true',
+                STATUS_EXCEPTION: 'exception', STATUS_TIMEOUT: 'timeout'}
+
+# column name -> array typecode
+COLUMNS = {'status': 'b', 'index': 'i', 'output': 'i', 'exception': 'i', 'wall_time': 'd', 'cpu_time': 'd'}
+_META_FILE = 'result_store.json'
+
+
+class ResultStore(object):
+    """
+    Results of many evaluations of one decision tree.  Nodes are identified by their position
+    in the tree, in depth-first order, and can be looked up by name.  Runs are numbered in the
+    order they are added.
+
+    columns: column name -> list with one array per node, indexed by run id
+    strings: string table of the outputs and exceptions
+    """
+
+    def __init__(self):
+        self.node_names = []
+        self.run_labels = []
+        self.strings = []
+        self.columns = {}
+        self._string_ids = {}
+        self._node_positions = {}
+        self._directory = None
+        self._mmaps = []
+
+    @property
+    def num_runs(self):
+        return len(self.run_labels)
+
+    def add_run(self, compiled_tree, label=''):
+        """
+        Write the results of an evaluated tree into the store
+
+        :param compiled_tree: evaluated CompiledTree
+        :param label: string identifying the run, e.g. the input it was evaluated for
+        :return: run id
+        """
+        if self._directory is not None:
+            raise ReadOnlyResultStore(self._directory)
+        if not self.node_names:
+            self._set_node_names([node.name for node in compiled_tree.nodes])
+        for position, node in enumerate(compiled_tree.nodes):
+            fields = node.fields
+            self.columns['status'][position].append(_get_status(fields))
+            self.columns['index'][position].append(int(fields.get('index', -1)))
+            if fields.get('node_is_true') == 'true':
+                self.columns['output'][position].append(self._get_string_id(fields.get('output')))
+            else:
+                self.columns['output'][position].append(-1)
+            self.columns['exception'][position].append(self._get_string_id(fields.get('exception')))
+            metrics = fields.get('metrics')
+            if not isinstance(metrics, NodeMetricsData):
+                metrics = NodeMetricsData()
+            self.columns['wall_time'][position].append(_get_float(metrics.wall_time))
+            self.columns['cpu_time'][position].append(_get_float(metrics.cpu_time))
+        self.run_labels.append(str(label))
+        return self.num_runs - 1
+
+    def _set_node_names(self, node_names):
+        self.node_names = node_names
+        self.columns = {column: [array(typecode) for _ in node_names] for column, typecode in COLUMNS.items()}
+        for position, node_name in enumerate(node_names):
+            self._node_positions.setdefault(node_name, []).append(position)
+
+    def _get_string_id(self, text):
+        if text is None:
+            return -1
+        text = str(text)
+        string_id = self._string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self._string_ids[text] = string_id
+        return string_id
+
+    def _get_positions(self, node):
+        """
+        :param node: node name or position of the node in the tree
+        :return: list of positions
+        """
+        if isinstance(node, int):
+            return [node]
+        return self._node_positions.get(node, [])
+
+    ###################################################################################
+    # Queries
+
+    def runs_where(self, node, status=STATUS_TRUE):
+        """
+        :param node: node name or position of the node in the tree
+        :param status: one of the STATUS_* codes
+        :return: sorted list of the run ids where the node had the status
+        """
+        run_ids = set()
+        for position in self._get_positions(node):
+            run_ids.update(run_id for run_id, run_status in enumerate(self.columns['status'][position])
+                           if run_status == status)
+        return sorted(run_ids)
+
+    def runs_where_true(self, node):
+        return self.runs_where(node, STATUS_TRUE)
+
+    def runs_with_exception(self, node):
+        return self.runs_where(node, STATUS_EXCEPTION)
+
+    def runs_with_timeout(self, node):
+        return self.runs_where(node, STATUS_TIMEOUT)
+
+    def count_by_status(self, node):
+        """
+        :param node: node name or position of the node in the tree
+        :return: dict of status name -> number of evaluations with that status
+        """
+        counts = dict.fromkeys(STATUS_NAMES.values(), 0)
+        for position in self._get_positions(node):
+            for run_status in self.columns['status'][position]:
+                counts[STATUS_NAMES[run_status]] += 1
+        return counts
+
+    def get_status(self, run_id, node):
+        return self.columns['status'][self._get_positions(node)[0]][run_id]
+
+    def get_output(self, run_id, node):
+        return self._get_string(self.columns['output'][self._get_positions(node)[0]][run_id])
+
+    def get_exception(self, run_id, node):
+        return self._get_string(self.columns['exception'][self._get_positions(node)[0]][run_id])
+
+    def _get_string(self, string_id):
+        if string_id == -1:
+            return None
+        return self.strings[string_id]
+
+    def summary(self):
+        """
+        :return: one line per node with the number of runs per status and the total wall time
+        """
+        text_summary = ''
+        for position, node_name in enumerate(self.node_names):
+            counts = self.count_by_status(position)
+            wall_time = sum(seconds for seconds in self.columns['wall_time'][position] if not math.isnan(seconds))
+            text_summary += node_name + ': ' + ', '.join([name + ' ' + str(count) for name, count in counts.items()]) + \
+                ', wall {:.6f}s'.format(wall_time) + '\n'
+        return text_summary
+
+    ###################################################################################
+    # Persistence
+
+    def save(self, directory):
+        """
+        Write the store to a directory: one binary file per column, node after node, and a
+        json file with the node names, run labels and string table.  Every file is written to a
+        temporary file that then replaces it, so stores loaded from the directory keep their
+        memory maps of the previous files.
+
+        :param directory: directory path, created if needed
+        :return: None
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for column in COLUMNS:
+            column_path = os.path.join(directory, column + '.bin')
+            with open(column_path + '.tmp', 'wb') as column_file:
+                for node_array in self.columns.get(column, []):
+                    column_file.write(node_array.tobytes() if isinstance(node_array, array) else bytes(node_array))
+            os.replace(column_path + '.tmp', column_path)
+        meta_path = os.path.join(directory, _META_FILE)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump({'node_names': self.node_names, 'run_labels': self.run_labels, 'strings': self.strings,
+                       'columns': COLUMNS}, meta_file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory map a store written by save.  The arrays of the loaded store are read only views
+        of the column files, so only the pages that are queried are read from disk.  Call close,
+        or use the store as a context manager, to release the memory maps.
+
+        :param directory: directory path
+        :return: ResultStore
+        """
+        with open(os.path.join(directory, _META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        result_store = cls()
+        result_store._set_node_names(meta['node_names'])
+        result_store.run_labels = meta['run_labels']
+        result_store.strings = meta['strings']
+        result_store._string_ids = {text: string_id for string_id, text in enumerate(result_store.strings)}
+        result_store._directory = directory
+        num_runs = result_store.num_runs
+        for column, typecode in meta['columns'].items():
+            if num_runs == 0:
+                result_store.columns[column] = [array(typecode) for _ in result_store.node_names]
+                continue
+            with open(os.path.join(directory, column + '.bin'), 'rb') as column_file:
+                column_mmap = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+            result_store._mmaps.append(column_mmap)
+            column_view = memoryview(column_mmap).cast(typecode)
+            result_store.columns[column] = [column_view[position * num_runs:(position + 1) * num_runs]
+                                            for position in range(len(result_store.node_names))]
+        return result_store
+
+    def close(self):
+        """
+        Release the memory maps of a loaded store; its columns cannot be queried afterwards
+
+        :return: None
+        """
+        if not self._mmaps:
+            return
+        for node_arrays in self.columns.values():
+            for node_array in node_arrays:
+                if isinstance(node_array, memoryview):
+                    node_array.release()
+        for column_mmap in self._mmaps:
+            column_mmap.close()
+        self._mmaps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+def _get_status(fields):
+    """
+    :param fields: fields of an evaluated CompiledNode
+    :return: STATUS_* code
+    """
+    if 'exception' in fields:
+        return STATUS_EXCEPTION
+    node_is_true = fields.get('node_is_true')
+    if node_is_true is None:
+        return STATUS_NOT_EVALUATED
+    if node_is_true == NODE_TIMEOUT:
+        return STATUS_TIMEOUT
+    return STATUS_TRUE if node_is_true == 'true' else STATUS_FALSE
+
+
+def _get_float(seconds):
+    return float('nan') if seconds is None else seconds
@@ -6,13 +6,18 @@
 """Base class for all ThenWhatTree nodes"""
 
 # Import built in modules
+import inspect
+import os
 import sys
 import traceback
 
 # Import local modules
-from ThenWhatTree.lib.evaluate import get_node_element
-from ThenWhatTree.lib.evaluate import set_node_element
-from ThenWhatTree.lib.exceptions import BranchElementError, XmlAttributeError
+from ThenWhatTree.lib.compiled_tree import CompiledNode
+from ThenWhatTree.lib.node_element import get_node_element, set_node_element, has_node_element, \
+    get_branch_element, set_branch_element
+from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+from ThenWhatTree.lib.log_scanner import get_log_patterns, scan_log
+from ThenWhatTree.lib.exceptions import BranchElementError, NodeCancelled, XmlAttributeError
 
 # Import 3rd party modules
 
@@ -31,9 +36,32 @@ __status__ = "Production"  # Prototype, Development, Production
 
 class ThenWhatTreeNode(object):
 
+    # Set to 'process' in a subclass to evaluate the node in a worker process (see evaluate())
+    execution_backend = None
+
+    # Regular expressions looked up with get_log_matches.  Every log is scanned once for the
+    # patterns of all the nodes of the tree.
+    log_patterns = ()
+
+    # Set to False in a subclass whose outcome depends on anything but its module, its fields,
+    # its branch elements and the files returned by get_input_files (see OutcomeCache)
+    cache_outcome = True
+
+    # Seconds is_true may run before the node is recorded as 'timeout'; a 'timeout' field in
+    # the XML overrides it
+    timeout = None
+
+    # Optional classmethod is_true_batch(cls, contexts) used by evaluate_many(batch_size=...) to
+    # evaluate the node for many inputs at once, e.g. as a single column comparison.  It gets
+    # the list of instances of the node, one per input, and returns a sequence of bool with one
+    # entry per context, e.g. a NumPy bool array.  Nodes that leave it None are evaluated with
+    # is_true for every input.
+    is_true_batch = None
+
     def __init__(self, tree_element, **kwargs):
         self.tree_element = tree_element
         self.kwargs = kwargs
+        self.cancellation_token = kwargs.get('cancellation_token')
         self._output = ''
 
     ###################################################################################
@@ -44,10 +72,78 @@ class ThenWhatTreeNode(object):
         raise NotImplementedError
 
     def set_branch_element(self, key, value):
-        set_node_element(self.tree_element, 'branch', key, value)
+        set_branch_element(self.tree_element, key, value)
 
     def get_branch_element(self, key):
-        return get_node_element(self.tree_element, 'branch', key)
+        return get_branch_element(self.tree_element, key)
+
+    def get_fact(self, key, compute, *args, **kwargs):
+        """
+        Return the result of compute(*args, **kwargs), computed at most once per evaluation
+        of the tree for every key, no matter how many nodes ask for it.
+
+        :param key: hashable key of the fact, e.g. ('voltage', log_file)
+        :param compute: callable computing the fact
+        :return: fact
+        """
+        if isinstance(self.tree_element, CompiledNode):
+            return self.tree_element.tree.fact_cache.get(key, compute, *args, **kwargs)
+        return compute(*args, **kwargs)
+
+    def get_input_files(self):
+        """
+        Files read by is_true.  Override to let a persistent OutcomeCache reuse the outcome of
+        the node only while these files are unchanged.
+
+        :return: list of file paths
+        """
+        return []
+
+    def is_cancelled(self):
+        """
+        :return: True once the timeout of the node or the deadline of the run expired.  A node
+                 that runs a long loop or polls a tool should check it and give up.
+        """
+        return self.cancellation_token is not None and self.cancellation_token.cancelled
+
+    def check_cancelled(self):
+        """
+        Raise NodeCancelled if the node was cancelled
+
+        :return: None
+        """
+        if self.is_cancelled():
+            raise NodeCancelled(self.__class__.__name__)
+
+    def get_remaining_time(self):
+        """
+        :return: seconds left before the node times out, e.g. to pass as the timeout of a
+                 subprocess, or None if neither the node nor the run has a deadline
+        """
+        if self.cancellation_token is None:
+            return None
+        return self.cancellation_token.get_remaining_time()
+
+    def get_log_matches(self, log_file, pattern):
+        """
+        Return the lines of log_file matching pattern.  The first node to ask for a log scans it
+        for the patterns declared in 'log_patterns' by every node of the tree, so the log is
+        read once per evaluation.  A pattern that was not declared is scanned for on its own.
+
+        :param log_file: path of the log
+        :param pattern: regular expression string, matched within a single line
+        :return: list of LogMatch(line_number, line, groups)
+        """
+        patterns = self.get_fact(('log_patterns',), self._get_tree_log_patterns)
+        if pattern not in patterns:
+            patterns = frozenset([pattern])
+        return self.get_fact(('log_scan', os.path.abspath(log_file), patterns), scan_log, log_file, patterns)[pattern]
+
+    def _get_tree_log_patterns(self):
+        if isinstance(self.tree_element, CompiledNode):
+            node_names = set(node.name for node in self.tree_element.tree.nodes)
+            return get_log_patterns([self.__class__], node_names)
+        return get_log_patterns([self.__class__])
 
     @property
     def output(self):
@@ -69,27 +165,96 @@ class ThenWhatTreeNode(object):
     def set_element(self, key, value):
         set_node_element(self.tree_element, key, value)
 
+    @classmethod
+    def is_async(cls):
+        return inspect.iscoroutinefunction(cls.is_true)
+
+    def get_node_metrics(self):
+        """
+        :return: NodeMetricsData of the node, created if evaluate() did not already add one
+        """
+        if not has_node_element(self.tree_element, 'metrics'):
+            self.set_element('metrics', NodeMetricsData())
+        return self.get_element('metrics')
+
     def evaluate_node(self):
+        metrics = self.get_node_metrics()
+        metrics.start()
         self.evaluate_node_is_true()
         if self.get_element('node_is_true') == 'true':
             self.set_element('output', self.output)
             self.evaluate_user_defined_methods()
+        metrics.stop()
+
+    async def evaluate_node_async(self):
+        metrics = self.get_node_metrics()
+        metrics.start(measure_cpu=False)
+        await self.evaluate_node_is_true_async()
+        if self.get_element('node_is_true') == 'true':
+            self.set_element('output', self.output)
+            self.evaluate_user_defined_methods()
+        metrics.stop()
+
+    @classmethod
+    def has_is_true_batch(cls):
+        return cls.is_true_batch is not None
+
+    @classmethod
+    def evaluate_node_batch(cls, node_instances):
+        """
+        Batch version of evaluate_node.  The metrics of every instance cover the whole batch.
+
+        :param node_instances: list of instances of the node, one per input
+        :return: None
+        """
+        all_metrics = [node_instance.get_node_metrics() for node_instance in node_instances]
+        for metrics in all_metrics:
+            metrics.start()
+        try:
+            results = [str(bool(result)).lower() for result in cls.is_true_batch(node_instances)]
+            if len(results) != len(node_instances):
+                raise ValueError('is_true_batch returned ' + str(len(results)) + ' results for ' +
+                                 str(len(node_instances)) + ' contexts')
+        except Exception as inst:
+            results = [node_instance.set_is_true_exception(inst) for node_instance in node_instances]
+        for node_instance, node_is_true, metrics in zip(node_instances, results, all_metrics):
+            node_instance.set_element('node_is_true', node_is_true)
+            if node_is_true == 'true':
+                node_instance.set_element('output', node_instance.output)
+                node_instance.evaluate_user_defined_methods()
+            metrics.stop()
 
     def evaluate_node_is_true(self):
         try:
             node_is_true = str(self.is_true()).lower()
-        except NotImplementedError:
-            node_is_true = 'false'
+        except Exception as inst:
+            node_is_true = self.set_is_true_exception(inst)
+        self.set_element('node_is_true', node_is_true)
+
+    async def evaluate_node_is_true_async(self):
+        try:
+            node_is_true = str(await self.is_true()).lower()
+        except Exception as inst:
+            node_is_true = self.set_is_true_exception(inst)
+        self.set_element('node_is_true', node_is_true)
+
+    def set_is_true_exception(self, inst):
+        """
+        Record an exception raised by is_true.  Must be called from the 'except' clause so
+        the traceback of the exception being handled is available.
+
+        :param inst: exception raised by is_true
+        :return: 'false', the value of 'node_is_true' for a node that raised
+        """
+        if isinstance(inst, NotImplementedError):
             self.set_element('exception', 'NotImplementedError')
-        except (BranchElementError, XmlAttributeError) as inst:
-            node_is_true = 'false'
+        elif isinstance(inst, (BranchElementError, XmlAttributeError)):
             self.set_element('exception', repr(inst.message))
-        except Exception as inst:
-            node_is_true = 'false'
+        else:
             a, b, tb = sys.exc_info()
             self.set_element('exception', repr(inst))
             self.set_element('traceback', traceback.format_tb(tb))
-        self.set_element('node_is_true', node_is_true)
+        return 'false'
 
     def evaluate_user_defined_methods(self):
         pass
@@ -185,7 +185,7 @@ def _node_does_not_exist(node_path):
 
     try:
         # noinspection PyArgumentList
-        Path(node_path).resolve()
+        Path(node_path).resolve(strict=True)
     except FileNotFoundError:
         return True
     else:
@@ -3,9 +3,13 @@
 # Copyright (C) 2018 Intel Corporation
 # SPDX-License-Identifier: BSD-3-Clause
 
-"""Module description here"""
+"""Timing and resource metrics recorded for every evaluated node"""
 
 # Import built in modules
+import os
+import threading
+import time
+import tracemalloc
 
 # Import 3rd party modules
 
@@ -25,4 +29,61 @@ __status__ = "Production"  # Prototype, Development, Production
 # Code starts here
 
 class NodeMetricsData(object):
-    pass
+    """
+    Metrics of one node evaluation.  All times are in seconds.
+
+    wall_time:        elapsed time of evaluate_node
+    cpu_time:         CPU time of the evaluating thread; None for nodes awaited on an event loop
+    queue_wait_time:  time between submitting the node to the executor and starting it
+    import_time:      time spent importing and resolving the node class; only the first node
+                      evaluated with a module pays for its import
+    allocated_memory: bytes traced by tracemalloc at the end of the node minus the bytes traced
+                      at its start; only recorded while tracemalloc is tracing.  The count is
+                      process wide, so it includes the allocations of the nodes running at the
+                      same time.  The tracemalloc peak of the caller is left untouched.
+    thread_id:        identifier of the evaluating thread
+    process_id:       identifier of the evaluating process
+    """
+
+    def __init__(self, queue_wait_time=0.0, import_time=0.0):
+        self.wall_time = None
+        self.cpu_time = None
+        self.queue_wait_time = queue_wait_time
+        self.import_time = import_time
+        self.allocated_memory = None
+        self.thread_id = None
+        self.process_id = None
+        self._start_times = None
+
+    def start(self, measure_cpu=True):
+        """
+        :param measure_cpu: record the CPU time of the calling thread
+        :return: None
+        """
+        self.thread_id = threading.get_ident()
+        self.process_id = os.getpid()
+        memory_start = None
+        if tracemalloc.is_tracing():
+            memory_start = tracemalloc.get_traced_memory()[0]
+        cpu_start = time.thread_time() if measure_cpu else None
+        self._start_times = (time.perf_counter(), cpu_start, memory_start)
+
+    def stop(self):
+        wall_start, cpu_start, memory_start = self._start_times
+        self.wall_time = time.perf_counter() - wall_start
+        if cpu_start is not None:
+            self.cpu_time = time.thread_time() - cpu_start
+        if memory_start is not None and tracemalloc.is_tracing():
+            self.allocated_memory = tracemalloc.get_traced_memory()[0] - memory_start
+        self._start_times = None
+
+    def as_dict(self):
+        """
+        :return: dict of the metrics
+        """
+        return {'wall_time': self.wall_time, 'cpu_time': self.cpu_time, 'queue_wait_time': self.queue_wait_time,
+                'import_time': self.import_time, 'allocated_memory': self.allocated_memory, 'thread_id': self.thread_id,
+                'process_id': self.process_id}
+
+    def __str__(self):
+        return ' '.join([key + '=' + str(value) for key, value in self.as_dict().items()])
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Benchmark the generation, evaluation and extraction of synthetic decision trees and compare
+the results with a baseline saved by an earlier commit.
+
+Run from the root of the repository:
+    PYTHONPATH=. python ThenWhatTree/tests/benchmarks/run_benchmarks.py --save-baseline baseline.json
+    PYTHONPATH=. python ThenWhatTree/tests/benchmarks/run_benchmarks.py --baseline baseline.json
+"""
+
+# Import built in modules
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Import 3rd party modules
+
+# Import local modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tree_generator import TreeConfig, generate_tree, LATENCY_DISTRIBUTIONS, SLEEP_WORK, CPU_WORK
+from ThenWhatTree import evaluate, extract
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+SCENARIOS = {
+    # framework overhead: 781 nodes without any work
+    'overhead': TreeConfig(depth=4, fan_out=5, true_probability=1.0),
+    # I/O bound nodes, wide tree
+    'wide_sleep': TreeConfig(depth=2, fan_out=16, true_probability=0.8, latency=0.005, distribution='exponential'),
+    # I/O bound nodes, deep tree
+    'deep_sleep': TreeConfig(depth=8, fan_out=2, true_probability=0.8, latency=0.002, distribution='uniform'),
+    # CPU bound nodes
+    'cpu': TreeConfig(depth=3, fan_out=4, true_probability=0.7, latency=0.002, work=CPU_WORK),
+}
+# column name -> True if a larger value is better
+METRICS = {'generate_time': False, 'evaluate_time': False, 'nodes_per_second': True, 'extract_time': False,
+           'peak_memory': False}
+# relative change reported as a regression
+REGRESSION_THRESHOLD = 0.1
+
+
+def parse_args():
+    '''
+    Function to parse the cmdline
+
+    :return: args
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', help='scenario to run; repeat the switch for several (default: all)',
+                        action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('--repeat', help='evaluations per scenario; the fastest one is reported (default: 3)',
+                        type=int, default=3)
+    parser.add_argument('--workers', help='number of worker threads evaluating nodes (default: number of CPUs)',
+                        nargs='?', type=int)
+    parser.add_argument('--pipelined', help='evaluate with pipelined=True', action='store_true')
+    parser.add_argument('--baseline', help='json file of an earlier run to compare with', nargs='?', type=str)
+    parser.add_argument('--save-baseline', help='write the results to this json file', nargs='?', type=str,
+                        dest='save_baseline')
+    parser.add_argument('--depth', help='run a custom scenario with this depth instead', nargs='?', type=int)
+    parser.add_argument('--fan-out', help='fan-out of the custom scenario (default: 3)', type=int, default=3,
+                        dest='fan_out')
+    parser.add_argument('--true-probability', help='probability that a node of the custom scenario is true '
+                                                   '(default: 0.5)', type=float, default=0.5,
+                        dest='true_probability')
+    parser.add_argument('--latency', help='mean seconds of work per node of the custom scenario (default: 0)',
+                        type=float, default=0.0)
+    parser.add_argument('--distribution', help='latency distribution of the custom scenario (default: constant)',
+                        choices=LATENCY_DISTRIBUTIONS, default='constant')
+    parser.add_argument('--work', help='work done by the nodes of the custom scenario (default: sleep)',
+                        choices=[SLEEP_WORK, CPU_WORK], default=SLEEP_WORK)
+    return parser.parse_args()
+
+
+def get_scenarios(args):
+    """
+    :param args: parsed command line
+    :return: dict of scenario name -> TreeConfig
+    """
+    if args.depth is not None:
+        return {'custom': TreeConfig(args.depth, args.fan_out, args.true_probability, args.latency,
+                                     args.distribution, args.work)}
+    names = args.scenario or sorted(SCENARIOS)
+    return {name: SCENARIOS[name] for name in names}
+
+
+def run_scenario(name, config, repeat=3, num_workers=None, pipelined=False):
+    """
+    Generate the tree of the scenario in a temporary directory and measure it
+
+    :param name: scenario name
+    :param config: TreeConfig
+    :param repeat: number of timed evaluations; the fastest is kept
+    :param num_workers: number of worker threads evaluating nodes
+    :param pipelined: evaluate with pipelined=True
+    :return: dict of metric -> value
+    """
+    library = tempfile.mkdtemp()
+    try:
+        xml_file, generate_time = generate_tree(library, config, _get_tree_name(name))
+        evaluate_times = []
+        extract_times = []
+        for _ in range(max(repeat, 1)):
+            start_time = time.perf_counter()
+            tree_object = evaluate(xml_file, num_workers=num_workers, pipelined=pipelined)
+            evaluate_times.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            extract(tree_object.getroot())
+            extract_times.append(time.perf_counter() - start_time)
+        evaluated_nodes = sum(1 for node in tree_object.getroot().iter('node') if node.find('node_is_true') is not None)
+        # tracemalloc slows the evaluation down, so memory is measured in a separate run
+        peak_memory = _measure_peak_memory(
+            lambda: extract(evaluate(xml_file, num_workers=num_workers, pipelined=pipelined).getroot()))
+    finally:
+        shutil.rmtree(library)
+    evaluate_time = min(evaluate_times)
+    return {'num_nodes': config.num_nodes, 'evaluated_nodes': evaluated_nodes, 'generate_time': generate_time,
+            'evaluate_time': evaluate_time, 'nodes_per_second': evaluated_nodes / evaluate_time,
+            'extract_time': min(extract_times), 'peak_memory': peak_memory}
+
+
+def _measure_peak_memory(run):
+    """
+    Peak of the memory traced by tracemalloc while run is called, above the memory traced
+    when it starts.  The node metrics only read the traced memory, so nothing resets the peak
+    during the run.  Tracing started by the caller, e.g. with 'python -X tracemalloc', is left
+    running; its earlier peak then bounds the result from above.
+
+    :param run: callable
+    :return: bytes
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return peak_memory - start_memory
+
+
+def _get_tree_name(scenario_name):
+    # node modules are imported by name, so every scenario needs its own node names
+    return ''.join(part.title() for part in scenario_name.split('_'))
+
+
+def compare_with_baseline(results, baseline):
+    """
+    :param results: dict of scenario name -> {'config': ..., 'results': ...}
+    :param baseline: results loaded from a baseline file
+    :return: report string, one line per metric, regressions marked with '!'
+    """
+    report = 'Comparison with ' + str(baseline.get('commit')) + ':\n'
+    for name, scenario in results.items():
+        baseline_scenario = baseline['scenarios'].get(name)
+        if baseline_scenario is None:
+            report += name + ': not in the baseline\n'
+            continue
+        if baseline_scenario['config'] != scenario['config']:
+            report += name + ': configuration differs from the baseline\n'
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value = scenario['results'][metric]
+            baseline_value = baseline_scenario['results'][metric]
+            if not baseline_value:
+                continue
+            change = (value - baseline_value) / baseline_value
+            regression = -change if higher_is_better else change
+            report += '{}{}.{}: {:.6g} (baseline {:.6g}, {:+.1%})\n'.format(
+                '! ' if regression > REGRESSION_THRESHOLD else '  ', name, metric, value, baseline_value, change)
+    return report
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+
+    os.environ['PYTHONDONTWRITEBYTECODE'] = 'TRUE'
+    args = parse_args()
+    results = {}
+    for name, config in get_scenarios(args).items():
+        scenario_results = run_scenario(name, config, args.repeat, args.workers, args.pipelined)
+        results[name] = {'config': config.as_dict(), 'results': scenario_results}
+        print(name + ': ' + ', '.join(metric + ' ' + '{:.6g}'.format(value)
+                                      for metric, value in scenario_results.items()))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            print(compare_with_baseline(results, json.load(baseline_file)))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({'commit': _get_commit(), 'python': platform.python_version(), 'workers': args.workers,
+                       'pipelined': args.pipelined, 'scenarios': results}, baseline_file, indent=2, sort_keys=True)
@@ -0,0 +1,172 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Generate synthetic decision trees for the benchmarks: a CSV file, the XML converted from it
+and the node library built from the XML, with every node doing a configurable amount of
+sleep or CPU work before returning a predetermined result.
+"""
+
+# Import built in modules
+import csv
+import os
+import random
+import time
+
+# Import 3rd party modules
+
+# Import local modules
+from ThenWhatTree import csv_to_xml, xml_to_tree
+
+# Module authorship metadata
+__author__ = "Erik W Berg"
+__copyright__ = "Copyright 2018, Intel Corporation"
+__credits__ = [""]
+__license__ = "BSD-3-Clause"
+__version__ = "1.0"
+__maintainer__ = "Erik W Berg"
+__email__ = ""
+__status__ = "Production"  # Prototype, Development, Production
+
+# Code starts here
+
+SLEEP_WORK = 'sleep'
+CPU_WORK = 'cpu'
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'exponential')
+TREE_NAME = 'Bench'
+CSV_FIELDS = ['parent', 'name', 'latency', 'work', 'node_true']
+WORK_MODULE = 'synthetic_work'
+
+# Module shared by the generated nodes; the work and the result of every node are fields of the XML
+_WORK_MODULE_TEXT = '''# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+
+
+def synthetic_work(node):
+    latency = float(node.get_element('latency'))
+    if node.get_element('work') == 'cpu':
+        end_time = time.perf_counter() + latency
+        while time.perf_counter() < end_time:
+            pass
+    elif latency > 0:
+        time.sleep(latency)
+    return node.get_element('node_true') == 'True'
+'''
+
+
+class TreeConfig(object):
+    """
+    Shape and work of a synthetic tree.  The root is always true; every other node is true
+    with true_probability.  Latencies are in seconds, drawn per node from the distribution
+    with the given mean.
+    """
+
+    def __init__(self, depth=4, fan_out=3, true_probability=0.5, latency=0.0, distribution='constant',
+                 work=SLEEP_WORK, seed=0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError('distribution must be one of ' + ', '.join(LATENCY_DISTRIBUTIONS))
+        if work not in (SLEEP_WORK, CPU_WORK):
+            raise ValueError('work must be ' + SLEEP_WORK + ' or ' + CPU_WORK)
+        self.depth = depth
+        self.fan_out = fan_out
+        self.true_probability = true_probability
+        self.latency = latency
+        self.distribution = distribution
+        self.work = work
+        self.seed = seed
+
+    @property
+    def num_nodes(self):
+        return sum(self.fan_out ** level for level in range(self.depth + 1))
+
+    def as_dict(self):
+        return {'depth': self.depth, 'fan_out': self.fan_out, 'true_probability': self.true_probability,
+                'latency': self.latency, 'distribution': self.distribution, 'work': self.work, 'seed': self.seed}
+
+
+def generate_tree(directory, config, tree_name=TREE_NAME):
+    """
+    Write the CSV file of the synthetic tree, convert it to XML and build the node library
+    with the ThenWhatTree generators, then give every node module its synthetic work.
+
+    :param directory: directory of the node library, created if needed
+    :param config: TreeConfig
+    :param tree_name: prefix of the node names; node modules are imported by name, so trees
+                      evaluated in the same process need different names
+    :return: path of the XML file and seconds spent in csv_to_xml and xml_to_tree
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    csv_file = os.path.join(directory, tree_name + 'root.csv')
+    xml_file = os.path.join(directory, tree_name + 'root.xml')
+    write_tree_csv(csv_file, config, tree_name)
+    start_time = time.perf_counter()
+    with open(xml_file, 'w') as xml:
+        xml.write(csv_to_xml(csv_file))
+    xml_to_tree(xml_file, directory)
+    generate_time = time.perf_counter() - start_time
+    _add_synthetic_work(directory, tree_name)
+    return xml_file, generate_time
+
+
+def write_tree_csv(csv_file, config, tree_name=TREE_NAME):
+    """
+    :param csv_file: path of the CSV file to write
+    :param config: TreeConfig
+    :param tree_name: prefix of the node names
+    :return: number of nodes
+    """
+    rng = random.Random(config.seed)
+    rows = []
+    level = [tree_name + 'root']
+    rows.append(['', level[0], _get_latency(rng, config), config.work, True])
+    for _ in range(config.depth):
+        next_level = []
+        for parent in level:
+            for _ in range(config.fan_out):
+                name = tree_name + str(len(rows))
+                rows.append([parent, name, _get_latency(rng, config), config.work,
+                             rng.random() < config.true_probability])
+                next_level.append(name)
+        level = next_level
+    with open(csv_file, 'w', newline='') as csv_handle:
+        writer = csv.writer(csv_handle)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(rows)
+    return len(rows)
+
+
+def _get_latency(rng, config):
+    if config.distribution == 'uniform':
+        latency = rng.uniform(0.0, 2 * config.latency)
+    elif config.distribution == 'exponential' and config.latency > 0:
+        latency = rng.expovariate(1.0 / config.latency)
+    else:
+        latency = config.latency
+    return '{:.6f}'.format(latency)
+
+
+def _add_synthetic_work(directory, tree_name):
+    """
+    Replace the generated 'raise NotImplementedError' of every node module with a call to the
+    shared synthetic work
+
+    :param directory: directory of the node library
+    :param tree_name: prefix of the node names
+    :return: None
+    """
+    with open(os.path.join(directory, WORK_MODULE + '.py'), 'w') as work_module:
+        work_module.write(_WORK_MODULE_TEXT)
+    for file_name in os.listdir(directory):
+        if not (file_name.startswith(tree_name) and file_name.endswith('.py')):
+            continue
+        module_file = os.path.join(directory, file_name)
+        with open(module_file) as module:
+            module_text = module.read()
+        module_text = module_text.replace('raise NotImplementedError', 'return ' + WORK_MODULE + '(self)', 1)
+        module_text = module_text.replace('import unittest\n', 'import unittest\nfrom ' + WORK_MODULE +
+                                          ' import ' + WORK_MODULE + '\n', 1)
+        with open(module_file, 'w') as module:
+            module.write(module_text)
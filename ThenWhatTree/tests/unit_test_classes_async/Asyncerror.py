@@ -0,0 +1,28 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Asyncerror(ThenWhatTreeNode):
+
+    async def is_true(self):
+        return 1/0
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Asyncerror()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
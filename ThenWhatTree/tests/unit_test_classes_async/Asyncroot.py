@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import asyncio
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Asyncroot(ThenWhatTreeNode):
+
+    async def is_true(self):
+        await asyncio.sleep(0)
+        self.set_branch_element('branch', 'async')
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Asyncroot()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import asyncio
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Asyncsleep2(ThenWhatTreeNode):
+
+    async def is_true(self):
+        await asyncio.sleep(.2)
+        return False
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Asyncsleep2()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Asyncsync(ThenWhatTreeNode):
+
+    def is_true(self):
+        time.sleep(.2)
+        self.output = 'sync ' + self.get_branch_element('branch')
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Asyncsync()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Factroot(ThenWhatTreeNode):
+
+    def is_true(self):
+        self.set_branch_element('reads', [])
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Factroot()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
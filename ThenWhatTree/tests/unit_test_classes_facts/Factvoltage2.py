@@ -0,0 +1,36 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Factvoltage2(ThenWhatTreeNode):
+
+    @staticmethod
+    def read_voltage(reads):
+        time.sleep(.1)
+        reads.append('voltage')
+        return 1.2
+
+    def is_true(self):
+        voltage = self.get_fact('voltage', self.read_voltage, self.get_branch_element('reads'))
+        return voltage > 1.0
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Factvoltage2()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+from Incroot import EVALUATIONS
+
+
+class Incachild(ThenWhatTreeNode):
+
+    def is_true(self):
+        EVALUATIONS.append('Incachild')
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Incachild()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+from Incroot import EVALUATIONS
+
+
+class Incb(ThenWhatTreeNode):
+
+    def is_true(self):
+        EVALUATIONS.append('Incb')
+        self.output = 'limit is an int: ' + str(isinstance(self.get_branch_element('limit'), int))
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Incb()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
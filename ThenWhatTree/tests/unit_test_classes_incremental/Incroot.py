@@ -0,0 +1,32 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+EVALUATIONS = []
+
+
+class Incroot(ThenWhatTreeNode):
+
+    def is_true(self):
+        EVALUATIONS.append('Incroot')
+        self.set_branch_element('limit', 3)
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Incroot()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Logerror(ThenWhatTreeNode):
+
+    log_patterns = (r'ERROR (\w+)',)
+
+    def is_true(self):
+        matches = self.get_log_matches(self.get_branch_element('log'), self.log_patterns[0])
+        self.output = 'errors: ' + ', '.join(match.groups[0] for match in matches)
+        return len(matches) > 0
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Logerror()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
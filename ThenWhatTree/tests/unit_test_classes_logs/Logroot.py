@@ -0,0 +1,30 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Logroot(ThenWhatTreeNode):
+
+    def is_true(self):
+        self.set_branch_element('log', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.log'))
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Logroot()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Batcheven(ThenWhatTreeNode):
+
+    batch_sizes = []
+
+    @classmethod
+    def is_true_batch(cls, contexts):
+        cls.batch_sizes.append(len(contexts))
+        for context in contexts:
+            context.output = context.get_branch_element('failure') + ' is even'
+        return [context.get_branch_element('input') % 2 == 0 for context in contexts]
+
+    def is_true(self):
+        raise Exception('is_true_batch is used for batches')
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Batcheven()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Objgrandchild(ThenWhatTreeNode):
+
+    def is_true(self):
+        transactions = self.get_branch_element('transactions')
+        failing = self.get_branch_element('failing')
+        self.output = str(failing[0]['id'])
+        return failing[0] is transactions[1]
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Objgrandchild()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
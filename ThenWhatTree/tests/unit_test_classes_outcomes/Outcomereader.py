@@ -0,0 +1,36 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+EVALUATIONS = []
+
+
+class Outcomereader(ThenWhatTreeNode):
+
+    def get_input_files(self):
+        return [self.get_branch_element('data_file')]
+
+    def is_true(self):
+        EVALUATIONS.append(self.get_branch_element('data_file'))
+        with open(self.get_branch_element('data_file')) as data_file:
+            self.output = data_file.read().strip()
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Outcomereader()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import sys
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Prochandle(ThenWhatTreeNode):
+
+    def is_true(self):
+        # an open file handle cannot be pickled for the process backend
+        self.set_branch_element('handle', sys.stdout)
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Prochandle()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
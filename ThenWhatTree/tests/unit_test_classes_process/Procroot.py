@@ -0,0 +1,33 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+
+class Procroot(ThenWhatTreeNode):
+
+    execution_backend = 'process'
+
+    def is_true(self):
+        self.set_branch_element('pid', str(os.getpid()))
+        self.output = str(os.getpid())
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Procroot()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+import unittest
+from ThenWhatTree import ThenWhatTreeNode
+
+CANCELLED = []
+
+
+class Timehang(ThenWhatTreeNode):
+
+    timeout = 0.1
+
+    def is_true(self):
+        while not self.is_cancelled():
+            time.sleep(0.01)
+        self.set_branch_element('late', True)
+        CANCELLED.append(self.get_remaining_time())
+        return True
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    # REQUIRED FOR VASE - DO NOT EDIT THIS METHOD
+    def test_instantiateScript(self):
+        myClass = Timehang()
+
+    # ADD USER UNITTESTS HERE
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,14 @@
+# Copyright (C) 2018 Intel Corporation
+# SPDX-License-Identifier: BSD-3-Clause
+
+from ThenWhatTree import ThenWhatTreeNode
+
+raise RuntimeError('Sbroken is under a false node and must not be imported')
+
+
+class Sbroken(ThenWhatTreeNode):
+
+    log_patterns = (r'^BROKEN',)
+
+    def is_true(self):
+        return True
@@ -6,8 +6,10 @@
 """Module description here"""
 
 import filecmp
+import json
 import os
 import shutil
+import tempfile
 # Import built in modules
 import unittest
 
@@ -15,7 +17,11 @@ import unittest
 from ThenWhatTree.lib import create_tree
 from ThenWhatTree import text_to_xml, csv_to_xml
 from ThenWhatTree.lib import evaluate, extract
-from ThenWhatTree.lib.exceptions import BranchElementError, ElementNameError, ParentNotFoundError, MissingDataEntries, \
+from ThenWhatTree.lib.executor import SerialExecutor, WorkStealingExecutor
+from ThenWhatTree.lib.evaluate_async import evaluate_async
+from ThenWhatTree.lib.evaluate_many import evaluate_many
+from ThenWhatTree.lib.compiled_tree import compile_xml, compile_tree, write_evaluated_tree, get_element_branch_context
+from ThenWhatTree.lib.exceptions import ReadOnlyResultStore, BranchElementError, ElementNameError, ParentNotFoundError, MissingDataEntries, \
     NonAlphaNumericCharacters
 from ThenWhatTree.lib.twt_node.create_node import _standardize_tree_element
 
@@ -62,7 +68,6 @@ class MyTestCase(unittest.TestCase):
     def test_get_tree_annotation(self):
         import time
         start = time.time()
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_tags/Rootnode.xml'
         tree_object = evaluate.evaluate(xml_file)
         tree_annotation = extract._get_tree_annotation(tree_object.getroot())
@@ -102,27 +107,26 @@ class MyTestCase(unittest.TestCase):
 
 
     def test_create_node_elements_from_xml_attrib(self):
-        tree_object = evaluate.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
-        tree_root_element = evaluate.get_tree_root_element(tree_object)
+        tree_object = create_tree.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
+        tree_root_element = create_tree.get_tree_root_element(tree_object)
         self.assertEqual(tree_root_element.attrib, {'name': 'Rootnode_ma', 'register': 'Rootnode_ma_REG'})
-        evaluate._create_node_elements_from_xml_attrib(tree_root_element)
+        tree_root_element = compile_tree(tree_root_element).to_element_tree().getroot()
         self.assertEqual(tree_root_element.attrib, {})
         self.assertEqual(evaluate.get_node_element(tree_root_element, 'register'), 'Rootnode_ma_REG')
         self.assertEqual(evaluate.get_node_element(tree_root_element, 'name'), 'Rootnode_ma')
 
     def test_move_xml_attr_to_node_elements(self):
-        tree_object = evaluate.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
-        tree_root_element = evaluate.get_tree_root_element(tree_object)
+        tree_object = create_tree.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
+        tree_root_element = create_tree.get_tree_root_element(tree_object)
         self.assertEqual(tree_root_element.attrib, {'name': 'Rootnode_ma', 'register': 'Rootnode_ma_REG'})
-        evaluate._move_attributes_to_node_elements(tree_root_element)
+        tree_root_element = compile_tree(tree_root_element).to_element_tree().getroot()
         register_element = tree_root_element.find('register')
         self.assertEqual(register_element.text, 'Rootnode_ma_REG')
         self.assertEqual(tree_root_element.attrib, {})
 
     def test_set_element(self):
-        tree_object = evaluate.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
-        tree_root_element = evaluate.get_tree_root_element(tree_object)
-        evaluate._move_attributes_to_node_elements(tree_root_element)
+        tree_object = create_tree.create_tree_object_from_xml('../unit_test_classes_branch_attrib/Rootnode_ma.xml')
+        tree_root_element = compile_tree(create_tree.get_tree_root_element(tree_object)).to_element_tree().getroot()
         my_element = tree_root_element.find('register')
         self.assertEqual(my_element.text, 'Rootnode_ma_REG')
         # evaluate.set_node_element(tree_root_element, 'something', 'something_text')
@@ -141,7 +145,6 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(tree_output, expected_exceptions)
 
     def test_get_tree_output(self):
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_tags/Rootnode.xml'
         my_tree_object = evaluate.evaluate(xml_file)
         my_tree_output = extract._get_tree_output(my_tree_object.getroot())
@@ -167,7 +170,6 @@ class MyTestCase(unittest.TestCase):
 
 
     def test_make_annotated_tree(self):
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_tags/Rootnode.xml'
         my_tree_object = evaluate.evaluate(xml_file)
         my_tree_output = extract._get_tree_output(my_tree_object.getroot())
@@ -176,7 +178,6 @@ class MyTestCase(unittest.TestCase):
         # tree_output = extract._get_tree_exception_tb(my_tree_object.getroot())
 
     def test_write(self):
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_tags/Rootnode_missing_modules.xml'
         my_tree_object = evaluate.evaluate(xml_file)
         my_tree_object.write('/tmp/ewberg/tmp')
@@ -184,7 +185,6 @@ class MyTestCase(unittest.TestCase):
 
 
     def test_make_annotated_tree_missing_module(self):
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_tags/Rootnode_missing_modules.xml'
         my_tree_object = evaluate.evaluate(xml_file)
         my_tree_output = extract._get_tree_output(my_tree_object.getroot())
@@ -214,13 +214,13 @@ class MyTestCase(unittest.TestCase):
     def test_import_module_for_tree_element(self):
         evaluate._add_node_library_to_path('../unit_test_classes_tags')
         import xml.etree.ElementTree as ET
-        element = ET.Element('node', name="Rootnode")
-        evaluate._create_node_elements_from_xml_attrib(element)
+        element = ET.Element('node')
+        ET.SubElement(element, 'name').text = 'Rootnode'
         evaluate._import_module_for_tree_element(element)
 
         with self.assertRaises(ModuleNotFoundError):
-            element = ET.Element('node', name='RRRootnode')
-            evaluate._create_node_elements_from_xml_attrib(element)
+            element = ET.Element('node')
+            ET.SubElement(element, 'name').text = 'RRRootnode'
             evaluate._import_module_for_tree_element(element)
 
     # def test_evaluate_tree_element(self):
@@ -240,7 +240,6 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(evaluate.get_node_element(element, 'branch', 'time'), 0)
 
     def test_extract_functions(self):
-        evaluate.NUM_TRUE = -1
         xml_file = '../unit_test_classes_branch_attrib/Rootnode_ma.xml'
         missing_attrib_tree_object = evaluate.evaluate(xml_file)
         missing_attrib_tree_text = extract._make_annotated_tree(missing_attrib_tree_object.getroot())
@@ -377,5 +376,742 @@ class MyTestCase(unittest.TestCase):
         with self.assertRaises(NonAlphaNumericCharacters):
             csv_to_xml_module.check_keys_for_bad_characters(my_dict)
 
+    def test_csv_to_xml_name_index(self):
+        # duplicate names resolve to the first node in document order, blank lines are skipped
+        csv_dir = tempfile.mkdtemp()
+        try:
+            csv_file = os.path.join(csv_dir, 'duplicates.csv')
+            with open(csv_file, 'w') as f:
+                f.write('name,parent\nRoot,\nA,Root\nB,A\n\nA,B\nC,A\nD,\n')
+            rootnode = ET.fromstring(csv_to_xml(csv_file))
+            # the second B is added under A, before the first B in document order
+            with open(csv_file, 'w') as f:
+                f.write('name,parent,desc\nRoot,,\nA,Root,\nB,Root,\nB,A,"two\nlines"\nX,B,\n')
+            reordered_rootnode = ET.fromstring(csv_to_xml(csv_file))
+        finally:
+            shutil.rmtree(csv_dir)
+        children = [(elem.find('name').text, [subnode.find('name').text for subnode in elem.findall('node')])
+                    for elem in rootnode.iter('node')]
+        self.assertEqual(children, [('Root', ['A']), ('A', ['B', 'C']), ('B', ['A']), ('A', []), ('C', ['D']),
+                                    ('D', [])])
+        second_b = reordered_rootnode.find('node/node')
+        self.assertEqual(second_b.find('desc').text, 'two\nlines')
+        self.assertEqual(second_b.find('node/name').text, 'X')
+        # a name listed n times as parent needs n nodes, the last one found is the parent
+        self.assertIs(csv_to_xml_module._find_parent(rootnode, 'A,A'), rootnode.find('node/node/node'))
+        with self.assertRaises(ParentNotFoundError) as context:
+            csv_to_xml_module._find_parent(rootnode, 'A,A,A,B')
+        self.assertEqual(context.exception.message, ParentNotFoundError('A').message)
 
+    def test_work_stealing_executor(self):
+        import threading
+        import time
+        with WorkStealingExecutor(4) as executor:
+            futures = [executor.submit(lambda x: (time.sleep(0.01), x * x)[1], x) for x in range(20)]
+            self.assertEqual([future.result() for future in futures], [x * x for x in range(20)])
+            # a worker that submits to its own queue still gets help from the others
+            thread_names = set()
+            def child():
+                time.sleep(0.05)
+                thread_names.add(threading.current_thread().name)
+            def parent():
+                return [executor.submit(child) for _ in range(4)]
+            for future in executor.submit(parent).result():
+                future.result()
+            self.assertGreater(len(thread_names), 1)
+            with self.assertRaises(ZeroDivisionError):
+                executor.submit(lambda: 1 / 0).result()
+
+    def test_default_executor(self):
+        from ThenWhatTree.lib.executor import TreeExecutor, get_default_executor
+        two_workers = get_default_executor(2)
+        self.assertIs(get_default_executor(2), two_workers)
+        # asking for another size leaves the pool of the first size usable
+        self.assertEqual(get_default_executor(3).num_workers, 3)
+        self.assertEqual(two_workers.submit(lambda: 'still running').result(), 'still running')
+        with self.assertRaises(TypeError):
+            TreeExecutor()
+
+    def test_evaluate_with_executor(self):
+        xml_file = '../unit_test_classes_tags/Rootnode.xml'
+        for executor in [SerialExecutor(), WorkStealingExecutor(2)]:
+            my_tree_object = evaluate.evaluate(xml_file, executor=executor)
+            my_tree_output = extract._get_tree_output(my_tree_object.getroot())
+            self.assertEqual(my_tree_output, "[0] Rootnode is true\n[1] Subnode1 is true\n[2] Subnode11 is true\n")
+            executor.shutdown()
+
+    def test_evaluate_pipelined(self):
+        import time
+        xml_file = '../unit_test_classes_pipeline/Piperoot.xml'
+        executor = WorkStealingExecutor(4)
+        self.addCleanup(executor.shutdown)
+        start = time.time()
+        barrier_tree_object = evaluate.evaluate(xml_file, executor=executor)
+        barrier_time = time.time() - start
+        start = time.time()
+        pipelined_tree_object = evaluate.evaluate(xml_file, executor=executor, pipelined=True)
+        pipelined_time = time.time() - start
+        # concurrent evaluations sharing a pool number their nodes independently
+        node_executor = WorkStealingExecutor(2)
+        self.addCleanup(node_executor.shutdown)
+        concurrent_futures = [executor.submit(evaluate.evaluate, xml_file, executor=node_executor,
+                                              pipelined=pipelined) for pipelined in [True, True, False]]
+        concurrent_tree_objects = [future.result() for future in concurrent_futures]
+        expected_output = "[0] Piperoot is true\n[1] Pipeslow is true\n[2] slow\n[3] Pipefast is true\n[4] fast\n"
+        self.assertEqual(extract._get_tree_output(barrier_tree_object.getroot()), expected_output)
+        self.assertEqual(extract._get_tree_output(pipelined_tree_object.getroot()), expected_output)
+        for tree_object in concurrent_tree_objects:
+            self.assertEqual(extract._get_tree_output(tree_object.getroot()), expected_output)
+        self.assertLess(pipelined_time, barrier_time)
+
+    def test_evaluate_async(self):
+        import asyncio
+        import time
+        start = time.time()
+        tree_object = asyncio.run(evaluate_async('../unit_test_classes_async/Asyncroot.xml'))
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(extract._get_tree_output(tree_object.getroot()),
+                         "[0] Asyncroot is true\n[1] async\n[2] sync async\n")
+        self.assertEqual(extract._get_tree_exceptions(tree_object.getroot()),
+                         "Asyncerror: ZeroDivisionError('division by zero')\n")
+        self.assertRegex(extract._get_tree_exception_tb(tree_object.getroot()), 'in evaluate_node_is_true_async')
+
+    def test_evaluate_async_workers(self):
+        import asyncio
+        import threading
+        from ThenWhatTree.lib import executor as executor_module
+        tree_object = asyncio.run(evaluate_async('../unit_test_classes_async/Asyncroot.xml', num_workers=7))
+        self.assertIn(7, executor_module._DEFAULT_EXECUTORS)
+        metrics = dict((subnode.find('name').text, evaluate.get_node_element(subnode, 'metrics'))
+                       for subnode in tree_object.getroot().iter('node'))
+        # async nodes run on the event loop, sync nodes only on the executor
+        self.assertEqual(metrics['Asyncsleep1'].thread_id, threading.get_ident())
+        self.assertIsNone(metrics['Asyncsleep1'].cpu_time)
+        self.assertNotEqual(metrics['Asyncsync'].thread_id, threading.get_ident())
+        self.assertIsNotNone(metrics['Asyncsync'].cpu_time)
+
+    def test_evaluate_process_backend(self):
+        tree_object = evaluate.evaluate('../unit_test_classes_process/Procroot.xml')
+        root = tree_object.getroot()
+        worker_pid = evaluate.get_node_element(root, 'output')
+        self.assertNotEqual(worker_pid, str(os.getpid()))
+        self.assertEqual(extract._get_tree_output(root), "[0] " + worker_pid + "\n[1] " + worker_pid + "\n")
+        self.assertEqual(extract._get_tree_exceptions(root), "Procerror: ZeroDivisionError('division by zero')\n")
+        self.assertRegex(extract._get_tree_exception_tb(root), 'Procerror.py')
+        tree_object = evaluate.evaluate('../unit_test_classes_pipeline/Piperoot.xml', backend=evaluate.PROCESS_BACKEND)
+        expected_output = "[0] Piperoot is true\n[1] Pipeslow is true\n[2] slow\n[3] Pipefast is true\n[4] fast\n"
+        self.assertEqual(extract._get_tree_output(tree_object.getroot()), expected_output)
+
+    def test_process_backend_failures(self):
+        import multiprocessing
+        import time
+        tree_object = evaluate.evaluate('../unit_test_classes_process/Procfailroot.xml')
+        results = dict((subnode.find('name').text, (evaluate.get_node_element(subnode, 'node_is_true'),
+                                                   subnode.findtext('exception')))
+                       for subnode in tree_object.getroot().iter('node'))
+        # branch elements that cannot be pickled, on the way in or out, fail only their node
+        self.assertEqual(results['Prochandle'], ('true', None))
+        self.assertEqual(results['Procpickle'][0], 'false')
+        self.assertIn('cannot pickle', results['Procpickle'][1])
+        self.assertEqual(results['Procleak'][0], 'false')
+        self.assertIn('pickle', results['Procleak'][1])
+        # a hung node with a timeout is terminated instead of holding a worker of the pool
+        self.assertEqual(results['Prochang'][0], 'timeout')
+        for _ in range(50):
+            if not any(process.name.startswith('Process') for process in multiprocessing.active_children()):
+                break
+            time.sleep(0.1)
+        self.assertEqual([process for process in multiprocessing.active_children()
+                          if process.name.startswith('Process')], [])
+
+    def test_node_class_cache(self):
+        import tempfile
+        import time
+        lib_path = tempfile.mkdtemp()
+        module_text = "from ThenWhatTree import ThenWhatTreeNode\n\nclass Cachednode(ThenWhatTreeNode):\n" + \
+                      "    def is_true(self):\n        self.output = '{}'\n        return True\n"
+        with open(os.path.join(lib_path, 'Cachednode.py'), 'w') as f:
+            f.write(module_text.format('first'))
+        with open(os.path.join(lib_path, 'Cachednode.xml'), 'w') as f:
+            f.write('<node name="Cachednode"/>\n')
+        xml_file = os.path.join(lib_path, 'Cachednode.xml')
+        tree_object = evaluate.evaluate(xml_file)
+        self.assertEqual(evaluate.get_node_element(tree_object.getroot(), 'output'), 'first')
+        element = tree_object.getroot()
+        self.assertIs(evaluate._get_node_class(element), evaluate._get_node_class(element))
+        time.sleep(0.01)
+        with open(os.path.join(lib_path, 'Cachednode.py'), 'w') as f:
+            f.write(module_text.format('second changed'))
+        tree_object = evaluate.evaluate(xml_file)
+        self.assertEqual(evaluate.get_node_element(tree_object.getroot(), 'output'), 'second changed')
+        shutil.rmtree(lib_path)
+
+    def test_node_class_lookup_by_module_members(self):
+        evaluate._add_node_library_to_path('../unit_test_classes_tags')
+        element = ET.Element('node')
+        ET.SubElement(element, 'name').text = 'Rootnode_add_branch_attr'
+        self.assertEqual(evaluate._get_node_class(element).__name__, 'Rootnode')
+
+    def test_compile_tree(self):
+        compiled_tree = compile_xml('../unit_test_classes_tags/Rootnode.xml')
+        self.assertEqual([node.name for node in compiled_tree.nodes],
+                         ['Rootnode', 'Subnode1', 'Subnode11', 'Subnode12', 'Subnode13', 'Subnode2', 'Subnode3',
+                          'Subnode31', 'Subnode32'])
+        self.assertEqual([node.name for node in compiled_tree.root.subnodes], ['Subnode1', 'Subnode2', 'Subnode3'])
+        subnode31 = compiled_tree.nodes[7]
+        self.assertEqual(subnode31.fields, {'name': 'Subnode31', 'register': 'SUBNODE31_REG', 'value': '0x1'})
+        self.assertEqual(compiled_tree.nodes[subnode31.parent].name, 'Subnode3')
+        evaluate.set_node_element(subnode31, 'branch', 'key', 'value')
+        evaluate.set_node_element(subnode31, 'index', 3)
+        self.assertEqual(evaluate.get_node_element(subnode31, 'branch', 'key'), 'value')
+        with self.assertRaises(BranchElementError):
+            evaluate.get_node_element(compiled_tree.root, 'branch', 'key')
+        tree_root_element = compiled_tree.to_element_tree().getroot()
+        self.assertEqual([evaluate.get_node_element(node, 'name') for node in tree_root_element.iter('node')],
+                         [node.name for node in compiled_tree.nodes])
+        element = tree_root_element.find('node[3]/node[1]')
+        self.assertEqual(evaluate.get_node_element(element, 'register'), 'SUBNODE31_REG')
+        self.assertEqual(evaluate.get_node_element(element, 'index'), 3)
+        self.assertEqual(evaluate.get_node_element(element, 'branch', 'key'), 'value')
+        self.assertEqual(compile_tree(tree_root_element).nodes[7].branch.values, {'key': 'value'})
+
+    def test_element_index(self):
+        from ThenWhatTree.lib import node_element
+        element = ET.Element('node')
+        node_element.set_node_element(element, 'name', 'Indexed')
+        node_element.set_branch_element(element, 'first', '1')
+        node_element.set_branch_element(element, 'second', '2')
+        node_element.set_branch_element(element, 'first', 'one')
+        self.assertEqual(len(element.findall('branch')), 2)
+        self.assertEqual(node_element.get_branch_element(element, 'first'), 'one')
+        self.assertEqual(node_element.get_branch_elements(element), {'first': 'one', 'second': '2'})
+        self.assertIs(node_element.get_element_index(element), node_element.get_element_index(element))
+        # subelements appended without the accessors are picked up as well
+        element.append(node_element._create_element_with_text('depth', 0))
+        self.assertEqual(node_element.get_node_element(element, 'depth'), 0)
+        self.assertTrue(node_element.has_node_element(element, 'depth'))
+        self.assertFalse(node_element.has_node_element(element, 'output'))
+        with self.assertRaises(BranchElementError):
+            node_element.get_branch_element(element, 'third')
+        subnode = ET.SubElement(element, 'node')
+        node_element.set_branch_elements_in_children(element, subnode)
+        self.assertEqual(evaluate.get_node_element(subnode, 'branch', 'second'), '2')
+        # so are replaced subelements that keep the number of subelements
+        element.remove(subnode)
+        element.append(node_element._create_element_with_text('output', 'replaced'))
+        self.assertEqual(node_element.get_node_element(element, 'output'), 'replaced')
+        element[-1] = node_element._create_element_with_attribute('branch', 'third', '3')
+        self.assertFalse(node_element.has_node_element(element, 'output'))
+        self.assertEqual(node_element.get_branch_element(element, 'third'), '3')
+
+    def test_branch_context_chain(self):
+        from ThenWhatTree.lib.node_element import get_branch_elements
+        xml_file = '../unit_test_classes_tags/Rootnode_add_branch_attr.xml'
+        tree = evaluate.evaluate(xml_file)
+        # only the node that set the branch element stores it
+        self.assertEqual(len(tree.getroot().findall('branch')), 1)
+        self.assertEqual([subnode for subnode in tree.iter('branch')], tree.getroot().findall('branch'))
+        subnode11 = tree.getroot().find('node/node')
+        self.assertEqual(evaluate.get_node_element(subnode11, 'name'), 'Subnode11')
+        self.assertEqual(get_branch_elements(subnode11), {'test': 'value'})
+        evaluate.set_node_element(subnode11, 'branch', 'test', 'override')
+        self.assertEqual(evaluate.get_node_element(subnode11, 'branch', 'test'), 'override')
+        self.assertEqual(evaluate.get_node_element(tree.getroot(), 'branch', 'test'), 'value')
+
+    def test_branch_element_objects(self):
+        tree = evaluate.evaluate('../unit_test_classes_objects/Objroot.xml')
+        grandchild = tree.getroot().find('node/node')
+        # the list set by the root node reaches the grandchild by reference
+        self.assertEqual(evaluate.get_node_element(grandchild, 'node_is_true'), 'true')
+        self.assertEqual(evaluate.get_node_element(grandchild, 'output'), '1')
+        transactions = evaluate.get_node_element(grandchild, 'branch', 'transactions')
+        self.assertIs(transactions, evaluate.get_node_element(tree.getroot(), 'branch', 'transactions'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xml_file = os.path.join(tmp_dir, 'Objroot.xml')
+            write_evaluated_tree(tree, xml_file, branch_serializer=json.dumps)
+            written_root = ET.parse(xml_file).getroot()
+        self.assertEqual(json.loads(written_root.find('branch').get('transactions')), transactions)
+        self.assertTrue(written_root.find('index').text.isdigit())
+        self.assertIs(evaluate.get_node_element(tree.getroot(), 'branch', 'transactions'), transactions)
+
+    def test_node_metrics(self):
+        from ThenWhatTree.lib.twt_node.node_metrics_data import NodeMetricsData
+        tree_object = evaluate.evaluate('../unit_test_classes_pipeline/Piperoot.xml', executor=SerialExecutor())
+        pipeslow = tree_object.getroot().find('node')
+        metrics = evaluate.get_node_element(pipeslow, 'metrics')
+        self.assertIsInstance(metrics, NodeMetricsData)
+        self.assertGreaterEqual(metrics.wall_time, 0.2)
+        self.assertLess(metrics.cpu_time, metrics.wall_time)
+        self.assertGreaterEqual(metrics.queue_wait_time, 0.0)
+        self.assertEqual(metrics.process_id, os.getpid())
+        self.assertIsNone(metrics.allocated_memory)
+        # the peak measured by the caller survives the evaluation
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            large_buffer = bytearray(50 * 1024 * 1024)
+            del large_buffer
+            peak_before = tracemalloc.get_traced_memory()[1]
+            traced_tree = evaluate.evaluate('../unit_test_classes_pipeline/Piperoot.xml', executor=SerialExecutor())
+            self.assertGreaterEqual(tracemalloc.get_traced_memory()[1], peak_before)
+        finally:
+            tracemalloc.stop()
+        self.assertIsInstance(evaluate.get_node_element(traced_tree.getroot(), 'metrics').allocated_memory, int)
+        tree_metrics = extract._get_tree_metrics(tree_object.getroot())
+        # the three nodes sleeping 0.2s come before the two fast ones
+        self.assertEqual(sorted(line.split(':')[0] for line in tree_metrics.splitlines()[:3]),
+                         ['Pipefast1', 'Pipeslow', 'Pipeslow1'])
+        self.assertIn('Total: 5 nodes, wall ', tree_metrics)
+        self.assertNotIn('Node metrics:', extract.extract(tree_object.getroot()))
+        self.assertIn('Node metrics:', extract.extract(tree_object.getroot(), metrics=True))
+        # the import of a node module is charged to the first node that needs it
+        import sys
+        evaluate.clear_node_class_cache()
+        sys.modules.pop('Sroot', None)
+        first_metrics = evaluate.get_node_element(
+            evaluate.evaluate('../unit_test_classes_unreachable/Sroot.xml').getroot(), 'metrics')
+        second_metrics = evaluate.get_node_element(
+            evaluate.evaluate('../unit_test_classes_unreachable/Sroot.xml').getroot(), 'metrics')
+        self.assertGreater(first_metrics.import_time, second_metrics.import_time)
+
+    def test_evaluate_many(self):
+        xml_file = '../unit_test_classes_many/Manyroot.xml'
+        executor = WorkStealingExecutor(4)
+        results = list(evaluate_many(xml_file, range(20), executor=executor, max_pending=3))
+        executor.shutdown()
+        self.assertEqual([each_input for each_input, tree_object in results], list(range(20)))
+        self.assertEqual(extract._get_tree_output(results[4][1].getroot()),
+                         "[0] Manyroot is true\n[1] test_4 is even\n")
+        self.assertEqual(extract._get_tree_output(results[7][1].getroot()),
+                         "[0] Manyroot is true\n[1] test_7 is odd\n")
+        dict_results = list(evaluate_many(xml_file, [{'input': 3}], executor=SerialExecutor()))
+        self.assertEqual(extract._get_tree_output(dict_results[0][1].getroot()),
+                         "[0] Manyroot is true\n[1] test_3 is odd\n")
+
+    def test_evaluate_many_batch(self):
+        import sys
+        xml_file = '../unit_test_classes_many/Batchroot.xml'
+        with WorkStealingExecutor(2) as executor:
+            results = list(evaluate_many(xml_file, range(20), executor=executor, batch_size=8))
+        self.assertEqual(sorted(sys.modules['Batcheven'].Batcheven.batch_sizes), [4, 8, 8])
+        self.assertEqual([each_input for each_input, tree_object in results], list(range(20)))
+        self.assertEqual(extract._get_tree_output(results[12][1].getroot()),
+                         "[0] Manyroot is true\n[1] test_12 is even\n")
+        self.assertEqual(extract._get_tree_output(results[13][1].getroot()),
+                         "[0] Manyroot is true\n[1] test_13 is odd\n")
+
+    def test_evaluate_many_batch_bookkeeping(self):
+        import sys
+        from ThenWhatTree.lib.outcome_cache import OutcomeCache
+        xml_file = '../unit_test_classes_many/Batchroot.xml'
+        list(evaluate_many(xml_file, range(2), executor=SerialExecutor()))
+        batcheven = sys.modules['Batcheven'].Batcheven
+
+        class Unfinished(batcheven):
+            @classmethod
+            def is_true_batch(cls, contexts):
+                raise NotImplementedError('not ready')
+
+        from ThenWhatTree import ThenWhatTreeNode
+        self.assertFalse(ThenWhatTreeNode.has_is_true_batch())
+        self.assertTrue(Unfinished.has_is_true_batch())
+        batch_nodes = [compile_xml(xml_file).nodes[1] for each_input in range(2)]
+        Unfinished.evaluate_node_batch([Unfinished(batch_node) for batch_node in batch_nodes])
+        for batch_node in batch_nodes:
+            self.assertEqual(evaluate.get_node_element(batch_node, 'node_is_true'), 'false')
+            self.assertEqual(evaluate.get_node_element(batch_node, 'exception'), 'NotImplementedError')
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            outcome_cache = OutcomeCache(os.path.join(temp_dir, 'outcomes.sqlite'))
+            try:
+                del batcheven.batch_sizes[:]
+                first = list(evaluate_many(xml_file, range(4), executor=SerialExecutor(), batch_size=4,
+                                           outcome_cache=outcome_cache))
+                self.assertEqual(batcheven.batch_sizes, [4])
+                second = list(evaluate_many(xml_file, range(4), executor=SerialExecutor(), batch_size=4,
+                                            outcome_cache=outcome_cache))
+                self.assertEqual(batcheven.batch_sizes, [4])
+            finally:
+                outcome_cache.close()
+            self.assertEqual([extract._get_tree_output(tree_object.getroot()) for each_input, tree_object in first],
+                             [extract._get_tree_output(tree_object.getroot()) for each_input, tree_object in second])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_result_store(self):
+        from ThenWhatTree.lib.result_store import ResultStore, STATUS_FALSE, STATUS_NOT_EVALUATED
+        xml_file = '../unit_test_classes_many/Manyroot.xml'
+        result_store = ResultStore()
+        with WorkStealingExecutor(2) as executor:
+            results = list(evaluate_many(xml_file, range(10), executor=executor, result_store=result_store))
+        self.assertEqual(results, [(run_id, run_id) for run_id in range(10)])
+        self.assertEqual(result_store.runs_where_true('Manyeven'), [0, 2, 4, 6, 8])
+        self.assertEqual(result_store.runs_where('Manyeven', STATUS_FALSE), [1, 3, 5, 7, 9])
+        self.assertEqual(result_store.get_output(4, 'Manyeven'), 'test_4 is even')
+        self.assertIsNone(result_store.get_output(5, 'Manyeven'))
+        self.assertEqual(result_store.count_by_status('Manyroot')['true'], 10)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_store.save(tmp_dir)
+            with ResultStore.load(tmp_dir) as loaded_store:
+                self.assertEqual(loaded_store.runs_where_true('Manyodd'), [1, 3, 5, 7, 9])
+                self.assertEqual(loaded_store.get_output(7, 'Manyodd'), 'test_7 is odd')
+                self.assertEqual(loaded_store.run_labels[3], '3')
+                self.assertEqual(loaded_store.summary(), result_store.summary())
+                self.assertRaises(ReadOnlyResultStore, loaded_store.add_run, None)
+                # saving over the loaded files leaves the memory maps of the loaded store intact
+                result_store.add_run(compile_xml(xml_file), 'not evaluated')
+                result_store.save(tmp_dir)
+                self.assertEqual(loaded_store.num_runs, 10)
+                self.assertEqual(loaded_store.runs_where_true('Manyodd'), [1, 3, 5, 7, 9])
+            self.assertRaises(ValueError, loaded_store.runs_where_true, 'Manyodd')
+            with ResultStore.load(tmp_dir) as reloaded_store:
+                self.assertEqual(reloaded_store.num_runs, 11)
+                self.assertEqual(reloaded_store.get_status(10, 'Manyroot'), STATUS_NOT_EVALUATED)
+
+    def test_fact_cache(self):
+        from ThenWhatTree.lib.fact_cache import FactCache
+        executor = WorkStealingExecutor(4)
+        tree_object = evaluate.evaluate('../unit_test_classes_facts/Factroot.xml', executor=executor)
+        executor.shutdown()
+        # four sibling nodes evaluated concurrently read the voltage once
+        self.assertEqual(evaluate.get_node_element(tree_object.getroot(), 'branch', 'reads'), ['voltage'])
+        self.assertEqual([evaluate.get_node_element(subnode, 'node_is_true') for subnode in
+                          tree_object.getroot().findall('node')], ['true'] * 4)
+        fact_cache = FactCache(max_size=2)
+        self.assertEqual(fact_cache.get('a', lambda: 1), 1)
+        self.assertEqual(fact_cache.get('b', lambda: 2), 2)
+        self.assertEqual(fact_cache.get('a', lambda: 10), 1)
+        self.assertEqual(fact_cache.get('c', lambda: 3), 3)
+        # 'b' was the least recently used fact
+        self.assertNotIn('b', fact_cache)
+        self.assertIn('a', fact_cache)
+        self.assertEqual((fact_cache.hits, fact_cache.misses), (1, 3))
+        self.assertRaises(ZeroDivisionError, fact_cache.get, 'd', lambda: 1 / 0)
+        self.assertNotIn('d', fact_cache)
+
+    def test_log_scanner(self):
+        import ThenWhatTree.lib.twt_node.ThenWhatTreeNode as node_module
+        from ThenWhatTree.lib.log_scanner import scan_log
+        scanned_patterns = []
+
+        def counting_scan_log(log_file, patterns):
+            scanned_patterns.append(patterns)
+            return scan_log(log_file, patterns)
+        node_module.scan_log = counting_scan_log
+        try:
+            with WorkStealingExecutor(2) as executor:
+                tree_object = evaluate.evaluate('../unit_test_classes_logs/Logroot.xml', executor=executor)
+        finally:
+            node_module.scan_log = scan_log
+        # one scan of the log for the patterns of both nodes
+        self.assertEqual(scanned_patterns, [frozenset(['^TIMEOUT', r'ERROR (\w+)'])])
+        self.assertEqual(extract._get_tree_output(tree_object.getroot()),
+                         "[0] Logroot is true\n[1] timeout at line 4\n[2] errors: parity, timeout\n")
+        matches = scan_log('../unit_test_classes_logs/run.log', ['cycle (\\d+)', 'missing'])
+        self.assertEqual(matches['missing'], [])
+        self.assertEqual(matches['cycle (\\d+)'][0].line_number, 2)
+        self.assertEqual(matches['cycle (\\d+)'][0].groups, ('10',))
+        # inline global flags and group names shared by several patterns are scanned on their own
+        patterns = ['(?i)error', r'ERROR (?P<kind>\w+)', r'cycle (?P<kind>\d+)', r'(\w+) \1', '^done']
+        matches = scan_log('../unit_test_classes_logs/run.log', patterns)
+        self.assertEqual([match.line_number for match in matches['(?i)error']], [2, 4])
+        self.assertEqual([match.groups for match in matches[r'ERROR (?P<kind>\w+)']],
+                         [('parity',), ('timeout',)])
+        self.assertEqual([match.groups for match in matches[r'cycle (?P<kind>\d+)']], [('10',)])
+        self.assertEqual(matches[r'(\w+) \1'], [])
+        self.assertEqual([match.line_number for match in matches['^done']], [5])
+        # a pattern that does not compile is left out of the patterns shared by the tree
+        from ThenWhatTree.lib.log_scanner import get_log_patterns
+        self.assertEqual(get_log_patterns([], []) | frozenset(['^ok']),
+                         get_log_patterns([type('Badpatterns', (), {'log_patterns': ('^ok', '(unclosed')})]))
+
+    def test_unreachable_modules_not_imported(self):
+        import sys
+        from ThenWhatTree.lib.log_scanner import get_module_log_patterns
+        tree_object = evaluate.evaluate('../unit_test_classes_unreachable/Sroot.xml')
+        self.assertEqual(extract._get_tree_annotation(tree_object.getroot()), "Sroot : false\n")
+        self.assertNotIn('Sbroken', sys.modules)
+        # the declared patterns are read from the source of the module
+        self.assertEqual(get_module_log_patterns('Sbroken'), frozenset(['^BROKEN']))
+        self.assertNotIn('Sbroken', sys.modules)
+
+    def test_outcome_cache(self):
+        import sys
+        from ThenWhatTree.lib.outcome_cache import OutcomeCache
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data_file = os.path.join(temp_dir, 'data.txt')
+            with open(data_file, 'w') as data:
+                data.write('first')
+            cache_file = os.path.join(temp_dir, 'outcomes.sqlite')
+
+            def get_output():
+                outcome_cache = OutcomeCache(cache_file)
+                try:
+                    results = list(evaluate_many('../unit_test_classes_outcomes/Outcomeroot.xml',
+                                                 [{'data_file': data_file}], outcome_cache=outcome_cache))
+                finally:
+                    outcome_cache.close()
+                reader_element = results[0][1].getroot().find('node')
+                return evaluate.get_node_element(reader_element, 'output')
+
+            self.assertEqual(get_output(), 'first')
+            evaluations = sys.modules['Outcomereader'].EVALUATIONS
+            self.assertEqual(len(evaluations), 1)
+            # a new cache on the same file restores the outcome
+            self.assertEqual(get_output(), 'first')
+            self.assertEqual(len(evaluations), 1)
+            # a changed input file is evaluated again
+            with open(data_file, 'w') as data:
+                data.write('second one')
+            self.assertEqual(get_output(), 'second one')
+            self.assertEqual(len(evaluations), 2)
+            outcome_cache = OutcomeCache(cache_file, max_bytes=0)
+            self.assertEqual(len(outcome_cache), 3)
+            # storing an outcome over max_bytes evicts every outcome
+            root_node = compile_xml('../unit_test_classes_outcomes/Outcomeroot.xml').nodes[0]
+            root_node.fields['node_is_true'] = 'true'
+            outcome_cache.store('key', root_node)
+            self.assertEqual(len(outcome_cache), 0)
+            outcome_cache.close()
+            # exception outcomes are stored only when asked for
+            root_node.fields['exception'] = 'NotImplementedError'
+            outcome_cache = OutcomeCache(cache_file)
+            outcome_cache.store('exception_key', root_node)
+            self.assertEqual(len(outcome_cache), 0)
+            outcome_cache.close()
+            outcome_cache = OutcomeCache(cache_file, cache_exceptions=True)
+            outcome_cache.store('exception_key', root_node)
+            outcome_cache.store('exception_key', root_node)
+            self.assertEqual(len(outcome_cache), 1)
+            outcome_cache.close()
+            # the running total is read back from the file and kept across replaced outcomes
+            outcome_cache = OutcomeCache(cache_file, max_bytes=0, cache_exceptions=True)
+            outcome_size = outcome_cache._get_total_bytes()
+            self.assertGreater(outcome_size, 0)
+            outcome_cache.max_bytes = 2 * outcome_size
+            outcome_cache.store('exception_key', root_node)
+            self.assertEqual(len(outcome_cache), 1)
+            # outcomes stored through another connection count against max_bytes
+            other_cache = OutcomeCache(cache_file, cache_exceptions=True)
+            other_cache.store('other_key', root_node)
+            other_cache.close()
+            self.assertEqual(outcome_cache._get_total_bytes(), 2 * outcome_size)
+            outcome_cache.store('third_key', root_node)
+            self.assertEqual(len(outcome_cache), 2)
+            self.assertEqual(outcome_cache._get_total_bytes(), 2 * outcome_size)
+            outcome_cache.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_evaluate_incremental(self):
+        import sys
+        from ThenWhatTree.lib.evaluate_incremental import evaluate_incremental
+        temp_dir = tempfile.mkdtemp()
+        try:
+            lib_dir = os.path.join(temp_dir, 'unit_test_classes_incremental')
+            shutil.copytree('../unit_test_classes_incremental', lib_dir)
+            xml_file = os.path.join(lib_dir, 'Incroot.xml')
+            evaluated_xml_file = os.path.join(temp_dir, 'evaluated.xml')
+
+            def evaluate_again(changed_modules=None):
+                tree_object = evaluate_incremental(xml_file, evaluated_xml_file, changed_modules,
+                                                   executor=SerialExecutor())
+                write_evaluated_tree(tree_object, evaluated_xml_file)
+                evaluations = sys.modules['Incroot'].EVALUATIONS
+                evaluated = list(evaluations)
+                del evaluations[:]
+                return evaluated, extract._get_tree_output(tree_object.getroot())
+
+            expected_output = "[0] Incroot is true\n[1] Inca sees limit 3\n[2] Incachild is true\n" \
+                              "[3] limit is an int: True\n"
+            self.assertEqual(evaluate_again(), (['Incroot', 'Inca', 'Incb', 'Incachild'], expected_output))
+            # nothing changed
+            self.assertEqual(evaluate_again(), ([], expected_output))
+            # the changed node and its ancestors are evaluated, the branch elements are passed by reference
+            self.assertEqual(evaluate_again(['Incb']), (['Incroot', 'Incb'], expected_output))
+            # edited modules are detected by hash
+            with open(os.path.join(lib_dir, 'Incachild.py'), 'a') as module_file:
+                module_file.write('# edited\n')
+            self.assertEqual(evaluate_again(), (['Incroot', 'Inca', 'Incachild'], expected_output))
+            self.assertEqual(evaluate_again(), ([], expected_output))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_node_timeout(self):
+        import sys
+        import time
+        from ThenWhatTree.lib.result_store import ResultStore, STATUS_TIMEOUT
+        executor = WorkStealingExecutor(3)
+        tree_object = evaluate.evaluate('../unit_test_classes_timeout/Timeroot.xml', executor=executor)
+        statuses = dict((subnode.find('name').text, evaluate.get_node_element(subnode, 'node_is_true'))
+                        for subnode in tree_object.getroot().iter('node') if subnode.find('node_is_true') is not None)
+        # the class timeout and the xml timeout expire, the subnodes of a timed out node are not evaluated
+        self.assertEqual(statuses, {'Timeroot': 'true', 'Timehang': 'timeout', 'Timeslow': 'timeout',
+                                    'Timefast': 'true'})
+        self.assertIn('    Timehang : timeout\n', extract._get_tree_annotation(tree_object.getroot()))
+        self.assertEqual(extract._get_tree_output(tree_object.getroot()),
+                         "[0] Timeroot is true\n[1] remaining time None\n")
+        # the cancelled node sees its token and what it writes afterwards is discarded
+        hang_module = sys.modules['Timehang']
+        for _ in range(100):
+            if hang_module.CANCELLED:
+                break
+            time.sleep(0.01)
+        self.assertEqual(hang_module.CANCELLED, [0.0])
+        self.assertNotIn('late', get_element_branch_context(tree_object.getroot().find('node')))
+        # nodes still running at the run deadline time out, the rest of the tree is not started
+        tree_object = evaluate.evaluate('../unit_test_classes_timeout/Timeroot.xml', executor=executor, deadline=0.05)
+        self.assertEqual(evaluate.get_node_element(tree_object.getroot(), 'node_is_true'), 'true')
+        self.assertEqual([evaluate.get_node_element(subnode, 'node_is_true')
+                          for subnode in tree_object.getroot().findall('node')][:2], ['timeout', 'timeout'])
+        executor.shutdown()
+        result_store = ResultStore()
+        compiled_tree = evaluate._compile_tree_for_evaluation('../unit_test_classes_timeout/Timeroot.xml')
+        compiled_tree.nodes[1].fields['node_is_true'] = 'timeout'
+        run_id = result_store.add_run(compiled_tree)
+        self.assertEqual(result_store.get_status(run_id, 'Timehang'), STATUS_TIMEOUT)
+        self.assertEqual(result_store.runs_with_timeout('Timehang'), [run_id])
+
+    def test_profile(self):
+        from ThenWhatTree.lib.profiler import get_profile_report, write_collapsed_stacks
+        tree_object = evaluate.evaluate('../unit_test_classes_pipeline/Piperoot.xml', executor=SerialExecutor(),
+                                        profile=True)
+        report = get_profile_report(tree_object.getroot())
+        self.assertTrue(report.startswith('Node profile:\n-------------\n'))
+        self.assertEqual(report.count('s\n', 0, report.index('Hot spots:')), 5)
+        # the node modules sleep, so the sleep is the hot spot
+        hot_spots = report.split('Hot spots:\n----------\n')[1]
+        self.assertTrue(hot_spots.startswith('<time.sleep>: self '))
+        temp_dir = tempfile.mkdtemp()
+        try:
+            collapsed_file = os.path.join(temp_dir, 'profile.folded')
+            write_collapsed_stacks(tree_object.getroot(), collapsed_file)
+            with open(collapsed_file) as collapsed:
+                stacks = dict(line.rsplit(' ', 1) for line in collapsed.read().splitlines())
+        finally:
+            shutil.rmtree(temp_dir)
+        sleep_stacks = [stack for stack in stacks if stack.startswith('Pipeslow;') and stack.endswith(';<time.sleep>')]
+        self.assertEqual(len(sleep_stacks), 1)
+        self.assertIn(';is_true (Pipeslow.py:', sleep_stacks[0])
+        self.assertGreater(int(stacks[sleep_stacks[0]]), 50000)
+        # nodes evaluated without the profiler have no profile
+        self.assertEqual(get_profile_report(evaluate.evaluate('../unit_test_classes_pipeline/Piperoot.xml',
+                                                              executor=SerialExecutor()).getroot()), '')
+
+    def test_benchmark_tree_generator(self):
+        from ThenWhatTree.tests.benchmarks.tree_generator import TreeConfig, generate_tree, CPU_WORK
+        config = TreeConfig(depth=2, fan_out=3, true_probability=0.5, latency=0.001, work=CPU_WORK, seed=1)
+        self.assertEqual(config.num_nodes, 13)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            xml_file, generate_time = generate_tree(temp_dir, config, 'Gen')
+            self.assertGreater(generate_time, 0)
+            self.assertEqual(len(ET.parse(xml_file).getroot().findall('.//node')), 12)
+            tree_object = evaluate.evaluate(xml_file, executor=SerialExecutor())
+        finally:
+            shutil.rmtree(temp_dir)
+        # every node returns the 'node_true' field written by the generator
+        nodes = list(tree_object.getroot().iter('node'))
+        self.assertEqual(len(nodes), 13)
+        for node in nodes:
+            if node.find('node_is_true') is not None:
+                self.assertEqual(node.find('node_is_true').text, node.find('node_true').text.lower())
+        self.assertEqual(tree_object.getroot().find('node_is_true').text, 'true')
+
+    def test_write_extract(self):
+        import io
+        tree_object = evaluate.evaluate('../unit_test_classes_tags/Rootnode.xml', executor=SerialExecutor())
+        root = tree_object.getroot()
+        expected_text = extract._get_tree_annotation(root) + '\nNode output:\n------------\n' + \
+            extract._get_tree_output(root) + '\nExceptions:\n-----------\n' + extract._get_tree_exceptions(root) + \
+            '\nException traceback:\n--------------------\n' + extract._get_tree_exception_tb(root)
+        self.assertEqual(extract.extract(root), expected_text)
+        # the annotated tree is generated while the nodes are visited
+        self.assertEqual(next(extract.iter_extract(root)), '[0] Rootnode : true\n')
+        output_file = io.StringIO()
+        extract.write_extract(root, output_file)
+        self.assertEqual(output_file.getvalue(), expected_text)
+
+    def test_extract_does_not_modify_tree(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from ThenWhatTree.lib import node_element
+        tree_object = evaluate.evaluate('../unit_test_classes_tags/Rootnode.xml', executor=SerialExecutor())
+        root = tree_object.getroot()
+        xml_text = ET.tostring(root)
+        num_indexes = len(node_element._ELEMENT_INDEXES)
+        text = extract.extract(root)
+        self.assertEqual(extract.extract(root), text)
+        self.assertEqual(extract._make_annotated_tree(root), extract._make_annotated_tree(root))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            texts = list(executor.map(lambda _: extract.extract(root), range(16)))
+        self.assertEqual(texts, [text] * 16)
+        self.assertEqual(ET.tostring(root), xml_text)
+        self.assertEqual(root.findall('.//depth'), [])
+        self.assertEqual(len(node_element._ELEMENT_INDEXES), num_indexes)
+
+    def test_node_records(self):
+        import io
+        from ThenWhatTree.lib.node_records import NdjsonWriter, iter_node_records, write_json
+        records = []
+        tree_object = evaluate.evaluate('../unit_test_classes_tags/Rootnode.xml', on_node_evaluated=records.append)
+        # the root is evaluated before its subnodes are submitted
+        self.assertEqual(records[0]['path'], 'Rootnode')
+        # hint indexes do not exist yet while the tree is evaluated
+        self.assertFalse(any('index' in record for record in records))
+        self.assertEqual(sorted(record['path'] for record in records),
+                         ['Rootnode', 'Rootnode/Subnode1', 'Rootnode/Subnode1/Subnode11', 'Rootnode/Subnode1/Subnode12',
+                          'Rootnode/Subnode1/Subnode13', 'Rootnode/Subnode2', 'Rootnode/Subnode3'])
+        records_by_path = {record['path']: record for record in records}
+        self.assertEqual(records_by_path['Rootnode/Subnode1/Subnode11']['output'], 'Subnode11 is true')
+        self.assertEqual(records_by_path['Rootnode/Subnode2']['node_is_true'], 'false')
+        self.assertEqual(records_by_path['Rootnode/Subnode3']['exception'], 'NotImplementedError')
+        self.assertGreater(records_by_path['Rootnode']['wall_time'], 0)
+        # the records of the evaluated tree are in depth-first order with the hint indexes
+        json_file = io.StringIO()
+        write_json(tree_object.getroot(), json_file)
+        json_records = json.loads(json_file.getvalue())
+        self.assertEqual([record['path'] for record in json_records],
+                         [record['path'] for record in iter_node_records(tree_object.getroot())])
+        self.assertEqual([(record['name'], record['index']) for record in json_records if record['index'] is not None],
+                         [('Rootnode', 0), ('Subnode1', 1), ('Subnode11', 2)])
+        ndjson_file = io.StringIO()
+        ndjson_writer = NdjsonWriter(ndjson_file)
+        for record in json_records:
+            ndjson_writer(record)
+        self.assertEqual([json.loads(line) for line in ndjson_file.getvalue().splitlines()], json_records)
+        self.assertEqual(ndjson_writer.count, 7)
 
+    def test_binary_tree(self):
+        from ThenWhatTree.lib.binary_tree import read_binary_tree, STATUS_TRUE, STATUS_FALSE, STATUS_NOT_EVALUATED
+        from ThenWhatTree.lib.create_tree import create_tree_object_from_binary, write_tree_object_to_binary
+        from ThenWhatTree.lib.exceptions import BinaryTreeFormatError
+        tree_object = evaluate.evaluate('../unit_test_classes_tags/Rootnode.xml', executor=SerialExecutor())
+        temp_dir = tempfile.mkdtemp()
+        try:
+            binary_file = os.path.join(temp_dir, 'Rootnode.twtb')
+            write_tree_object_to_binary(tree_object, binary_file)
+            self.assertEqual(extract.extract(create_tree_object_from_binary(binary_file).getroot()),
+                             extract.extract(tree_object.getroot()))
+            with read_binary_tree(binary_file) as binary_tree:
+                # Subnode31 and Subnode32 are not evaluated since Subnode3 raises an exception
+                self.assertEqual(len(binary_tree), 9)
+                names = [binary_tree.get_name(position) for position in range(len(binary_tree))]
+                self.assertEqual(names, ['Rootnode', 'Subnode1', 'Subnode11', 'Subnode12', 'Subnode13', 'Subnode2',
+                                         'Subnode3', 'Subnode31', 'Subnode32'])
+                self.assertEqual(list(binary_tree.parents), [-1, 0, 1, 1, 1, 0, 0, 6, 6])
+                self.assertEqual(list(binary_tree.statuses), [STATUS_TRUE] * 3 + [STATUS_FALSE] * 4 +
+                                 [STATUS_NOT_EVALUATED] * 2)
+                self.assertEqual(list(binary_tree.indexes), [0, 1, 2, -1, -1, -1, -1, -1, -1])
+                self.assertEqual(binary_tree.get_output(2), 'Subnode11 is true')
+                self.assertIsNone(binary_tree.get_output(5))
+                self.assertEqual(binary_tree.get_exception(6), 'NotImplementedError')
+                self.assertGreater(binary_tree.get_metrics(0).wall_time, 0)
+            truncated_file = os.path.join(temp_dir, 'truncated.twtb')
+            with open(binary_file, 'rb') as binary, open(truncated_file, 'wb') as truncated:
+                truncated.write(binary.read()[:100])
+            with self.assertRaises(BinaryTreeFormatError):
+                read_binary_tree(truncated_file)
+        finally:
+            shutil.rmtree(temp_dir)
@@ -18,5 +18,5 @@ setup(name='ThenWhatTree',
       ],
       },
       requires=['python_magic', 'pathlib'],
-      python_requires=">=3.6.1",
+      python_requires=">=3.7",
       )